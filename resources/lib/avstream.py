@@ -1,6 +1,9 @@
 """
     module containing classes to maintain stream state
 """
+import random
+import threading
+import time
 import typing
 from enum import IntEnum
 from collections import namedtuple
@@ -11,10 +14,12 @@ import xbmcaddon
 
 from resources.lib.channel import Channel, ChannelList
 from resources.lib.events import Event
+from resources.lib.manifestcache import ManifestCache
 from resources.lib.movies import Instance
 from resources.lib.recording import Recording
 from resources.lib.streaminginfo import StreamingInfo
-from resources.lib.utils import Timer, WebException, ProxyHelper
+from resources.lib.timerwheel import TimerWheel
+from resources.lib.utils import WebException, ProxyHelper
 from resources.lib.webcalls import LoginSession
 
 
@@ -36,7 +41,7 @@ class StreamSession:
         Initializer for StreamSession. It uses LoginSession to create AvStream objects
         @param loginSession: Reference to a LoginSession which is already signed in
         """
-        self.streamList: AVStreamList = AVStreamList()
+        self.registry: AvStreamRegistry = AvStreamRegistry()
         self.loginSession = loginSession
         self.channelList: ChannelList = None
 #        self._reloadchannels()
@@ -47,7 +52,7 @@ class StreamSession:
         if entitlements == {}:
             self.loginSession.refresh_entitlements()
             entitlements = self.loginSession.get_entitlements()
-        self.channelList = ChannelList(channels, entitlements)
+        self.channelList = ChannelList(list(channels), entitlements)  # ChannelList sorts, keep the memo intact
 
     def __get_channel_token(self, channel, suppressHD: bool = False):
         locator, assetType = channel.get_locator(suppressHD)
@@ -95,8 +100,8 @@ class StreamSession:
         if streamInfo is None:
             return None
 
-        stream = AvStream(self.loginSession, streamInfo)
-        self.streamList.add_stream(stream)
+        stream = AvStream(self.loginSession, streamInfo, streamType)
+        self.registry.add_stream(stream)
         return stream
 
     def define_stream(self, streamItem: typing.Union[Channel, Recording, Event, Instance], suppressHD: bool = False):
@@ -109,12 +114,16 @@ class StreamSession:
         @return: the created AvStream object
         """
         if isinstance(streamItem, Channel):
+            streamType = AVStreamType.CHANNEL
             streamInfo = self.__get_channel_token(channel=streamItem, suppressHD=suppressHD)
         elif isinstance(streamItem, Recording):
+            streamType = AVStreamType.RECORDING
             streamInfo = self.loginSession.obtain_recording_streaming_token(streamid=streamItem.id)
         elif isinstance(streamItem, Event):
+            streamType = AVStreamType.EVENT
             streamInfo = self.loginSession.obtain_replay_streaming_token(path=streamItem.id)
         elif isinstance(streamItem, Instance):
+            streamType = AVStreamType.VOD
             streamInfo = self.loginSession.obtain_vod_streaming_token(streamId=streamItem.id)
         else:
             raise ValueError(f'Unsupported streamItem: {type(streamItem)}')
@@ -122,8 +131,8 @@ class StreamSession:
         if streamInfo is None:
             return None
 
-        stream = AvStream(self.loginSession, streamInfo)
-        self.streamList.add_stream(stream)
+        stream = AvStream(self.loginSession, streamInfo, streamType)
+        self.registry.add_stream(stream)
         return stream
 
     def start_stream(self, streamid: str):
@@ -137,14 +146,10 @@ class StreamSession:
     def find_stream(self, streamid):
         """
         Function to locate a stream
-        @param token: the stream-token for the stream on startup
+        @param token: the stream-token for the stream on startup or the latest token of the stream
         @return: stream or none
         """
-        stream: AvStream
-        for stream in self.streamList:
-            if stream.id == streamid:
-                return stream
-        return None
+        return self.registry.find_stream(streamid)
 
     def stop_stream(self, streamid: str):
         """
@@ -155,15 +160,55 @@ class StreamSession:
         stream = self.find_stream(streamid)
         if stream is not None:
 #            stream.stop()
-            self.streamList.stop_stream(stream)
+            self.registry.stop_stream(stream)
             del stream
 
+    def get_statistics(self):
+        """
+        Function to obtain the counters of the manifest caches, segment prefetchers and time-shift buffers
+        of the streams
+        @return: dict with the counters per stream id
+        """
+        statistics = {}
+        stream: AvStream
+        for stream in self.registry:
+            if stream.prefetcher is not None:
+                statistics.setdefault(stream.id, {})['prefetcher'] = stream.prefetcher.statistics()
+            if stream.timeshift is not None:
+                statistics.setdefault(stream.id, {})['timeshift'] = stream.timeshift.statistics()
+            if stream.manifestCache is not None:
+                statistics.setdefault(stream.id, {})['manifest'] = stream.manifestCache.statistics()
+        return statistics
+
+    def get_registry_statistics(self):
+        """
+        Function to obtain the counters of the registry of streams
+        @return: dict with the number of active, defined and stopped streams and the number of reaped streams
+        """
+        return self.registry.statistics()
+
+    def get_scheduler_statistics(self):
+        """
+        Function to obtain the counters of the timer wheel which refreshes the tokens of the streams
+        @return: dict with the number of timers and threads, the timers scheduled and fired and the wakeups
+        """
+        return self.registry.scheduler.statistics()
+
+    def close(self):
+        """
+        Function to stop refreshing the tokens, when the service stops
+        @return:
+        """
+        self.registry.scheduler.close()
+
 
 class AvStream:
     # pylint: disable=too-many-instance-attributes
     """
         Class to hold information for current playing channel or video
     """
+    REFRESH_INTERVAL = 60  # seconds, if the server does not indicate the interval
+    REFRESH_JITTER = 0.1
 
     class AVStreamStatus(IntEnum):
         """
@@ -173,7 +218,7 @@ class AvStream:
         PLAYING = 2
         STOPPED = 3
 
-    def __init__(self, loginsession: LoginSession, tokenInfo: StreamingInfo):
+    def __init__(self, loginsession: LoginSession, tokenInfo: StreamingInfo, streamType: AVStreamType = None):
         xbmc.log('AVSTREAM CREATED {0}'.format(tokenInfo.token), xbmc.LOGDEBUG)
         self.origHostname = None
         self.origPath = None
@@ -185,21 +230,44 @@ class AvStream:
         self.state = self.AVStreamStatus.DEFINED
         self.id = tokenInfo.token
         self.latestToken = tokenInfo.token
-        self.tokenTimer: Timer = None
         self.streamInfo = tokenInfo
-
-    def __del__(self):
-#        xbmc.log('AVSTREAM DELETE {0}'.format(self.id),xbmc.LOGDEBUG)
-        if self.tokenTimer is not None:
-            self.tokenTimer.stop()
+        self.streamType = streamType
+        self.prefetcher = None
+        self.timeshift = None
+        self.manifestCache = ManifestCache()
+        self.registry = None
+        self.lastAccess = time.monotonic()
+
+    def __getstate__(self):
+        # The stream is returned to the UI via pickle, the prefetcher, time-shift buffer, manifest cache and
+        # registry stay in the service
+        state = self.__dict__.copy()
+        state['prefetcher'] = None
+        state['timeshift'] = None
+        state['manifestCache'] = None
+        state['registry'] = None
+        return state
 
     def start(self):
         """
-        Function to start updating the token by using a timer
+        Function to start updating the token by using the timer wheel of the registry
         """
-        self.tokenTimer = Timer(60, self.__update_token)
-        self.tokenTimer.start()
         self.state = self.AVStreamStatus.PLAYING
+        self.__schedule_refresh()
+
+    def __schedule_refresh(self):
+        """
+        Schedule the next refresh of the token, in the interval indicated by the server minus a random part of
+        REFRESH_JITTER, so the refreshes of streams started together do not coincide
+        @return:
+        """
+        registry = self.registry
+        if registry is None:
+            xbmc.log('AVSTREAM {0} not registered, token will not be refreshed'.format(self.id), xbmc.LOGERROR)
+            return
+        interval = self.streamInfo.refreshInterval or self.REFRESH_INTERVAL
+        registry.scheduler.schedule(self.id, interval * (1 - random.uniform(0, self.REFRESH_JITTER)),
+                                    self.__update_token)
 
     def stop(self, timeronly=False):
         """
@@ -208,8 +276,14 @@ class AvStream:
         """
         xbmc.log('AVSTREAM STOP {0}'.format(self.id), xbmc.LOGDEBUG)
         self.state = self.AVStreamStatus.STOPPED
-        if self.tokenTimer is not None:
-            self.tokenTimer.stop()
+        if self.registry is not None:
+            self.registry.scheduler.cancel(self.id)
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        if self.timeshift is not None:
+            self.timeshift.close()
+            self.timeshift = None
         try:
             if timeronly:
                 return
@@ -227,11 +301,16 @@ class AvStream:
         """
         xbmc.log("Refresh token interval expired", xbmc.LOGDEBUG)
         try:
+            previousToken = self.latestToken
             self.latestToken = self.loginsession.update_token(streamingToken=self.latestToken)
+            if self.registry is not None:
+                self.registry.token_updated(self, previousToken)
         except WebException as webExc:
             xbmc.log('Could not update token. {0}'.format(webExc), xbmc.LOGERROR)
             xbmc.log('Response from server: status {0} content: {1}'.format(webExc.status, webExc.response),
                      xbmc.LOGERROR)
+        if self.state == self.AVStreamStatus.PLAYING:
+            self.__schedule_refresh()
 
     @staticmethod
     def __insert_token(url, streamingToken: str):
@@ -335,62 +414,168 @@ class AvStream:
         )
         return self.__insert_token(url, self.latestToken)
 
-    def replace_baseurl(self, url, streamingToken):
+    @property
+    def live(self) -> bool:
         """
-        The url is updated with the name of the redirected host, if a token is still present, it will be
-        removed.
+        Indicates if the stream is a live channel
+        @return:
+        """
+        return self.streamType == AVStreamType.CHANNEL
+
+    @property
+    def cacheable(self) -> bool:
+        """
+        Segments of replay, vod and recording streams do not change and can be cached, those of live channels not
+        @return:
+        """
+        return self.streamType in (AVStreamType.EVENT, AVStreamType.VOD, AVStreamType.RECORDING)
+
+    def upstream_path(self, url):
+        """
+        The path of the segment on the redirected host without the streaming token. It is the same for
+        every session of a stream and is used as key to cache the segment.
         @param url:
-        @param streamingToken:
         @return:
         """
         o = urlparse(url)
-        redir = urlparse(self.baseUrl)
-        actualPath = redir.path
+        actualPath = urlparse(self.baseUrl).path
         s = actualPath.find(',vxttoken=')
         e = actualPath.find('/', s)
         if s > 0 and e > 0:
             actualPath = actualPath[0:s] + actualPath[e:]
-        pathDir = actualPath.rsplit('/', 1)[0]
-        hostAndPath = redir.hostname + pathDir + o.path
+        return actualPath.rsplit('/', 1)[0] + o.path
+
+    def replace_baseurl(self, url, streamingToken):
+        """
+        The url is updated with the name of the redirected host, if a token is still present, it will be
+        removed.
+        @param url:
+        @param streamingToken:
+        @return:
+        """
+        redir = urlparse(self.baseUrl)
+        hostAndPath = redir.netloc + self.upstream_path(url)
         return redir.scheme + '://' + self.__insert_token(hostAndPath, streamingToken)
 
 
-class AVStreamList:
+class AvStreamRegistry:
     """
-    Class to maintain a list of currently playing or stopping streams
+    Registry of the streams of the service, indexed by the id of the stream (the token on startup) and by its
+    latest token, so the stream of a proxied request is found without scanning. Streams which are DEFINED but never
+    started, or STOPPED but not removed, are reaped after they have not been used for idleTimeout seconds.
+    The tokens of all playing streams are refreshed by one timer wheel (scheduler).
     """
+    REAP_INTERVAL = 60
 
-    def __init__(self):
-        self.inx = 0
-        self.streams: typing.List[AvStream] = []
+    def __init__(self, idleTimeout: float = 600, scheduler: TimerWheel = None):
+        self.idleTimeout = idleTimeout
+        self.scheduler = scheduler if scheduler is not None else TimerWheel()
+        self.lock = threading.Lock()
+        self.streams: typing.Dict[str, AvStream] = {}
+        self.tokens: typing.Dict[str, AvStream] = {}
+        self.lastReap = time.monotonic()
+        self.reaped = 0
 
     def __iter__(self):
-        self.inx = 0
-        return self
+        # Iterate over a copy, requests look up streams while an RPC may add or stop one
+        with self.lock:
+            return iter(list(self.streams.values()))
 
-    def __next__(self):
-        if self.inx < len(self.streams):
-            s = self.streams[self.inx]
-            self.inx += 1
-            return s
-        raise StopIteration
+    def __len__(self):
+        return len(self.streams)
 
     def add_stream(self, stream: AvStream):
         """
-        Function to register a stream
+        Function to register a stream. Idle streams are reaped at most every REAP_INTERVAL seconds.
         @param stream: the stream to add (AvStream)
         @return:
         """
-        self.streams.append(stream)
-        xbmc.log('AVSTREAMLIST SIZE is now {0}'.format(len(self.streams)), xbmc.LOGDEBUG)
+        with self.lock:
+            stream.registry = self
+            self.streams[stream.id] = stream
+            self.tokens[stream.latestToken] = stream
+            xbmc.log('AVSTREAMREGISTRY SIZE is now {0}'.format(len(self.streams)), xbmc.LOGDEBUG)
+        self.reap()
+
+    def find_stream(self, token: str) -> typing.Optional[AvStream]:
+        """
+        Function to locate a stream
+        @param token: the id of the stream or its latest token
+        @return: stream or None
+        """
+        stream = self.streams.get(token)
+        if stream is None:
+            stream = self.tokens.get(token)
+        if stream is not None:
+            stream.lastAccess = time.monotonic()
+        return stream
+
+    def token_updated(self, stream: AvStream, previousToken: str):
+        """
+        Function called by the stream when its token is refreshed
+        @param stream: the stream (AvStream)
+        @param previousToken: the token replaced by stream.latestToken
+        @return:
+        """
+        with self.lock:
+            if self.tokens.get(previousToken) is stream:
+                del self.tokens[previousToken]
+            if stream.id in self.streams and stream.latestToken:
+                self.tokens[stream.latestToken] = stream
+
+    def __remove(self, stream: AvStream):
+        if self.streams.get(stream.id) is stream:
+            del self.streams[stream.id]
+        if self.tokens.get(stream.latestToken) is stream:
+            del self.tokens[stream.latestToken]
+        stream.registry = None
 
     def stop_stream(self, stream: AvStream):
         """
-        Function to deregister the stream
+        Function to stop and deregister the stream
         @param stream: the stream to remove (AvStream)
         @return:
         """
         stream.stop()
-        self.streams.remove(stream)
-        xbmc.log('AVSTREAMLIST SIZE is now {0}'.format(len(self.streams)), xbmc.LOGDEBUG)
-        del stream
+        with self.lock:
+            self.__remove(stream)
+            xbmc.log('AVSTREAMREGISTRY SIZE is now {0}'.format(len(self.streams)), xbmc.LOGDEBUG)
+        self.reap()
+
+    def reap(self, force: bool = False) -> int:
+        """
+        Function to remove streams which are DEFINED or STOPPED and have not been used for idleTimeout seconds.
+        The token of a reaped stream which was not stopped is deleted.
+        @param force: reap now, also if the last reap was less than REAP_INTERVAL seconds ago
+        @return: number of streams reaped
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.lastReap < self.REAP_INTERVAL:
+                return 0
+            self.lastReap = now
+            idle = [stream for stream in self.streams.values()
+                    if stream.state != AvStream.AVStreamStatus.PLAYING and now - stream.lastAccess > self.idleTimeout]
+            for stream in idle:
+                self.__remove(stream)
+            self.reaped += len(idle)
+        for stream in idle:
+            xbmc.log('AVSTREAM REAPED {0}'.format(stream.id), xbmc.LOGDEBUG)
+            if stream.state == AvStream.AVStreamStatus.DEFINED:
+                stream.stop()
+        return len(idle)
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the registry
+        @return: dict with the number of active (playing), defined and stopped streams and the number reaped
+        """
+        with self.lock:
+            states = [stream.state for stream in self.streams.values()]
+            return {
+                'active': states.count(AvStream.AVStreamStatus.PLAYING),
+                'defined': states.count(AvStream.AVStreamStatus.DEFINED),
+                'stopped': states.count(AvStream.AVStreamStatus.STOPPED),
+                'reaped': self.reaped,
+                'tokens': len(self.tokens)
+            }
@@ -0,0 +1,103 @@
+"""
+Module with the feed of changes of the data of the service, used by the UI to refetch only what changed
+"""
+import threading
+import typing
+import uuid
+import zlib
+from collections import deque
+
+CHANNELS = 'channels'
+ENTITLEMENTS = 'entitlements'
+EPG = 'epg'
+RECORDINGS = 'recordings'
+TOPICS = frozenset([CHANNELS, ENTITLEMENTS, EPG, RECORDINGS])
+
+
+class ChangeFeed:
+    """
+    Feed of change events. Every event gets the next version, a client asks for the events after the last
+    version it has seen and waits (long-poll) until there is one. When the client is too far behind, or the
+    service was restarted (another feed id), it receives a reset and must refetch everything.
+    """
+    MAX_EVENTS = 500
+    MAX_WAIT = 30  # seconds
+
+    def __init__(self, maxEvents: int = MAX_EVENTS):
+        self.feedId = uuid.uuid4().hex
+        self.condition = threading.Condition()
+        self.events: typing.Deque[dict] = deque(maxlen=maxEvents)
+        self.version = 0
+        self.digests: typing.Dict[tuple, int] = {}
+        self.closed = False
+
+    def publish(self, topic: str, key: str = None) -> int:
+        """
+        Publish a change
+        @param topic: one of TOPICS
+        @param key: the part of the topic that changed, e.g. the start time of an EPG segment, or None
+        @return: the version of the event
+        """
+        with self.condition:
+            self.version += 1
+            self.events.append({'version': self.version, 'topic': topic, 'key': key})
+            self.condition.notify_all()
+            return self.version
+
+    def publish_if_changed(self, topic: str, key: str, content: bytes) -> bool:
+        """
+        Publish a change if the content differs from the content seen before for the topic and key. The
+        first content seen is not a change.
+        @param topic: one of TOPICS
+        @param key: the part of the topic, or None
+        @param content: the content as received
+        @return: True if a change was published
+        """
+        return self.publish_if_digest_changed(topic, key, zlib.crc32(content))
+
+    def publish_if_digest_changed(self, topic: str, key: str, digest: int) -> bool:
+        """
+        Like publish_if_changed, for content of which the crc32 was calculated while it was received
+        @param topic: one of TOPICS
+        @param key: the part of the topic, or None
+        @param digest: zlib.crc32 of the content
+        @return: True if a change was published
+        """
+        with self.condition:
+            previous = self.digests.get((topic, key))
+            self.digests[(topic, key)] = digest
+        if previous is None or previous == digest:
+            return False
+        self.publish(topic, key)
+        return True
+
+    def changes(self, since: int, feedId: str = None, timeout: float = 0) -> dict:
+        """
+        Get the events after a version, wait for one if there are none yet
+        @param since: the last version seen by the client
+        @param feedId: the feed id received by the client before, or None
+        @param timeout: maximum number of seconds to wait
+        @return: dict with the feed id, the current version, the events and whether the client must refetch
+        everything (reset)
+        """
+        timeout = min(max(timeout, 0), self.MAX_WAIT)
+        with self.condition:
+            if feedId != self.feedId or since > self.version:
+                return self.__result(since, reset=True)
+            if since == self.version and timeout > 0:
+                self.condition.wait_for(lambda: self.version > since or self.closed, timeout)
+            oldest = self.events[0]['version'] if self.events else self.version + 1
+            return self.__result(since, reset=since + 1 < oldest)
+
+    def __result(self, since: int, reset: bool) -> dict:
+        events = [] if reset else [event for event in self.events if event['version'] > since]
+        return {'feed': self.feedId, 'version': self.version, 'events': events, 'reset': reset}
+
+    def close(self):
+        """
+        Release the waiting clients, e.g. when the service stops
+        @return:
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
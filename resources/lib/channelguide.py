@@ -96,6 +96,7 @@ class ChannelGuide:
         self.helper = ProxyHelper(self.addon)
         self.windows = []
         self.channels = channels.copy()
+        self.storesEvents = False  # set by load_stored_events, the received entries are kept for store_events
 
     def __current_window(self):
         dtNow = datetime.datetime.now().astimezone(datetime.timezone.utc)
@@ -121,38 +122,46 @@ class ChannelGuide:
         return None
 
     def __process_events(self, window):
-        # from resources.lib.channel import Channel
+        channels = {channel.id: channel for channel in self.channels}
         for channel in window.get_data():
-            currentChannel: Channel = None
-            for c in self.channels:
-                if c.id == channel['channelId']:
-                    currentChannel = c
-                    break
-            if currentChannel is None:
-                xbmc.log('Channel {0} not found'.format(channel['channelId']), xbmc.LOGDEBUG)
-                continue
-            if 'events' in channel:
-                for event in channel['events']:
-                    evt = Event(event)
-                    currentChannel.events.insert_event(evt)
-            else:
-                xbmc.log('No events', xbmc.LOGDEBUG)
+            self.__process_channel_events(channels, channel)
         window.processed = True
 
+    @staticmethod
+    def __process_channel_events(channels: dict, channel):
+        currentChannel: Channel = channels.get(channel['channelId'])
+        if currentChannel is None:
+            xbmc.log('Channel {0} not found'.format(channel['channelId']), xbmc.LOGDEBUG)
+            return
+        if 'events' in channel:
+            for event in channel['events']:
+                evt = Event(event)
+                currentChannel.events.insert_event(evt)
+        else:
+            xbmc.log('No events', xbmc.LOGDEBUG)
+
     def __obtain_events(self, window: GuideWindow):
         """
             Obtain events not yet stored in epg.json and append them
-            to the internal events. Update the channels with the new events
+            to the internal events. Update the channels with the new events.
+            The events of a channel are processed as soon as they are received. The received entries are only
+            kept when the events are stored in epg.json, otherwise only the events of the channels are kept.
 
             @param window:
                 window with startDate for the events
         """
-        response = self.helper.dynamic_call(LoginSession.get_events,
-                                            startTime=window.startDate.strftime('%Y%m%d%H%M%S'))
+        channels = {channel.id: channel for channel in self.channels}
+        entries = [] if self.storesEvents else None
+        for channel in self.helper.dynamic_stream(LoginSession.stream_events,
+                                                  startTime=window.startDate.strftime('%Y%m%d%H%M%S')):
+            self.__process_channel_events(channels, channel)
+            if entries is not None:
+                entries.append(channel)
         self.windows.append(window)
-        window.set_data(response['entries'])
-        self.__append_events(response, window.startDate)
-        self.__process_events(window)
+        window.set_data(entries)
+        if entries is not None:
+            self.__append_events({'entries': entries}, window.startDate)
+        window.processed = True
 
     def obtain_events(self):
         """
@@ -226,6 +235,7 @@ class ChannelGuide:
         @return: nothing
         """
         self.windows = []
+        self.storesEvents = True
         if Path(self.__plugin_path(G.GUIDE_INFO)).exists():
             epgStr = Path(self.__plugin_path(G.GUIDE_INFO)).read_text(encoding='utf-8')
         else:
@@ -262,7 +272,8 @@ class ChannelGuide:
 
     def store_events(self):
         """
-        Stores the events in json format to disk. Can be loaded via load_stored_events()
+        Stores the events in json format to disk. Can be loaded via load_stored_events(), which must be called
+        before the events are obtained
         @return: nothing
         """
         Path(self.__plugin_path(G.GUIDE_INFO)).write_text(json.dumps(self.eventsJson), encoding='utf-8')
@@ -0,0 +1,192 @@
+"""
+Module containing a pool of keep-alive connections to the upstream hosts (CDN) used by the proxy
+"""
+import collections
+import http.client
+import ssl
+import threading
+import time
+import typing
+from http.client import HTTPConnection, HTTPSConnection, HTTPResponse
+from urllib.parse import urlparse
+
+import xbmc
+
+
+class UpstreamConnectionPool:
+    """
+    Pool of keep-alive connections, kept per host (scheme, hostname, port).
+    The ProxyServer relays every video/audio segment to the CDN. Without the pool a new connection
+    (TCP + TLS handshake) would be needed for every segment.
+    The pool is used by the worker threads of the ThreadingHTTPServer, so all access to the idle
+    connections is protected by a lock. Connections are only taken out of the pool by one thread
+    at a time, so the connections itself do not need to be thread-safe.
+    """
+    # pylint: disable=too-many-instance-attributes
+    # Exceptions which indicate that a reused connection was closed by the host while idle
+    STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected,
+                               http.client.BadStatusLine,
+                               ConnectionResetError,
+                               ConnectionAbortedError,
+                               BrokenPipeError)
+
+    def __init__(self, maxSize: int = 4, idleTimeout: float = 30, connectionTimeout: float = 5,
+                 sslContext: ssl.SSLContext = None):
+        """
+        @param maxSize: maximum number of idle connections kept per host, 0 disables reuse
+        @param idleTimeout: seconds after which an idle connection is closed
+        @param connectionTimeout: timeout used for new connections
+        @param sslContext: optional ssl context for https connections
+        """
+        self.maxSize = int(maxSize)
+        self.idleTimeout = idleTimeout
+        self.connectionTimeout = connectionTimeout
+        self.sslContext = sslContext
+        self.lock = threading.Lock()
+        self.idleConnections: typing.Dict[tuple, collections.deque] = {}
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.discarded = 0
+
+    @staticmethod
+    def __key(scheme: str, hostname: str, port: int) -> tuple:
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        return scheme, hostname, port
+
+    def __new_connection(self, key) -> HTTPConnection:
+        scheme, hostname, port = key
+        if scheme == 'https':
+            connection = HTTPSConnection(hostname, port, timeout=self.connectionTimeout, context=self.sslContext)
+        else:
+            connection = HTTPConnection(hostname, port, timeout=self.connectionTimeout)
+        connection.poolKey = key
+        with self.lock:
+            self.created += 1
+        return connection
+
+    def __evict_expired(self, now: float):
+        """
+        Close the connections which are idle for too long. Must be called with the lock held.
+        @param now: current monotonic time
+        @return: list of connections to be closed outside the lock
+        """
+        expired = []
+        for key in list(self.idleConnections):
+            connections = self.idleConnections[key]
+            while connections and now - connections[0][1] > self.idleTimeout:
+                expired.append(connections.popleft()[0])
+            if not connections:
+                del self.idleConnections[key]
+        self.evicted += len(expired)
+        return expired
+
+    def acquire(self, scheme: str, hostname: str, port: int = None) -> typing.Tuple[HTTPConnection, bool]:
+        """
+        Get a connection for the host. An idle connection is reused if available, otherwise a new one
+        is created.
+        @param scheme: 'http'|'https'
+        @param hostname:
+        @param port: optional port, defaults to the port of the scheme
+        @return: tuple of the connection and a flag indicating if it was reused
+        """
+        key = self.__key(scheme, hostname, port)
+        connection = None
+        with self.lock:
+            expired = self.__evict_expired(time.monotonic())
+            connections = self.idleConnections.get(key)
+            if connections:
+                # Use the most recently used connection, it is the least likely to be closed by the host
+                connection = connections.pop()[0]
+                self.reused += 1
+        for expiredConnection in expired:
+            expiredConnection.close()
+        if connection is not None:
+            return connection, True
+        return self.__new_connection(key), False
+
+    def release(self, connection: HTTPConnection, reusable: bool = True):
+        """
+        Return a connection to the pool. The connection may only be returned when the response
+        was read completely.
+        @param connection: the connection obtained via acquire()
+        @param reusable: False if the connection should be closed (error or not read completely)
+        @return:
+        """
+        if not reusable or self.maxSize <= 0 or connection.sock is None:
+            with self.lock:
+                self.discarded += 1
+            connection.close()
+            return
+        toClose = None
+        with self.lock:
+            connections = self.idleConnections.setdefault(connection.poolKey, collections.deque())
+            connections.append((connection, time.monotonic()))
+            if len(connections) > self.maxSize:
+                toClose = connections.popleft()[0]
+                self.evicted += 1
+        if toClose is not None:
+            toClose.close()
+
+    def request(self, method: str, url: str, headers: dict = None) -> typing.Tuple[HTTPConnection, HTTPResponse]:
+        """
+        Send a request to the host via a pooled connection. If a reused connection appears to be
+        closed by the host, the request is retried once on a new connection.
+        The caller must read the response and call release() afterwards.
+        @param method: http method, e.g. 'GET'
+        @param url: full url of the request
+        @param headers: optional headers
+        @return: tuple of the connection and the response
+        """
+        if headers is None:
+            headers = {}
+        parsedUrl = urlparse(url)
+        path = parsedUrl.path
+        if parsedUrl.query:
+            path = path + '?' + parsedUrl.query
+        connection, reused = self.acquire(parsedUrl.scheme, parsedUrl.hostname, parsedUrl.port)
+        try:
+            connection.request(method, path, headers=headers)
+            return connection, connection.getresponse()
+        except self.STALE_CONNECTION_ERRORS as exc:
+            connection.close()
+            if not reused:
+                raise
+            xbmc.log('Pooled connection to {0} closed by host, reconnecting: {1}'.format(parsedUrl.hostname, exc),
+                     xbmc.LOGDEBUG)
+        except Exception:
+            connection.close()
+            raise
+        connection = self.__new_connection(connection.poolKey)
+        try:
+            connection.request(method, path, headers=headers)
+            return connection, connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def close_all(self):
+        """
+        Close all idle connections
+        @return:
+        """
+        with self.lock:
+            connections = [entry[0] for entries in self.idleConnections.values() for entry in entries]
+            self.idleConnections.clear()
+        for connection in connections:
+            connection.close()
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the pool
+        @return: dict with the number of created (handshakes), reused, evicted, discarded and idle connections
+        """
+        with self.lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'discarded': self.discarded,
+                'idle': sum(len(entries) for entries in self.idleConnections.values())
+            }
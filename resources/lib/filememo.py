@@ -0,0 +1,71 @@
+"""
+Module with the memo of the data which LoginSession loads from files in the profile folder
+"""
+import os
+import threading
+import typing
+from pathlib import Path
+
+
+class FileMemo:
+    """
+    Memo of values built from files in the profile folder. A value is kept until the modification time or size
+    of its file changes, or until it is invalidated by the function which writes the file. All callers receive
+    the same object, which must not be modified.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: typing.Dict[str, tuple] = {}  # path -> (stamp, value)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def __stamp(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, path: str, build: typing.Callable[[str], typing.Any]) -> typing.Any:
+        """
+        Get the value built from a file
+        @param path: the full path of the file
+        @param build: function to build the value from the text of the file, called when the file changed
+        @return: the value, or None if the file does not exist
+        """
+        stamp = self.__stamp(path)
+        if stamp is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = build(Path(path).read_text(encoding='utf-8'))
+        with self.lock:
+            self.entries[path] = (stamp, value)
+        return value
+
+    def invalidate(self, path: str = None):
+        """
+        Forget the value of a file, e.g. after it has been written. A file can be rewritten with the same size
+        within the resolution of the modification time.
+        @param path: the full path of the file, or None to forget all values
+        @return:
+        """
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+
+    def statistics(self) -> dict:
+        """
+        Get the number of values kept and the hits and misses
+        @return: dict with the counters
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,187 @@
+"""
+Module containing the store of files in a directory with a limited total size, used by the caches on disk
+"""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+import xbmc
+
+
+class FileStore:
+    """
+    Files in a directory, the total size of the files is limited: when it is exceeded the least recently used
+    files are removed. The file name is the sha256 of the key, a file contains a line with meta data (json)
+    followed by the body. The modification time of a file is kept by the store, it is the time of the last write
+    or touch. An entry has the size of its file and the number of the write which stored it (0 if loaded).
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, directory: str, maxBytes: int):
+        """
+        @param directory: directory for the files, created if it does not exist
+        @param maxBytes: max. total size of the files
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.entries: typing.OrderedDict[str, typing.Tuple[int, int]] = collections.OrderedDict()
+        self.totalBytes = 0
+        self.stored = 0
+        self.evicted = 0
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.__load_index()
+
+    def __load_index(self):
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    os.remove(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = (size, 0)
+            self.totalBytes += size
+        self.__evict()
+
+    @staticmethod
+    def __filename(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def __evict(self):
+        while self.totalBytes > self.maxBytes and self.entries:
+            name, (size, _) = self.entries.popitem(last=False)
+            self.totalBytes -= size
+            self.evicted += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, key: str):
+        with self.lock:
+            return self.__filename(key) in self.entries
+
+    def read(self, key: str) -> typing.Optional[typing.Tuple[dict, bytes, float]]:
+        """
+        Read a file, it becomes the most recently used
+        @param key: the key of the file
+        @return: (meta data, body, modification time) or None if the file is not in the store or cannot be read
+        """
+        name = self.__filename(key)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return None
+            self.entries.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as file:
+                modified = os.fstat(file.fileno()).st_mtime
+                meta = json.loads(file.readline())
+                body = file.read()
+        except FileNotFoundError:
+            # Evicted after the lookup, or the file of the entry is gone
+            xbmc.log('{0} file of {1} removed before it was read'.format(type(self).__name__, key), xbmc.LOGDEBUG)
+            self.__discard(name, entry)
+            return None
+        except (OSError, ValueError) as exc:
+            xbmc.log('{0} could not read {1}: {2}'.format(type(self).__name__, key, exc), xbmc.LOGERROR)
+            self.__discard(name, entry)
+            return None
+        return meta, body, modified
+
+    def __discard(self, name: str, entry: typing.Tuple[int, int]):
+        """
+        Remove an entry which could not be read and its file, unless the file was written again after the entry
+        was looked up
+        """
+        with self.lock:
+            if self.entries.get(name) != entry:
+                return
+            del self.entries[name]
+            self.totalBytes -= entry[0]
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def write(self, key: str, meta: dict, body: bytes) -> bool:
+        """
+        Write a file, replacing the file with the same key. A body larger than the store is not written.
+        @param key: the key of the file
+        @param meta: the meta data, must be serializable to json
+        @param body: the body
+        @return: True if the file was written
+        """
+        if len(body) > self.maxBytes:
+            return False
+        name = self.__filename(key)
+        metaLine = json.dumps(meta).encode('utf-8') + b'\n'
+        tmpPath = None
+        try:
+            # Each writer has its own temporary file, the last one replaces the file of the key
+            fd, tmpPath = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(metaLine)
+                file.write(body)
+            os.replace(tmpPath, os.path.join(self.directory, name))
+        except OSError as exc:
+            xbmc.log('{0} could not write {1}: {2}'.format(type(self).__name__, key, exc), xbmc.LOGERROR)
+            if tmpPath is not None and os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            return False
+        size = len(metaLine) + len(body)
+        with self.lock:
+            self.totalBytes += size - self.entries.pop(name, (0, 0))[0]
+            self.stored += 1
+            self.entries[name] = (size, self.stored)
+            self.__evict()
+        return True
+
+    def touch(self, key: str):
+        """
+        Set the modification time of a file to now
+        @param key: the key of the file
+        @return:
+        """
+        try:
+            os.utime(os.path.join(self.directory, self.__filename(key)))
+        except OSError as exc:
+            xbmc.log('{0} could not touch {1}: {2}'.format(type(self).__name__, key, exc), xbmc.LOGERROR)
+
+    def remove(self, key: str):
+        """
+        Remove a file
+        @param key: the key of the file
+        @return:
+        """
+        name = self.__filename(key)
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is None:
+                return
+            self.totalBytes -= entry[0]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the store
+        @return: dict with the files stored and evicted, the number of files and their total size
+        """
+        with self.lock:
+            return {
+                'stored': self.stored,
+                'evicted': self.evicted,
+                'files': len(self.entries),
+                'totalBytes': self.totalBytes
+            }
@@ -88,6 +88,12 @@ class GlobalVariables:
     RECORDINGS_INFO = 'recordings.json'
     PLAYBACK_INFO = 'playbackstates.json'
     RECENTCHANNELS_INFO = 'recentchannels.json'
+    SEGMENT_CACHE = 'segmentcache'
+    HTTP_CACHE = 'httpcache'
+    TIMESHIFT_BUFFERS = 'timeshift'
+    RPC_SOCKET = 'rpc.sock'
+    TRACE_FILE = 'traces.json'
+    LOCK_PROFILE_FILE = 'locks.json'
 
     SERIES = 'Series'
     MOVIES = 'Movies'
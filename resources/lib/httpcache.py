@@ -0,0 +1,171 @@
+"""
+Module containing the on-disk cache of the responses of the ziggo API which can be revalidated with a conditional
+GET (ETag/Last-Modified)
+"""
+import re
+import time
+import typing
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from resources.lib.filestore import FileStore
+
+# The body of a cached response is stored decoded, these headers do not apply to it
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive',
+                   'set-cookie'}
+
+
+class CachedResponse:
+    """
+    A response read from the cache
+    """
+
+    def __init__(self, headers: dict, body: bytes, validated: float, ttl: int):
+        """
+        @param headers: the headers of the response
+        @param body: the (decoded) body of the response
+        @param validated: time the response was received or last revalidated
+        @param ttl: seconds the response is used without revalidating it
+        """
+        self.headers = CaseInsensitiveDict(headers)  # as sent by the host, e.g. etag
+        self.body = body
+        self.validated = validated
+        self.ttl = ttl
+
+    @property
+    def fresh(self) -> bool:
+        """
+        Whether the response can be used without asking the host
+        @return:
+        """
+        return time.time() - self.validated < self.ttl
+
+    def validators(self) -> dict:
+        """
+        Get the headers for a conditional GET of the response
+        @return: dict with If-None-Match and/or If-Modified-Since, empty if the response has no validators
+        """
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def to_response(self, url: str, request: requests.PreparedRequest = None) -> requests.Response:
+        """
+        Build a requests.Response with status 200 from the cached response
+        @param url: the url of the request
+        @param request: the request sent to revalidate the response, if any
+        @return: the response
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.request = request
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = self.body  # pylint: disable=protected-access
+        response._content_consumed = True  # pylint: disable=protected-access
+        return response
+
+
+class HttpCache(FileStore):
+    """
+    Cache of GET responses in a directory. Only urls matching a policy are cached, the policy gives the
+    number of seconds a response is used without asking the host (ttl). After that the response is revalidated
+    with If-None-Match/If-Modified-Since, a 304 response is served from the cache.
+    The key is the url (with query), the meta data of a file is the url and the headers. The modification time
+    of the file is the time of the last validation.
+    The total size of the files is limited, when it is exceeded the least recently used files are removed.
+    """
+
+    def __init__(self, directory: str, maxBytes: int, policies: typing.List[typing.Tuple[str, int]]):
+        """
+        @param directory: directory for the cache files, created if it does not exist
+        @param maxBytes: max. total size of the files
+        @param policies: list of (regular expression matching the url, ttl in seconds), the first match is used
+        """
+        self.policies = [(re.compile(pattern), ttl) for pattern, ttl in policies]
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        super().__init__(directory, maxBytes)
+
+    def ttl(self, url: str) -> typing.Optional[int]:
+        """
+        Get the ttl of the policy matching a url
+        @param url: the url with query
+        @return: the ttl in seconds, or None if responses of the url are not cached
+        """
+        for pattern, ttl in self.policies:
+            if pattern.match(url):
+                return ttl
+        return None
+
+    def get(self, url: str) -> typing.Optional[CachedResponse]:
+        """
+        Get a response from the cache
+        @param url: the url with query
+        @return: the response or None if not cached
+        """
+        ttl = self.ttl(url)
+        if ttl is None:
+            return None
+        stored = self.read(url)
+        if stored is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        meta, body, validated = stored
+        cached = CachedResponse(meta['headers'], body, validated, ttl)
+        with self.lock:
+            if cached.fresh:
+                self.hits += 1
+        return cached
+
+    def put(self, url: str, response: requests.Response):
+        """
+        Store a response in the cache. Only complete (status 200) responses of urls matching a policy are stored.
+        @param url: the url with query
+        @param response: the response, its content is read
+        @return:
+        """
+        if response.status_code != 200 or self.ttl(url) is None:
+            return
+        self.put_body(url, response.headers, response.content)
+
+    def put_body(self, url: str, headers: typing.Mapping[str, str], body: bytes):
+        """
+        Store the headers and the complete body of a response with status 200, e.g. of a response which was
+        streamed
+        @param url: the url with query
+        @param headers: the headers of the response
+        @param body: the (decoded) body
+        @return:
+        """
+        headers = {key: value for key, value in headers.items() if key.lower() not in SKIPPED_HEADERS}
+        self.write(url, {'url': url, 'headers': headers}, body)
+
+    def validate(self, url: str):
+        """
+        Mark a cached response as validated now, after the host answered 304 Not Modified
+        @param url: the url with query
+        @return:
+        """
+        self.touch(url)
+        with self.lock:
+            self.revalidated += 1
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the cache
+        @return: dict with fresh hits, revalidated (304) responses, misses, stored and evicted responses and the
+            size of the cache
+        """
+        statistics = super().statistics()
+        with self.lock:
+            statistics.update({'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses})
+        return statistics
@@ -0,0 +1,68 @@
+"""
+Module to parse the items of a JSON array while the document is still being received
+"""
+import codecs
+import json
+import re
+import typing
+
+
+def iter_array(chunks: typing.Iterable[bytes], key: str) -> typing.Iterator[typing.Any]:
+    """
+    Get the items of the array of a key in a JSON object, each item as soon as it is complete, e.g. the
+    entries of the EPG in {"entries": [{...}, {...}]}. Only the item being received is kept in memory.
+    The first occurrence of the key is used, the array must not be nested in an array or string before it.
+    @param chunks: the utf-8 encoded document in the pieces in which it is received
+    @param key: the key of the array
+    @return: iterator over the (decoded) items
+    @raise ValueError: if the document has no such array or ends before the array is complete
+    """
+    decoder = json.JSONDecoder()
+    textDecoder = codecs.getincrementaldecoder('utf-8')()
+    start = re.compile(r'"{0}"\s*:\s*\['.format(re.escape(key)))
+    delimiter = re.compile(r'\s*[,\]]')
+    chunks = iter(chunks)
+    buffer = ''
+
+    def more() -> bool:
+        nonlocal buffer
+        for chunk in chunks:
+            text = textDecoder.decode(chunk)
+            if text:
+                buffer += text
+                return True
+        return False
+
+    match = start.search(buffer)
+    while match is None:
+        if not more():
+            raise ValueError('No array "{0}" in document'.format(key))
+        match = start.search(buffer)
+    buffer = buffer[match.end():]
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if not more():
+                raise ValueError('Document ended in array "{0}"'.format(key))
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The item is not complete yet
+            if not more():
+                raise
+            continue
+        # A number is complete when it is followed by the next item or the end of the array, e.g. '-1' may
+        # continue as '-1.5' in the next chunk
+        if not isinstance(item, (dict, list, str)) and delimiter.match(buffer, end) is None:
+            if not more():
+                raise ValueError('Document ended in array "{0}"'.format(key))
+            continue
+        yield item
+        buffer = buffer[end:]
+        position = 0
@@ -12,14 +12,14 @@ import xbmcgui
 import xbmcvfs
 import xbmcaddon
 
-from resources.lib import utils
+from resources.lib import changefeed, utils
 from resources.lib.channel import Channel, ChannelList
 from resources.lib.channelguide import ChannelGuide
 from resources.lib.globals import S, G
 from resources.lib.movies import Movie, Series, Season, Episode, OfferType
 from resources.lib.recording import Recording, RecordingList, RecordingType, SavedStateList, \
     SingleRecording, SeasonRecording, PlannedRecording
-from resources.lib.utils import ProxyHelper, SharedProperties
+from resources.lib.utils import ChangeTracker, ProxyHelper, SharedProperties
 from resources.lib.webcalls import LoginSession
 
 try:
@@ -34,6 +34,7 @@ class ListitemHelper:
     Class holding several methods to create listitems for a specific purpose
     When used for channels, the caller must set the channelList property.
     """
+    EPG_MAX_AGE = 600  # seconds
 
     def __init__(self, addon):
         self.addon: xbmcaddon.Addon = addon
@@ -45,6 +46,9 @@ class ListitemHelper:
         self.channelList: ChannelList = None
         self.savedStateList: SavedStateList = SavedStateList(self.addon)
         self.epg = None
+        self.epgChannelList: ChannelList = None
+        self.epgTime = 0
+        self.epgChanges = ChangeTracker(self.helper, topics=[changefeed.CHANNELS, changefeed.EPG])
 
     @staticmethod
     def __get_pricing_from_offer(instance):
@@ -462,8 +466,15 @@ class ListitemHelper:
         """
         if self.channelList is None:
             return
+        # The events already obtained are kept when the service did not see changes of the channels or the EPG.
+        # The service only sees the changes of the EPG it obtains, so they are obtained again after EPG_MAX_AGE.
+        changes = self.epgChanges.poll()
+        if (self.epg is None or self.epgChannelList is not self.channelList or changes
+                or time.time() - self.epgTime > self.EPG_MAX_AGE):
+            self.epg = ChannelGuide(self.addon, self.channelList.channels)
+            self.epgChannelList = self.channelList
+            self.epgTime = time.time()
         # Obtain events
-        self.epg = ChannelGuide(self.addon, self.channelList.channels)
         self.epg.obtain_events()
 
     def listitem_from_channel(self, channel: Channel) -> xbmcgui.ListItem:
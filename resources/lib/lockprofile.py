@@ -0,0 +1,134 @@
+"""
+Module with the profile of the contention of a lock: how long the acquisitions wait for the lock and how long
+they hold it, per call site
+"""
+import json
+import os
+import sys
+import threading
+import typing
+
+
+class Histogram:
+    """
+    Histogram of durations in buckets of powers of two microseconds, from 1us up to about 67 seconds
+    """
+    BUCKETS = 27
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        """
+        Add a duration
+        @param seconds:
+        @return:
+        """
+        index = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct: float) -> float:
+        """
+        Get the upper bound of the bucket containing a percentile
+        @param pct: the percentile, 0-100
+        @return: the upper bound in seconds
+        """
+        if self.count == 0:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """
+        Get the histogram as shown by /debug/locks, durations in milliseconds
+        @return:
+        """
+        return {'count': self.count,
+                'totalMs': round(self.total * 1000, 3),
+                'maxMs': round(self.max * 1000, 3),
+                'p50Ms': round(self.percentile(50) * 1000, 3),
+                'p99Ms': round(self.percentile(99) * 1000, 3),
+                'buckets': [[(1 << index) / 1000, count] for index, count in enumerate(self.counts) if count > 0]}
+
+
+class LockProfile:
+    """
+    Wait and hold times of the sampled acquisitions of a lock per call site. One in sampleEvery acquisitions
+    is sampled, the others only count.
+    """
+
+    def __init__(self, sampleEvery: int = 1):
+        self.sampleEvery = max(sampleEvery, 1)
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.sites: typing.Dict[str, typing.Tuple[Histogram, Histogram]] = {}  # site -> (wait, hold)
+
+    def sample(self) -> bool:
+        """
+        Count an acquisition and tell whether it must be sampled. The counter is not guarded: a lost count only
+        moves the next sample.
+        @return: True if the acquisition is sampled
+        """
+        self.acquisitions += 1
+        return self.acquisitions % self.sampleEvery == 0
+
+    def record(self, site: str, wait: float, hold: float):
+        """
+        Add a sampled acquisition
+        @param site: the call site which acquired the lock
+        @param wait: seconds waited for the lock
+        @param hold: seconds the lock was held
+        @return:
+        """
+        with self.lock:
+            histograms = self.sites.get(site)
+            if histograms is None:
+                histograms = (Histogram(), Histogram())
+                self.sites[site] = histograms
+            histograms[0].add(wait)
+            histograms[1].add(hold)
+
+    def statistics(self) -> dict:
+        """
+        Get the profile, the call sites which waited longest in total first
+        @return: dict with the number of acquisitions, the sample rate and the histograms per call site
+        """
+        with self.lock:
+            sites = [{'site': site, 'wait': wait.to_dict(), 'hold': hold.to_dict()}
+                     for site, (wait, hold) in self.sites.items()]
+        sites.sort(key=lambda site: site['wait']['totalMs'], reverse=True)
+        return {'acquisitions': self.acquisitions, 'sampleEvery': self.sampleEvery, 'sites': sites}
+
+    def export(self, path: str):
+        """
+        Write the profile to a file
+        @param path: the path of the file
+        @return:
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.statistics(), file, indent=1)
+
+
+def call_site(depth: int = 2) -> str:
+    """
+    Get the function and line of a caller
+    @param depth: the number of frames between call_site and the caller, 1 is the function calling call_site
+    @return: 'function (file:line)'
+    """
+    try:
+        frame = sys._getframe(depth)  # pylint: disable=protected-access
+    except ValueError:
+        return 'unknown'
+    return '{0} ({1}:{2})'.format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename),
+                                  frame.f_lineno)
@@ -0,0 +1,140 @@
+"""
+Module containing the cache of manifests of a stream
+"""
+import collections
+import re
+import threading
+import time
+import typing
+
+from resources.lib.mpd import parse_duration
+
+
+class CachedManifest:
+    """
+    Manifest as it is sent to the player, with the time it may be reused
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, status: int, content: bytes, timeToLive: float = 0):
+        self.status = status
+        self.content = content
+        self.expires = time.monotonic() + timeToLive
+
+
+class ManifestCache:
+    """
+    Cache of the manifests of one stream (AvStream). A live manifest is refreshed by the player every few
+    seconds; it is reused as long as allowed by the minimumUpdatePeriod of the MPD and the Cache-Control
+    header of the host. Concurrent requests for the same manifest wait for one fetch (single-flight).
+    """
+    # pylint: disable=too-many-instance-attributes
+    MIN_UPDATE_PERIOD = re.compile(rb'minimumUpdatePeriod\s*=\s*"([^"]+)"')
+    MAX_AGE = re.compile(r'max-age\s*=\s*(\d+)')
+    FETCH_RATE_PERIOD = 60
+
+    class Flight:
+        """
+        A fetch in progress, other requests wait for its result
+        """
+        # pylint: disable=too-few-public-methods
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: typing.Optional[CachedManifest] = None
+            self.error: typing.Optional[Exception] = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: typing.Dict[str, CachedManifest] = {}
+        self.flights: typing.Dict[str, ManifestCache.Flight] = {}
+        self.fetchTimes = collections.deque()
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+
+    @classmethod
+    def time_to_live(cls, headers, content: bytes) -> float:
+        """
+        Determine how long a manifest may be reused
+        @param headers: headers of the response of the host
+        @param content: the manifest
+        @return: seconds, 0 if it may not be reused
+        """
+        cacheControl = headers.get('Cache-Control', '') if headers is not None else ''
+        if 'no-cache' in cacheControl or 'no-store' in cacheControl:
+            return 0
+        limits = []
+        maxAge = cls.MAX_AGE.search(cacheControl)
+        if maxAge is not None:
+            limits.append(float(maxAge.group(1)))
+        updatePeriod = cls.MIN_UPDATE_PERIOD.search(content[:4096])
+        if updatePeriod is not None:
+            limits.append(parse_duration(updatePeriod.group(1).decode('ascii')))
+        return min(limits) if limits else 0
+
+    def get(self, key: str, fetch: typing.Callable[[], CachedManifest]) -> CachedManifest:
+        """
+        Get a manifest from the cache or fetch it. If it is already being fetched, wait for that fetch.
+        @param key: identification of the manifest, the path requested by the player
+        @param fetch: function to fetch the manifest from the host
+        @return: the manifest
+        """
+        with self.lock:
+            self.requests += 1
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self.hits += 1
+                return entry
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.Flight()
+                self.flights[key] = flight
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fetch()
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self.lock:
+                now = time.monotonic()
+                self.fetches += 1
+                self.fetchTimes.append(now)
+                if flight.result is not None and flight.result.status == 200:
+                    self.entries[key] = flight.result
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self):
+        """
+        Remove all manifests from the cache
+        @return:
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the cache
+        @return: dict with the counters, the hit ratio and the number of fetches per minute
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.fetchTimes and now - self.fetchTimes[0] > self.FETCH_RATE_PERIOD:
+                self.fetchTimes.popleft()
+            return {
+                'requests': self.requests,
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'fetches': self.fetches,
+                'hitRatio': (self.hits + self.coalesced) / self.requests if self.requests > 0 else 0,
+                'fetchesPerMinute': len(self.fetchTimes) * 60 / self.FETCH_RATE_PERIOD
+            }
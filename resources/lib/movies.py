@@ -2,6 +2,7 @@
 Module containiner helper classes for movies and series
 """
 import json
+from concurrent.futures import CancelledError
 from pathlib import Path
 from enum import IntEnum
 import xbmc
@@ -10,7 +11,7 @@ import xbmcvfs
 
 from resources.lib.events import Event
 from resources.lib.globals import G
-from resources.lib.utils import ProxyHelper
+from resources.lib.utils import AsyncProxyHelper, ProxyHelper
 from resources.lib.webcalls import LoginSession
 
 class GridLink:
@@ -498,18 +499,50 @@ class SeriesList:
         :param serie: the series
         :type serie: Series
         """
-        for seriedetails in self.seriesDetails:
-            if seriedetails['id'] == serie.id:
-                self.seriesDetails.remove(seriedetails)
-                break
-        details = self.helper.dynamic_call(LoginSession.obtain_series_overview, seriesId=serie.id)
+        return self.__add_season_details(serie, self.__obtain_season_details(self.helper, serie))
+
+    def update_season_details_bulk(self, series: list[Series], progress=None) -> int:
+        """
+        Function to update the details of several series at once, the calls run concurrently
+        
+        :param self: 
+        :param series: the series
+        :type series: list[Series]
+        :param progress: function called with the number of series done and the total, returns False to stop.
+                         The series which were not loaded yet keep their current details
+        :return: the number of series which failed
+        """
+        with AsyncProxyHelper(self.addon) as rpc:
+            futures = [rpc.submit_task(self.__obtain_season_details, rpc.helper, serie) for serie in series]
+            results = rpc.wait_all(futures, progress)
+        errors = 0
+        for serie, details in zip(series, results):
+            if isinstance(details, CancelledError):
+                continue
+            if isinstance(details, Exception):
+                xbmc.log(f'Obtaining details of series failed, for series-id: {serie.id}, Exception{details}',
+                         xbmc.LOGERROR)
+                errors += 1
+                continue
+            errors += self.__add_season_details(serie, details)
+        return errors
+
+    @staticmethod
+    def __obtain_season_details(helper: ProxyHelper, serie: Series) -> dict:
+        details = helper.dynamic_call(LoginSession.obtain_series_overview, seriesId=serie.id)
         if 'seasons' not in details:
-            seasons = self.helper.dynamic_call(LoginSession.get_episode_list, item=serie.id)
+            seasons = helper.dynamic_call(LoginSession.get_episode_list, item=serie.id)
             if seasons is not None:
                 details.update({'seasons': seasons['seasons']})
             else:
                 raise RuntimeError('Cannot obtain seasons/episodes!!')
+        return details
 
+    def __add_season_details(self, serie: Series, details: dict) -> int:
+        for seriedetails in self.seriesDetails:
+            if seriedetails['id'] == serie.id:
+                self.seriesDetails.remove(seriedetails)
+                break
         self.seriesDetails.append(details)
         try:
             serie.add_details(details)
@@ -677,16 +710,47 @@ class MovieList:
         :param movie: the movie for which the details have to be fetched
         :type movie: Movie
         """
+        details = self.helper.dynamic_call_with(LoginSession.obtain_asset_details, self.__details_arguments(movie))
+        return self.__add_details(movie, details)
+
+    def update_details_bulk(self, movies: list[Movie], progress=None) -> int:
+        """
+        Function to get the most recent details of several movies at once, the calls run concurrently
+        
+        :param self: 
+        :param movies: the movies for which the details have to be fetched
+        :type movies: list[Movie]
+        :param progress: function called with the number of movies done and the total, returns False to stop.
+                         The movies which were not loaded yet keep their current details
+        :return: the number of movies which failed
+        """
+        with AsyncProxyHelper(self.addon) as rpc:
+            futures = [rpc.submit(LoginSession.obtain_asset_details, self.__details_arguments(movie))
+                       for movie in movies]
+            results = rpc.wait_all(futures, progress)
+        errors = 0
+        for movie, details in zip(movies, results):
+            if isinstance(details, CancelledError):
+                continue
+            if isinstance(details, Exception):
+                xbmc.log(f'Obtaining details of movie failed, for movie-id: {movie.id}, Exception{details}',
+                         xbmc.LOGERROR)
+                errors += 1
+                continue
+            errors += self.__add_details(movie, details)
+        return errors
+
+    @staticmethod
+    def __details_arguments(movie: Movie) -> dict:
+        if movie.brandingProviderId is not None:
+            return {'assetId': movie.id, 'brandingProviderId': movie.brandingProviderId}
+        return {'assetId': movie.id}
+
+    def __add_details(self, movie: Movie, details: dict) -> int:
         for moviedetails in self.moviesDetails:
             if moviedetails['id'] == movie.id:
                 self.moviesDetails.remove(moviedetails)
                 break
-        if movie.brandingProviderId is not None:
-            details = self.helper.dynamic_call(LoginSession.obtain_asset_details, assetId=movie.id,
-                                                brandingProviderId=movie.brandingProviderId)
-        else:
-            details = self.helper.dynamic_call(LoginSession.obtain_asset_details, assetId=movie.id)
-
         self.moviesDetails.append(details)
 
         try:
@@ -0,0 +1,383 @@
+"""
+Module with functions to extract information from DASH manifests (MPD)
+"""
+import re
+import typing
+import xml.etree.ElementTree as ET
+
+
+class SegmentTemplate:
+    """
+    Segment template of one representation. It is used to recognize the segment requested by the player
+    and to construct the url's of the segments that follow.
+    """
+    # pylint: disable=too-many-instance-attributes
+    IDENTIFIER = re.compile(r'\$(RepresentationID|Number|Time|Bandwidth|)(?:%0(\d+)d)?\$')
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def __init__(self, media: str, representationId: str, bandwidth: str = None, startNumber: int = 1,
+                 timeline: typing.List[typing.Tuple[int, int]] = None, endNumber: int = None):
+        """
+        @param media: the media attribute of the SegmentTemplate e.g. '$RepresentationID$/$Time$.m4s'
+        @param representationId: id of the representation
+        @param bandwidth: bandwidth of the representation
+        @param startNumber: number of the first segment
+        @param timeline: expanded SegmentTimeline as list of (time, duration)
+        @param endNumber: number of the last segment if known
+        """
+        self.media = media
+        self.representationId = representationId
+        self.bandwidth = bandwidth
+        self.startNumber = startNumber
+        self.timeline = timeline if timeline is not None else []
+        self.timeIndex = {t: i for i, (t, _) in enumerate(self.timeline)}
+        self.endNumber = endNumber
+        if self.timeline and endNumber is None:
+            self.endNumber = startNumber + len(self.timeline) - 1
+        self.pattern = re.compile(self.__regex() + '$')
+
+    def __regex(self):
+        regex = ''
+        pos = 0
+        for match in self.IDENTIFIER.finditer(self.media):
+            regex += re.escape(self.media[pos:match.start()])
+            identifier = match.group(1)
+            if identifier == 'RepresentationID':
+                regex += re.escape(self.representationId)
+            elif identifier == 'Bandwidth':
+                regex += r'\d+'
+            elif identifier == 'Number':
+                regex += r'(?P<number>\d+)'
+            elif identifier == 'Time':
+                regex += r'(?P<time>\d+)'
+            else:
+                regex += r'\$'
+            pos = match.end()
+        return regex + re.escape(self.media[pos:])
+
+    def segment_path(self, number: int, time: int) -> str:
+        """
+        Construct the path of a segment
+        @param number: number of the segment
+        @param time: start time of the segment (in timescale units)
+        @return: the path of the segment relative to the BaseURL
+        """
+        def substitute(match):
+            identifier = match.group(1)
+            width = int(match.group(2)) if match.group(2) else 0
+            if identifier == 'RepresentationID':
+                return self.representationId
+            if identifier == 'Bandwidth':
+                return str(self.bandwidth).zfill(width)
+            if identifier == 'Number':
+                return str(number).zfill(width)
+            if identifier == 'Time':
+                return str(time).zfill(width)
+            return '$'
+        return self.IDENTIFIER.sub(substitute, self.media)
+
+    def timeline_entry(self, path: str) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        Determine the entry of the SegmentTimeline of the requested segment
+        @param path: the path requested by the player
+        @return: tuple (time, duration) or None if the path does not match or is not in the timeline
+        """
+        match = self.pattern.search(path)
+        if match is None:
+            return None
+        groups = match.groupdict()
+        if groups.get('time') is not None:
+            index = self.timeIndex.get(int(groups['time']))
+        elif groups.get('number') is not None:
+            index = int(groups['number']) - self.startNumber
+        else:
+            return None
+        if index is None or not 0 <= index < len(self.timeline):
+            return None
+        return self.timeline[index]
+
+    def next_segments(self, path: str, count: int) -> typing.List[str]:
+        """
+        Determine the paths of the segments following the requested segment
+        @param path: the path requested by the player
+        @param count: number of segments to return
+        @return: list of paths with the same prefix as the requested path, empty if path does not match
+        """
+        match = self.pattern.search(path)
+        if match is None:
+            return []
+        prefix = path[:match.start()]
+        groups = match.groupdict()
+        if groups.get('time') is not None:
+            index = self.timeIndex.get(int(groups['time']))
+            if index is None:
+                return []
+        elif groups.get('number') is not None:
+            index = int(groups['number']) - self.startNumber
+        else:
+            return []
+        paths = []
+        for i in range(index + 1, index + 1 + count):
+            number = self.startNumber + i
+            if self.endNumber is not None and number > self.endNumber:
+                break
+            time = self.timeline[i][0] if i < len(self.timeline) else None
+            if time is None and groups.get('time') is not None:
+                break
+            paths.append(prefix + self.segment_path(number, time))
+        return paths
+
+
+def _expand_timeline(timelineElement) -> typing.List[typing.Tuple[int, int]]:
+    timeline = []
+    nextTime = 0
+    segments = timelineElement.findall('{*}S')
+    for i, segment in enumerate(segments):
+        t = int(segment.get('t', nextTime))
+        d = int(segment.get('d'))
+        r = int(segment.get('r', 0))
+        if r < 0:
+            # Repeat until the next S element, if it is the last one the end is unknown
+            if i + 1 < len(segments) and segments[i + 1].get('t') is not None:
+                r = (int(segments[i + 1].get('t')) - t) // d - 1
+            else:
+                r = 0
+        for _ in range(r + 1):
+            timeline.append((t, d))
+            t += d
+        nextTime = t
+    return timeline
+
+
+def _merged_attributes(*elements) -> dict:
+    attributes = {}
+    timeline = None
+    for element in elements:
+        if element is None:
+            continue
+        attributes.update(element.attrib)
+        elementTimeline = element.find('{*}SegmentTimeline')
+        if elementTimeline is not None:
+            timeline = elementTimeline
+    attributes['timeline'] = timeline
+    return attributes
+
+
+def _adaptation_set_templates(adaptationSet) -> typing.List[SegmentTemplate]:
+    templates = []
+    setTemplate = adaptationSet.find('{*}SegmentTemplate')
+    for representation in adaptationSet.findall('{*}Representation'):
+        attributes = _merged_attributes(setTemplate, representation.find('{*}SegmentTemplate'))
+        if 'media' not in attributes:
+            continue
+        timeline = []
+        if attributes['timeline'] is not None:
+            timeline = _expand_timeline(attributes['timeline'])
+        templates.append(SegmentTemplate(media=attributes['media'],
+                                         representationId=representation.get('id', ''),
+                                         bandwidth=representation.get('bandwidth'),
+                                         startNumber=int(attributes.get('startNumber', 1)),
+                                         timeline=timeline))
+    return templates
+
+
+class ManifestScanner:
+    """
+    Incremental scanner of a manifest. The manifest is fed in blocks to an XMLPullParser and the elements
+    are processed as soon as they are complete. An AdaptationSet is released after its segment templates
+    are extracted, so the complete document is never kept in memory. When only the BaseURL is needed,
+    scanning stops at the first BaseURL of the first Period.
+    """
+    # pylint: disable=too-few-public-methods
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, templates: bool = True):
+        """
+        @param templates: extract the segment templates, if False scanning stops once the BaseURL is known
+        """
+        self.extractTemplates = templates
+        self.baseUrl = None
+        self.templates: typing.List[SegmentTemplate] = []
+        self.baseUrlKnown = False
+        self.periods = 0
+        self.openElements: typing.List[str] = []
+
+    def __process(self, event: str, element) -> bool:
+        tag = element.tag.rsplit('}', 1)[-1]
+        if event == 'start':
+            self.openElements.append(tag)
+            if tag == 'Period':
+                self.periods += 1
+            return False
+        self.openElements.pop()
+        if tag == 'BaseURL' and not self.baseUrlKnown and self.periods == 1 and 'Period' in self.openElements:
+            self.baseUrl = element.text
+            self.baseUrlKnown = True
+        elif tag == 'Period':
+            self.baseUrlKnown = True
+            element.clear()
+        elif tag == 'AdaptationSet':
+            if self.extractTemplates:
+                self.templates.extend(_adaptation_set_templates(element))
+            element.clear()
+        return self.baseUrlKnown and not self.extractTemplates
+
+    def scan(self, manifest: typing.Union[bytes, str]) -> 'ManifestScanner':
+        """
+        Scan the manifest
+        @param manifest: content of the manifest
+        @return: the scanner, with baseUrl and templates set
+        """
+        data = manifest.encode('utf-8') if isinstance(manifest, str) else manifest
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        for offset in range(0, len(data), self.BLOCK_SIZE):
+            parser.feed(data[offset:offset + self.BLOCK_SIZE])
+            for event, element in parser.read_events():
+                if self.__process(event, element):
+                    return self
+        parser.close()
+        return self
+
+
+def baseurl_from_manifest(manifest: typing.Union[bytes, str]) -> typing.Optional[str]:
+    """
+    Get the first BaseURL of the first Period of the manifest, if it exists.
+    Some channels use relative url's (RTL8 and others).
+    @param manifest: content of the manifest
+    @return: the BaseURL or None
+    """
+    return ManifestScanner(templates=False).scan(manifest).baseUrl
+
+
+def segment_templates_from_manifest(manifest: typing.Union[bytes, str]) -> typing.List[SegmentTemplate]:
+    """
+    Extract the segment templates of all representations in the manifest.
+    A SegmentTemplate at AdaptationSet level is inherited by the representations.
+    @param manifest: content of the manifest
+    @return: list of SegmentTemplate objects
+    """
+    return ManifestScanner().scan(manifest).templates
+
+
+def parse_duration(duration: str) -> float:
+    """
+    Convert an ISO 8601 duration as used in the MPD (e.g. PT1H2M3.5S) to seconds
+    """
+    match = re.fullmatch(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?', duration or '')
+    if match is None:
+        return 0
+    days, hours, minutes, seconds = (float(value) if value else 0 for value in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def extend_timelines(manifest: typing.Union[bytes, str],
+                     buffered: typing.Dict[typing.Tuple[str, str], typing.Dict[int, int]],
+                     bufferedSeconds: float) -> bytes:
+    """
+    Rewrite a live manifest so that segments buffered locally can be requested by the player. The
+    segments before the first entry of a SegmentTimeline are added to the timeline and the
+    timeShiftBufferDepth is extended to the buffered duration.
+    @param manifest: content of the manifest
+    @param buffered: the buffered segments per (media, representation id) as dict time -> duration
+    @param bufferedSeconds: duration of the buffer in seconds
+    @return: the rewritten manifest
+    """
+    source = manifest.encode('utf-8') if isinstance(manifest, str) else manifest
+    # One pass collects the namespaces and builds the tree
+    parser = ET.XMLPullParser(events=('start-ns', 'start'))
+    parser.feed(source)
+    namespaces = []
+    root = None
+    for event, value in parser.read_events():
+        if event == 'start-ns':
+            namespaces.append(value)
+        elif root is None:
+            root = value
+    parser.close()
+    if bufferedSeconds > parse_duration(root.get('timeShiftBufferDepth')):
+        root.set('timeShiftBufferDepth', 'PT{0}S'.format(int(bufferedSeconds)))
+    for period in root.findall('{*}Period'):
+        for adaptationSet in period.findall('{*}AdaptationSet'):
+            representations = adaptationSet.findall('{*}Representation')
+            templates = [(adaptationSet.find('{*}SegmentTemplate'), representations)]
+            templates.extend((representation.find('{*}SegmentTemplate'), [representation])
+                             for representation in representations)
+            for template, scope in templates:
+                if template is None or template.find('{*}SegmentTimeline') is None:
+                    continue
+                _prepend_buffered(template, scope, buffered)
+    _use_prefixes(root, namespaces)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+def _use_prefixes(root, namespaces: typing.List[typing.Tuple[str, str]]):
+    """
+    Replace the namespace uris of the tags and attributes by the prefixes of the manifest and declare them on
+    the root, so the manifest is serialized with its own prefixes. Otherwise ElementTree uses the prefixes of
+    the global ET.register_namespace, which refuses prefixes like ns1.
+    @param root: the root element
+    @param namespaces: the declarations (prefix, uri) of the manifest, the empty prefix for the default namespace
+    @return:
+    """
+    declarations = {}  # prefix -> uri
+    prefixes = {'http://www.w3.org/XML/1998/namespace': 'xml'}  # uri -> prefix
+
+    def declare(prefix: str, uri: str) -> str:
+        # A prefix can be declared for another uri in a nested element, all are declared on the root here
+        number = 0
+        while prefix in declarations or prefix == 'xml':
+            prefix = 'ns{0}'.format(number)
+            number += 1
+        declarations[prefix] = uri
+        return prefix
+
+    for prefix, uri in namespaces:
+        if uri not in prefixes:
+            prefixes[uri] = declare(prefix, uri)
+    attributePrefixes = dict(prefixes)
+
+    def qualified(name: str, attribute: bool) -> str:
+        if not name.startswith('{'):
+            return name
+        uri, localName = name[1:].split('}', 1)
+        names = attributePrefixes if attribute else prefixes
+        if names.get(uri) is None or (attribute and names[uri] == ''):
+            # An attribute without prefix has no namespace, it needs a prefix for the default namespace
+            names[uri] = declare('ns', uri)
+        return names[uri] + ':' + localName if names[uri] else localName
+
+    for element in root.iter():
+        element.tag = qualified(element.tag, False)
+        if any(name.startswith('{') for name in element.attrib):
+            element.attrib = {qualified(name, True): value for name, value in element.attrib.items()}
+    for prefix, uri in declarations.items():
+        root.set('xmlns:' + prefix if prefix else 'xmlns', uri)
+
+
+def _prepend_buffered(template, representations, buffered):
+    timelineElement = template.find('{*}SegmentTimeline')
+    timeline = _expand_timeline(timelineElement)
+    media = template.get('media')
+    if not timeline or media is None:
+        return
+    durations = {}
+    for representation in representations:
+        durations.update(buffered.get((media, representation.get('id', '')), {}))
+    # Only the buffered segments directly preceding the timeline, a gap would break the numbering
+    endTimes = {time + duration: time for time, duration in durations.items()}
+    segments = []
+    time = endTimes.get(timeline[0][0])
+    while time is not None:
+        segments.insert(0, (time, durations.pop(time)))
+        time = endTimes.get(time)
+    startNumber = int(template.get('startNumber', 1))
+    if '$Number' in media:
+        segments = segments[len(segments) - min(startNumber, len(segments)):]
+    if not segments:
+        return
+    first = timelineElement.find('{*}S')
+    first.set('t', str(timeline[0][0]))
+    for i, (time, duration) in enumerate(segments):
+        timelineElement.insert(i, ET.Element(first.tag, {'t': str(time), 'd': str(duration)}))
+    if '$Number' in media:
+        template.set('startNumber', str(startNumber - len(segments)))
@@ -0,0 +1,176 @@
+"""
+Module containing the read-ahead of DASH segments for a stream
+"""
+import collections
+import concurrent.futures
+import threading
+import typing
+
+import xbmc
+
+from resources.lib.mpd import SegmentTemplate, segment_templates_from_manifest
+
+
+class PrefetchedSegment:
+    """
+    A segment which is fetched in advance and kept in memory
+    """
+    # pylint: disable=too-few-public-methods
+    HOP_BY_HOP_HEADERS = ['connection', 'keep-alive', 'transfer-encoding', 'content-length']
+
+    def __init__(self, status: int, headers: typing.List[typing.Tuple[str, str]], body: bytes):
+        self.status = status
+        self.headers = [(key, value) for key, value in headers if key.lower() not in self.HOP_BY_HOP_HEADERS]
+        self.body = body
+
+
+class SegmentPrefetcher:
+    """
+    Read-ahead of the segments of one stream (AvStream). The segment templates of the manifest are used
+    to determine which segments follow the segment requested by the player. Those are fetched in the
+    background and kept in memory until the player requests them.
+    The memory used is limited, when the limit is exceeded the oldest segments are dropped.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, fetch: typing.Callable[[str], typing.Optional[PrefetchedSegment]],
+                 depth: int = 2, memoryLimit: int = 64 * 1024 * 1024, workers: int = 2, waitTimeout: float = 5):
+        # pylint: disable=too-many-arguments, too-many-positional-arguments
+        """
+        @param fetch: function to fetch a segment via the upstream host, called with the path of the segment
+        @param depth: number of segments to read ahead
+        @param memoryLimit: maximum number of bytes kept in memory
+        @param workers: number of concurrent fetches
+        @param waitTimeout: max seconds to wait for a segment that is being fetched
+        """
+        self.fetch = fetch
+        self.depth = depth
+        self.memoryLimit = memoryLimit
+        self.waitTimeout = waitTimeout
+        self.templates: typing.List[SegmentTemplate] = []
+        self.lock = threading.Lock()
+        self.segments: typing.OrderedDict[str, PrefetchedSegment] = collections.OrderedDict()
+        self.pending: typing.Dict[str, threading.Event] = {}
+        self.memoryUsed = 0
+        self.stopped = False
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                              thread_name_prefix='SegmentPrefetcher')
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.dropped = 0
+
+    def update_manifest(self, manifest: bytes, templates: typing.List[SegmentTemplate] = None):
+        """
+        Update the segment templates from a (new) version of the manifest
+        @param manifest: content of the manifest
+        @param templates: the segment templates if already extracted from the manifest
+        @return:
+        """
+        if templates is None:
+            try:
+                templates = segment_templates_from_manifest(manifest)
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                xbmc.log('SegmentPrefetcher could not parse manifest: {0}'.format(exc), xbmc.LOGERROR)
+                templates = []
+        with self.lock:
+            self.templates = templates
+
+    def get(self, path: str) -> typing.Optional[PrefetchedSegment]:
+        """
+        Get a prefetched segment. If the segment is being fetched, wait for it.
+        The segment is removed from memory, because the player will not request it again.
+        @param path: path requested by the player
+        @return: the segment or None if it was not prefetched
+        """
+        with self.lock:
+            pending = self.pending.get(path)
+        if pending is not None:
+            pending.wait(self.waitTimeout)
+        with self.lock:
+            segment = self.segments.pop(path, None)
+            if segment is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.memoryUsed -= len(segment.body)
+            return segment
+
+    def schedule_after(self, path: str):
+        """
+        Start fetching the segments following the requested segment
+        @param path: path requested by the player
+        @return:
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            templates = self.templates
+        for template in templates:
+            nextPaths = template.next_segments(path, self.depth)
+            if nextPaths:
+                break
+        else:
+            return
+        for nextPath in nextPaths:
+            with self.lock:
+                if self.stopped or nextPath in self.segments or nextPath in self.pending:
+                    continue
+                self.pending[nextPath] = threading.Event()
+            try:
+                self.executor.submit(self.__prefetch, nextPath)
+            except RuntimeError:  # executor is shut down
+                self.__finish(nextPath, None)
+
+    def __prefetch(self, path: str):
+        segment = None
+        try:
+            if not self.stopped:
+                segment = self.fetch(path)
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            xbmc.log('SegmentPrefetcher fetch of {0} failed: {1}'.format(path, exc), xbmc.LOGDEBUG)
+        self.__finish(path, segment)
+
+    def __finish(self, path: str, segment: typing.Optional[PrefetchedSegment]):
+        with self.lock:
+            if segment is not None and segment.status == 200 and not self.stopped:
+                self.segments[path] = segment
+                self.memoryUsed += len(segment.body)
+                self.prefetched += 1
+                while self.memoryUsed > self.memoryLimit and self.segments:
+                    _, oldest = self.segments.popitem(last=False)
+                    self.memoryUsed -= len(oldest.body)
+                    self.dropped += 1
+            event = self.pending.pop(path, None)
+        if event is not None:
+            event.set()
+
+    def stop(self):
+        """
+        Cancel all outstanding fetches and release the memory
+        @return:
+        """
+        with self.lock:
+            self.stopped = True
+            self.segments.clear()
+            self.memoryUsed = 0
+            pending = list(self.pending.values())
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for event in pending:
+            event.set()
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the prefetcher
+        @return: dict with hits, misses, prefetched and dropped segments and memory in use
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'prefetched': self.prefetched,
+                'dropped': self.dropped,
+                'memoryUsed': self.memoryUsed
+            }
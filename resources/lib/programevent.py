@@ -53,7 +53,7 @@ class ProgramEventGrid:
         self.__update_events()
         self.videoHelper = VideoHelpers(self.addon)
         self.plannedRecordings: RecordingList = RecordingList(self.addon)
-        self.plannedRecordings.refresh()
+        self.plannedRecordings.refresh_if_changed()
 
     def __del__(self):
         self.videoHelper.requestorCallbackStop = None
@@ -280,7 +280,7 @@ class ProgramEventGrid:
                 return
             event = self.rows[row].programs[program]
             try:
-                self.videoHelper.play_epg(event.programEvent, self.rows[row].channel)
+                self.videoHelper.play_epg(event.programEvent, self.rows[row].channel, self.plannedRecordings)
 
             except WebException as exc:
                 xbmc.log('Webexception in play_epg: {0}'.format(exc), xbmc.LOGERROR)
@@ -1,9 +1,16 @@
 """
 Proxy server related classes
 """
+# pylint: disable=too-many-lines
 import base64
+import hashlib
+import os
 import pickle
+import json
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs, unquote
 
 import socket
@@ -13,28 +20,82 @@ import socketserver
 import http.server
 
 from http.server import BaseHTTPRequestHandler
-from http.client import HTTPConnection
-from http.client import HTTPSConnection
-
-from xml.dom import minidom
 
 import xbmc
+import xbmcvfs
 
 from resources.lib.globals import CONST_BASE_HEADERS, G
 from resources.lib.webcalls import LoginSession
-from resources.lib.utils import WebException, SharedProperties
+from resources.lib.utils import WebException, SharedProperties, KodiLock
 
+from resources.lib import mpd, rpcframing
+from resources.lib.tracing import TRACER, DURATION_HEADER, TRACE_HEADER
 from resources.lib.avstream import StreamSession
+from resources.lib.connectionpool import UpstreamConnectionPool
+from resources.lib.relay import SegmentRelay
+from resources.lib.prefetcher import PrefetchedSegment, SegmentPrefetcher
+from resources.lib.segmentcache import SegmentCache
+from resources.lib.timeshift import TimeShiftBuffer
+from resources.lib.manifestcache import CachedManifest, ManifestCache
 
 
 class HTTPRequestHandler(BaseHTTPRequestHandler):
     """
-    class to handle HTTP requests that arrive at the proxy server
+    class to handle HTTP requests that arrive at the proxy server. HTTP/1.1 is used, so InputStream Adaptive keeps
+    the connection (and the thread handling it) for the next manifest, segment and license requests. Every response
+    must therefore have a Content-Length or be chunked.
     """
+    protocol_version = 'HTTP/1.1'
+    timeout = 300  # seconds an idle kept-alive connection is kept open
+
     def __init__(self, request, client_address: typing.Tuple[str, int], server: socketserver.BaseServer):
         # pylint: disable=useless-parent-delegation
         super().__init__(request, client_address, server)
 
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, without TCP_NODELAY the body of a small response on a
+        # kept-alive connection waits for the delayed ACK of the client
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        proxy: ProxyServer = self.server
+        proxy.count_connection()
+
+    def parse_request(self):
+        self.arrival = time.perf_counter()  # pylint: disable=attribute-defined-outside-init
+        if not super().parse_request():
+            return False
+        proxy: ProxyServer = self.server
+        proxy.count_request()
+        return True
+
+    def send_content(self, status: int, content: bytes = b'', contentType: str = None, headers: dict = None):
+        """
+        Send a complete response with a Content-Length, the body is not sent for a HEAD request
+        @param status: http status code
+        @param content: the body
+        @param contentType: value of the Content-Type header, if any
+        @param headers: extra headers, if any
+        @return:
+        """
+        self.send_response(status)
+        if contentType is not None:
+            self.send_header('Content-Type', contentType)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    def send_chunk(self, data: bytes):
+        """
+        Send a chunk of a body sent with Transfer-Encoding chunked, an empty chunk ends the body
+        @param data: the content of the chunk
+        @return:
+        """
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+
     def log_request(self, code='-', size='-'):
         if code == 200:
             pass
@@ -77,24 +138,87 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         for every new call
     """
 
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes, too-many-public-methods
+    BATCH_WORKERS = 4
+
     def __init__(self, addon, server_address, lock):
         http.server.ThreadingHTTPServer.__init__(self, server_address, HTTPRequestHandler)
         self.lock = lock
         self.addon = addon
         self.session = LoginSession(self.addon)
+        # The LoginSession methods with a lock region take the session lock instead of the global lock, their
+        # acquisitions are recorded in the same profile
+        self.session.lockProfile = getattr(lock, 'profile', None)
         self.streamsession = StreamSession(self.session)
         self.home = SharedProperties(addon=self.addon)
         self.kodiMajorVersion = self.home.get_kodi_version_major()
         self.kodiMinorVersion = self.home.get_kodi_version_minor()
         self.connectionTimeout = self.addon.getSettingNumber('connection-timeout')
         self.uuId = SharedProperties(addon=self.addon).get_uuid()
+        self.connectionPool = UpstreamConnectionPool(
+            maxSize=int(self.addon.getSettingNumber('upstream-pool-size')),
+            idleTimeout=self.addon.getSettingNumber('upstream-idle-timeout'),
+            connectionTimeout=self.connectionTimeout)
+        self.relay = SegmentRelay()
+        self.prefetchDepth = int(self.addon.getSettingNumber('prefetch-segments'))
+        self.prefetchMemory = int(self.addon.getSettingNumber('prefetch-memory')) * 1024 * 1024
+        self.profileDir = xbmcvfs.translatePath(self.addon.getAddonInfo('profile'))
+        self.segmentCache = None
+        cacheSize = int(self.addon.getSettingNumber('segment-cache-size')) * 1024 * 1024
+        if cacheSize > 0:
+            self.segmentCache = SegmentCache(os.path.join(self.profileDir, G.SEGMENT_CACHE), cacheSize)
+        self.timeshiftWindow = int(self.addon.getSettingNumber('timeshift-window')) * 60
+        self.timeshiftSize = int(self.addon.getSettingNumber('timeshift-size')) * 1024 * 1024
+        self.countersLock = threading.Lock()
+        self.connections = 0
+        self.threads = 0
+        self.requests = 0
+        self.frames: typing.Dict[tuple, tuple] = {}  # (method, compressed) -> (memoized result, frame)
+        self.frameHits = 0
+        self.batchExecutor = ThreadPoolExecutor(max_workers=self.BATCH_WORKERS, thread_name_prefix='batch')
+        TRACER.configure(self.addon.getSettingBool('rpc-tracing'))
         xbmc.log("ProxyServer created", xbmc.LOGINFO)
 
     def server_bind(self):
         super().server_bind()
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+    def process_request(self, request, client_address):
+        # ThreadingHTTPServer starts a thread for every connection
+        with self.countersLock:
+            self.threads += 1
+        super().process_request(request, client_address)
+
+    def count_connection(self):
+        """
+        Function called by the HTTPRequestHandler when a connection from the player is accepted
+        @return:
+        """
+        with self.countersLock:
+            self.connections += 1
+
+    def count_request(self):
+        """
+        Function called by the HTTPRequestHandler for every request received on a connection
+        @return:
+        """
+        with self.countersLock:
+            self.requests += 1
+
+    def statistics(self) -> dict:
+        """
+        Get the number of connections accepted, threads started and requests handled by the proxy
+        @return: dict with the counters
+        """
+        with self.countersLock:
+            return {
+                'connections': self.connections,
+                'threads': self.threads,
+                'requests': self.requests,
+                'requestsPerConnection': self.requests / self.connections if self.connections > 0 else 0,
+                'frameHits': self.frameHits
+            }
+
     def send_error(self, exc: Exception, request: HTTPRequestHandler):
         """
         Function to send an error message in case of a failure
@@ -107,10 +231,9 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         """
         try:
             xbmc.log(traceback.format_exc(), xbmc.LOGDEBUG)
-            request.send_response(500)
-            request.send_header('Content-Type','text/html')
-            request.end_headers()
-            request.wfile.write(bytes(str(exc), 'utf-8'))
+            # A part of the response may have been sent already, the connection cannot be reused
+            request.close_connection = True
+            request.send_content(500, bytes(str(exc), 'utf-8'), 'text/html')
         # pylint: disable=broad-exception-caught
         except Exception as ex:
             xbmc.log('Failed to send proper response: {0}'.format(ex))
@@ -132,28 +255,78 @@ class ProxyServer(http.server.ThreadingHTTPServer):
             if stream is None:
                 raise RuntimeError('Stream not found for token: {token}')
             manifestUrl = stream.get_manifest_url(proxyUrl=request.path)
-            with self.lock:
-                manifestBaseurl = None
-                if requestType == 'get':
-                    response = self.session.get_manifest(manifestUrl)
-                    if response.status_code == 200:
-                        manifestBaseurl = self.baseurl_from_manifest(response.content)
-                elif requestType == 'head':
-                    response = self.session.do_head(manifestUrl)
-            stream.update_redirection(request.path, response.url, manifestBaseurl)
-            request.send_response(response.status_code)
+            if requestType == 'get':
+                manifest = stream.manifestCache.get(
+                    request.path, lambda: self.fetch_manifest(stream, request.path, manifestUrl))
+                status, content = manifest.status, manifest.content
+                contentLength = len(content)
+            else:
+                response = self.session.do_head(manifestUrl)
+                stream.update_redirection(request.path, response.url, None)
+                status, content = response.status_code, b''
+                contentLength = response.headers.get('Content-Length', 0)
+            request.send_response(status)
             # See wiki of InputStream Adaptive. Also depends on inputstream.adaptive.manifest_type. See listitemhelper.
             if self.kodiMajorVersion > 20:
                 request.send_header('content-type', 'application/dash+xml')
+            request.send_header('Content-Length', str(contentLength))
             request.end_headers()
-            request.wfile.write(response.content)
+            request.wfile.write(content)
 
         else:
-            request.send_response(404)
-            request.end_headers()
+            request.send_content(404)
+
+    def fetch_manifest(self, stream, proxyUrl: str, manifestUrl: str) -> CachedManifest:
+        """
+        Fetch the manifest from the real host. The redirection, the prefetcher and the time-shift buffer of the
+        stream are updated with it. The global lock is not held, so RPC and license calls can continue.
+        @param stream: the stream (AvStream) to which the manifest belongs
+        @param proxyUrl: the url of the manifest received by the proxy
+        @param manifestUrl: the url of the manifest on the real host
+        @return: the manifest as it must be sent to the player
+        """
+        response = self.session.get_manifest(manifestUrl)
+        useTimeshift = stream.live and self.timeshiftWindow > 0
+        scanner = None
+        if response.status_code == 200:
+            # One scan of the manifest for the BaseURL and the segment templates
+            scanner = mpd.ManifestScanner(templates=self.prefetchDepth > 0 or useTimeshift).scan(response.content)
+        stream.update_redirection(proxyUrl, response.url, scanner.baseUrl if scanner is not None else None)
+        if scanner is None:
+            return CachedManifest(response.status_code, response.content)
+        if self.prefetchDepth > 0:
+            if stream.prefetcher is None:
+                stream.prefetcher = SegmentPrefetcher(
+                    fetch=lambda path: self.prefetch_segment(stream, path),
+                    depth=self.prefetchDepth,
+                    memoryLimit=self.prefetchMemory)
+            stream.prefetcher.update_manifest(response.content, scanner.templates)
+        content = response.content
+        if useTimeshift and stream.timeshift is None:
+            stream.timeshift = self.create_timeshift(stream)
+        if stream.timeshift is not None:
+            content = stream.timeshift.update_manifest(content, scanner.templates)
+        return CachedManifest(200, content, ManifestCache.time_to_live(response.headers, response.content))
+
+    def create_timeshift(self, stream) -> typing.Optional[TimeShiftBuffer]:
+        """
+        Create the time-shift buffer of a live stream. If the file of the buffer cannot be created or mapped
+        (disk full, no mmap of that size), time-shift is switched off and the stream is played without it.
+        @param stream: the stream (AvStream)
+        @return: the buffer or None
+        """
+        filename = hashlib.sha256(stream.id.encode('utf-8')).hexdigest()[:16] + '.buf'
+        try:
+            return TimeShiftBuffer(os.path.join(self.profileDir, G.TIMESHIFT_BUFFERS, filename),
+                                   windowSeconds=self.timeshiftWindow,
+                                   maxBytes=self.timeshiftSize)
+        except (OSError, ValueError) as exc:
+            xbmc.log('Time-shift buffer of {0} MB not created, time-shift switched off: {1}'.format(
+                self.timeshiftSize // (1024 * 1024), exc), xbmc.LOGERROR)
+            self.timeshiftWindow = 0
+            return None
 
     def handle_default(self, request: HTTPRequestHandler):
-        # pylint: disable=too-many-locals, too-many-branches
         """
         Handles get requests which are not manifest/license request. This concerns the video/audio requests.
         Also here the url for the real host must be constructed and the streaming token must be inserted.
@@ -166,56 +339,112 @@ class ProxyServer(http.server.ThreadingHTTPServer):
             if stream is None:
                 raise RuntimeError('Stream not found for token: {token}')
         else:
-            request.send_response(500)
-            request.send_header('Content-Type','text/html')
-            request.end_headers()
-            request.wfile.write(bytes('x-streaming-token missing', 'utf-8'))
+            request.send_content(500, bytes('x-streaming-token missing', 'utf-8'), 'text/html')
+            return
+
+        prefetcher = stream.prefetcher
+        segment = self.stored_segment(stream, request.path)
+        if segment is None and prefetcher is not None:
+            segment = prefetcher.get(request.path)
+            if segment is not None:
+                self.store_segment(stream, request.path, segment)
+        if prefetcher is not None:
+            prefetcher.schedule_after(request.path)
+        if segment is not None:
+            self.send_segment(segment, request)
             return
 
+        # A segment which is kept is copied while it is relayed, and stored when it was relayed completely
+        tee = bytearray() if self.keeps_segments(stream) else None
         url = stream.replace_baseurl(request.path, stream.latestToken)
-        parsedDestUrl = urlparse(url)
-        if parsedDestUrl.scheme == 'https':
-            connection = HTTPSConnection(parsedDestUrl.hostname, timeout=self.connectionTimeout)
-        else:
-            connection = HTTPConnection(parsedDestUrl.hostname, timeout=self.connectionTimeout)
-        connection.request("GET", parsedDestUrl.path)
-        response = connection.getresponse()
-        request.send_response(response.status)
-        chunked = False
-        for header in response.headers:
-            if header.lower() == 'transfer-encoding':
-                if response.headers[header].lower() == 'chunked':
-                    #  We don't know the length upfront
-                    chunked = True
-            request.send_header(header, response.headers[header])
+        connection, response = self.connectionPool.request('GET', url)
+        completed = False
+        try:
+            self.relay.relay(response, request, tee)
+            completed = True
+        finally:
+            self.connectionPool.release(connection, reusable=completed and response.isclosed())
+        if tee is not None:
+            self.store_segment(stream, request.path, PrefetchedSegment(response.status, response.getheaders(), tee))
+
+    def keeps_segments(self, stream) -> bool:
+        """
+        Indicates if the segments of the stream are kept in the segment cache or the time-shift buffer
+        @param stream: the stream (AvStream)
+        @return:
+        """
+        return stream.timeshift is not None or (stream.cacheable and self.segmentCache is not None)
+
+    def stored_segment(self, stream, path: str) -> typing.Optional[PrefetchedSegment]:
+        """
+        Get a segment from the segment cache (replay, vod, recordings) or the time-shift buffer (live channels)
+        @param stream: the stream (AvStream) to which the segment belongs
+        @param path: the path of the segment as requested by the player
+        @return: the segment or None if it is not stored
+        """
+        if stream.timeshift is not None:
+            return stream.timeshift.get(path)
+        if stream.cacheable and self.segmentCache is not None:
+            return self.segmentCache.get(stream.upstream_path(path))
+        return None
+
+    def store_segment(self, stream, path: str, segment: PrefetchedSegment):
+        """
+        Store a segment in the segment cache or the time-shift buffer
+        @param stream: the stream (AvStream) to which the segment belongs
+        @param path: the path of the segment as requested by the player
+        @param segment: the segment
+        @return:
+        """
+        if stream.timeshift is not None:
+            stream.timeshift.put(path, segment)
+        elif stream.cacheable and self.segmentCache is not None:
+            self.segmentCache.put(stream.upstream_path(path), segment)
+
+    def fetch_segment(self, stream, path: str) -> PrefetchedSegment:
+        """
+        Fetch a segment from the real host into memory. Used by the prefetcher of the stream.
+        @param stream: the stream (AvStream) to which the segment belongs
+        @param path: the path of the segment as it will be requested by the player
+        @return: the fetched segment
+        """
+        url = stream.replace_baseurl(path, stream.latestToken)
+        connection, response = self.connectionPool.request('GET', url)
+        completed = False
+        try:
+            body = response.read()
+            completed = True
+        finally:
+            self.connectionPool.release(connection, reusable=completed and response.isclosed())
+        return PrefetchedSegment(response.status, response.getheaders(), body)
+
+    def prefetch_segment(self, stream, path: str) -> typing.Optional[PrefetchedSegment]:
+        """
+        Fetch function of the prefetcher of the stream. Segments already stored are skipped.
+        @param stream: the stream (AvStream) to which the segment belongs
+        @param path: the path of the segment as it will be requested by the player
+        @return: the fetched segment or None
+        """
+        if stream.cacheable and self.segmentCache is not None and stream.upstream_path(path) in self.segmentCache:
+            return None
+        if stream.timeshift is not None and path in stream.timeshift:
+            return None
+        return self.fetch_segment(stream, path)
+
+    @staticmethod
+    def send_segment(segment: PrefetchedSegment, request: HTTPRequestHandler):
+        """
+        Send a segment which was prefetched or cached to the player
+        @param segment: the segment from the prefetcher or cache
+        @param request:
+        @return:
+        """
+        request.send_response(segment.status)
+        for key, value in segment.headers:
+            request.send_header(key, value)
+        request.send_header('Content-Length', str(len(segment.body)))
         request.end_headers()
-        lenProcessed = 0
-        if chunked:  # process the same chunks as received
-            response.chunked = False
-            blockLen = response.readline()
-            length = int(blockLen, 16)
-            while length > 0:
-                lenProcessed += length
-                block = response.read(length)
-                blockToWrite = bytearray(blockLen)
-                blockToWrite.extend(block + b'\r\n')
-                request.wfile.write(blockToWrite)
-                response.readline()
-                blockLen = response.readline()
-                length = int(blockLen, 16)
-            blockToWrite = bytearray(blockLen)
-            blockToWrite.extend(b'\r\n')
-            request.wfile.write(blockToWrite)
-        else:
-            expectedLen = int(response.headers['Content-Length'])
-            block = response.read(8192)
-            while lenProcessed < expectedLen:
-                lenProcessed += len(block)
-                written = request.wfile.write(block)
-                if written != len(block):
-                    xbmc.log('count-written ({0})<>len(block)({1})'.format(written, len(block)))
-                    return
-                block = response.read(8192)
+        request.wfile.write(segment.body)
 
     def handle_get(self, request: HTTPRequestHandler):
         """
@@ -230,6 +459,10 @@ class ProxyServer(http.server.ThreadingHTTPServer):
                 self.handle_manifest(request)
             elif '/function' in path:
                 self.handle_function(request)
+            elif path.startswith('/debug/traces'):
+                self.handle_traces(request)
+            elif path.startswith('/debug/locks'):
+                self.handle_locks(request)
             else:
                 self.handle_default(request)
 
@@ -252,12 +485,18 @@ class ProxyServer(http.server.ThreadingHTTPServer):
             self.send_error(exc, request)
 
     def handle_post(self, request: HTTPRequestHandler):
-        # pylint: disable=too-many-locals, too-many-statements
+        # pylint: disable=too-many-locals, too-many-statements, too-many-branches
         """
         Function to handle the license request. The request is forwarded to the real host.
         @param request:
         @return:
         """
+        # The body is always read, otherwise it would be taken as the next request on the connection
+        length = int(request.headers.get('content-length', 0))
+        receivedData = request.rfile.read(length)
+        if request.path.startswith('/function/'):
+            self.handle_rpc(request, receivedData)
+            return
         if 'x-streaming-token' in request.headers:
             token = request.headers['x-streaming-token']
             stream = self.streamsession.find_stream(token)
@@ -265,22 +504,15 @@ class ProxyServer(http.server.ThreadingHTTPServer):
                 raise RuntimeError('Stream not found for token: {0}'.format(token))
             token = stream.latestToken
         else:
-            request.send_response(500)
-            request.send_header('Content-Type','text/html')
-            request.end_headers()
-            request.wfile.write(bytes('x-streaming-token missing', 'utf-8'))
+            request.send_content(500, bytes('x-streaming-token missing', 'utf-8'), 'text/html')
             return
 
         path = request.path  # Path with parameters received from request e.g. "/license?id=234324"
         xbmc.log('HTTP POST request received: {0}'.format(unquote(path)), xbmc.LOGDEBUG)
         if '/license' not in path:
-            request.send_response(404)
-            request.end_headers()
+            request.send_content(404)
             return
         try:
-            length = int(request.headers.get('content-length', 0))
-            receivedData = request.rfile.read(length)
-
             parsedUrl = urlparse(request.path)
             contentId = parse_qs(parsedUrl.query)['ContentId'][0]
 
@@ -303,15 +535,12 @@ class ProxyServer(http.server.ThreadingHTTPServer):
                 hdrs[key] = request.headers[key]
             for key, value in licenseHeaders.items():  # Headers required for license request to work.
                 hdrs[key] = value
-            with self.lock:
-                response = self.session.get_license(contentId, receivedData, hdrs)
+            response = self.session.get_license(contentId, receivedData, hdrs)
 
             for key in response.headers:
                 request.headers.add_header(key, response.headers[key])
 
-            request.send_response(response.status_code)
-            request.end_headers()
-            request.wfile.write(response.content)
+            request.send_content(response.status_code, response.content)
             xbmc.log('HTTP POST request processed: {0}'.format(unquote(path)), xbmc.LOGDEBUG)
         except ConnectionResetError as exc:
             xbmc.log('Connection reset during processing: {0}'.format(exc), xbmc.LOGERROR)
@@ -398,6 +627,7 @@ class ProxyServer(http.server.ThreadingHTTPServer):
             request.send_header('access-control-allow-headers', 'X-Username')
             request.send_header('access-control-allow-headers', 'Location')
             request.send_header('access-control-allow-headers', 'x-tracking-id')
+            request.send_header('Content-Length', '0')
             request.end_headers()
         except ConnectionResetError as exc:
             xbmc.log('Connection reset during processing: {0}'.format(exc), xbmc.LOGERROR)
@@ -426,47 +656,301 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         """
         parsedUrl = urlparse(request.path)
         method = parsedUrl.path[10:]
-        parts = method.split('.')
-        calledclass = parts[0]
-        calledmethod = parts[1]
         qs = parse_qs(parsedUrl.query)
-        if 'args' in qs:
+        if 'args' in qs and method == 'batch':
+            self.handle_batch(request, pickle.loads(base64.b64decode(qs['args'][0])))
+        elif 'args' in qs:
             args = pickle.loads(base64.b64decode(qs['args'][0]))
             try:
-                retval = None
-                xbmc.log(f'Called method: {calledclass}.{calledmethod} with args: {args}', xbmc.LOGDEBUG)
-                if calledclass == self.session.__class__.__name__:
-                    callableMethod = getattr(self.session, calledmethod)
-                    with self.lock:
-                        retval = callableMethod(**args)
-                else:
-                    if calledclass == self.streamsession.__class__.__name__:
-                        callableMethod = getattr(self.streamsession, calledmethod)
-                        xbmc.log(f'Calling StreamSession: {callableMethod} with args: {args}', xbmc.LOGDEBUG)
-                        with self.lock:
-                            retval = callableMethod(**args)
-                request.send_response(200)
+                retval = self.call_function(method, args)
                 if retval is None:
-                    request.send_header('content-type', 'text/html')
-                    request.end_headers()
+                    request.send_content(200, contentType='text/html')
                 else:
-                    request.send_header('content-type', 'application/octet-stream')
-                    request.end_headers()
-                    request.wfile.write(pickle.dumps(retval))
+                    request.send_content(200, pickle.dumps(retval), 'application/octet-stream')
             except WebException as exc:
-                request.send_response(exc.status)
-                request.send_header('content-type', 'text/html')
-                request.end_headers()
-                request.wfile.write(exc.response)
+                request.send_content(exc.status, exc.response, 'text/html')
             #pylint: disable=broad-exception-caught
             except Exception as exc:
-                request.send_response(500)
-                request.send_header('content-type', 'text/html')
-                request.end_headers()
-                request.wfile.write(bytes(str(exc), 'utf-8'))
+                request.send_content(500, bytes(str(exc), 'utf-8'), 'text/html')
         else:
-            request.send_response(400)
-            request.end_headers()
+            request.send_content(400)
+
+    def find_function(self, method: str):
+        """
+        Find the method of LoginSession or StreamSession to call
+        @param method: the qualified name of the method e.g. LoginSession.login
+        @return: the bound method and whether it must be called with the global lock, or None, False if the
+        class is unknown
+        """
+        calledclass, calledmethod = method.split('.')
+        if calledclass == self.session.__class__.__name__:
+            callableMethod = getattr(self.session, calledmethod)
+            # LoginSession guards its own state, read-only calls run in parallel
+            return callableMethod, not hasattr(callableMethod, 'lockRegion')
+        if calledclass == self.streamsession.__class__.__name__:
+            return getattr(self.streamsession, calledmethod), True
+        return None, False
+
+    def call_function(self, method: str, args: dict, stream: bool = False):
+        """
+        Call a method of LoginSession or StreamSession
+        @param method: the qualified name of the method e.g. LoginSession.login
+        @param args: the named arguments
+        @param stream: return the iterator of a streamed method, instead of a list with its values
+        @return: the value returned by the method
+        """
+        # Only the names of the arguments are logged, the values may contain credentials or be large
+        xbmc.log(f'Called method: {method} with args: {list(args)}', xbmc.LOGDEBUG)
+        callableMethod, locked = self.find_function(method)
+        if callableMethod is None:
+            return None
+        if locked:
+            with TRACER.span('lock wait'):
+                if isinstance(self.lock, KodiLock):
+                    self.lock.acquire(site=method)  # the profile shows the method, not call_function
+                else:
+                    self.lock.acquire()
+            try:
+                retval = callableMethod(**args)
+            finally:
+                self.lock.release()
+        else:
+            retval = callableMethod(**args)
+        if getattr(callableMethod, 'streamedResult', False) and not stream:
+            return list(retval)
+        return retval
+
+    @staticmethod
+    def send_stream(request: HTTPRequestHandler, values: typing.Iterator, compress: bool):
+        """
+        Send the values of a streamed method, each in a frame in its own chunk as soon as it is available. The
+        status is already sent, so a failure while iterating is sent in an error frame. The body ends with an
+        end frame.
+        @param request:
+        @param values: the iterator returned by the method
+        @param compress: compress the frames
+        @return:
+        """
+        request.send_response(200)
+        request.send_header('Content-Type', rpcframing.CONTENT_TYPE)
+        request.send_header('Transfer-Encoding', 'chunked')
+        request.end_headers()
+        try:
+            try:
+                with TRACER.span('stream'):
+                    for value in values:
+                        request.send_chunk(rpcframing.encode_frame(value, compress))
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except WebException as exc:
+                request.send_chunk(rpcframing.encode_error_frame(exc.status, exc.response))
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                xbmc.log('Exception in streamed result: {0}'.format(exc), xbmc.LOGERROR)
+                request.send_chunk(rpcframing.encode_error_frame(500, bytes(str(exc), 'utf-8')))
+            request.send_chunk(rpcframing.encode_end_frame())
+            request.send_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError) as exc:
+            xbmc.log('Connection lost during streamed result: {0}'.format(exc), xbmc.LOGERROR)
+            request.close_connection = True
+        finally:
+            close = getattr(values, 'close', None)
+            if close is not None:
+                close()  # stops the method when the caller went away
+
+    def result_frame(self, method: str, args: dict, retval, compress: bool) -> bytes:
+        """
+        Encode the value returned by a method in a frame. The frame of a memoized method of LoginSession is kept
+        and sent again as long as the method returns the same object.
+        @param method: the qualified name of the method
+        @param args: the named arguments
+        @param retval: the value returned by the method
+        @param compress: compress the frame
+        @return: the frame
+        """
+        callableMethod = self.find_function(method)[0]
+        if args or not getattr(callableMethod, 'memoizedResult', False):
+            return rpcframing.encode_frame(retval, compress)
+        key = (method, compress)
+        with self.countersLock:
+            cached = self.frames.get(key)
+            if cached is not None and cached[0] is retval:
+                self.frameHits += 1
+                return cached[1]
+        frame = rpcframing.encode_frame(retval, compress)
+        with self.countersLock:
+            self.frames[key] = (retval, frame)
+        return frame
+
+    def batch_result(self, method: str, args: dict) -> tuple:
+        """
+        Call a method for a batch and catch its failure
+        @param method: the qualified name of the method
+        @param args: the named arguments
+        @return: (200, value returned) or (status, content of the error response)
+        """
+        try:
+            return 200, self.call_function(method, args)
+        except WebException as exc:
+            return exc.status, exc.response
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            return 500, bytes(str(exc), 'utf-8')
+
+    def handle_batch(self, request: HTTPRequestHandler, calls: typing.List[typing.Tuple[str, dict]]):
+        """
+        Execute a list of calls received with GET in one request
+        @param request:
+        @param calls: list of (qualified name, named arguments)
+        @return:
+        """
+        request.send_content(200, pickle.dumps(self.run_batch(calls)), 'application/octet-stream')
+
+    def run_batch(self, calls: typing.List[typing.Tuple[str, dict]]) -> typing.List[tuple]:
+        """
+        Execute a list of calls. Consecutive calls of read only methods (see webcalls.read_only) are executed
+        concurrently, other calls, like deleting or booking recordings, are executed in order and wait for the
+        calls before them.
+        @param calls: list of (qualified name, named arguments)
+        @return: list with the result of batch_result for each call
+        """
+        results = [None] * len(calls)
+        trace = TRACER.current()
+        submitted = time.perf_counter()
+
+        def execute(index):
+            with TRACER.attach(trace):
+                if trace is not None:
+                    trace.add_span('queue', submitted, time.perf_counter())
+                with TRACER.span(calls[index][0]):
+                    results[index] = self.batch_result(*calls[index])
+
+        concurrent = []
+        for index, (method, _) in enumerate(calls):
+            try:
+                callableMethod, _ = self.find_function(method)
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                callableMethod = None
+            if getattr(callableMethod, 'readOnly', False):
+                concurrent.append(index)
+                continue
+            list(self.batchExecutor.map(execute, concurrent))
+            concurrent = []
+            execute(index)
+        list(self.batchExecutor.map(execute, concurrent))
+        return results
+
+    def handle_rpc(self, request: HTTPRequestHandler, body: bytes):
+        """
+        This function processes the calls of ProxyHelper sent with POST. The body is a frame (see rpcframing)
+        with the named arguments, or for /function/batch with the list of calls. /function/changes waits for
+        the events of the change feed (long-poll). The result is sent back in a frame, compressed if the caller
+        asks for it. When the caller asks for a stream, the values of a streamed method are sent in a frame each
+        (see send_stream). With tracing enabled the call is traced under the id of the X-Trace-Id header.
+        @param request:
+        @param body: the received frame
+        @return:
+        """
+        method = urlparse(request.path).path[len('/function/'):]
+        version = request.headers.get(rpcframing.VERSION_HEADER)
+        if version != str(rpcframing.VERSION):
+            request.send_content(400, bytes('Unsupported RPC version: {0}'.format(version), 'utf-8'), 'text/html')
+            return
+        trace = TRACER.begin(method, request.headers.get(TRACE_HEADER), getattr(request, 'arrival', None))
+        try:
+            if trace is not None:
+                trace.add_span('receive', trace.start, time.perf_counter())
+            self.run_rpc(request, method, body)
+        finally:
+            TRACER.finish(trace)
+
+    def run_rpc(self, request: HTTPRequestHandler, method: str, body: bytes):
+        """
+        Execute a call received by handle_rpc and send its result
+        @param request:
+        @param method: the qualified name of the method, batch or changes
+        @param body: the received frame
+        @return:
+        """
+        compress = request.headers.get(rpcframing.COMPRESSION_HEADER) == rpcframing.COMPRESSION
+        try:
+            with TRACER.span('decode'):
+                args = rpcframing.decode_frame(body)
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            request.send_content(400, bytes('Invalid RPC frame: {0}'.format(exc), 'utf-8'), 'text/html')
+            return
+        try:
+            if method == 'batch':
+                with TRACER.span('call'):
+                    retval = self.run_batch(args)
+                with TRACER.span('encode'):
+                    frame = rpcframing.encode_frame(retval, compress)
+            elif method == 'changes':
+                with TRACER.span('wait'):
+                    retval = self.session.changeFeed.changes(**args)
+                with TRACER.span('encode'):
+                    frame = rpcframing.encode_frame(retval, compress)
+            elif (request.headers.get(rpcframing.STREAM_HEADER) == '1'
+                  and getattr(self.find_function(method)[0], 'streamedResult', False)):
+                with TRACER.span('call'):
+                    values = iter(self.call_function(method, args, stream=True))
+                self.send_stream(request, values, compress)
+                return
+            else:
+                with TRACER.span('call'):
+                    retval = self.call_function(method, args)
+                with TRACER.span('encode'):
+                    frame = self.result_frame(method, args, retval, compress)
+            trace = TRACER.current()
+            headers = None
+            if trace is not None:
+                headers = {TRACE_HEADER: trace.traceId, DURATION_HEADER: '{0:.3f}'.format(trace.duration * 1000)}
+            with TRACER.span('send'):
+                request.send_content(200, frame, rpcframing.CONTENT_TYPE, headers)
+        except WebException as exc:
+            request.send_content(exc.status, exc.response, 'text/html')
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            request.send_content(500, bytes(str(exc), 'utf-8'), 'text/html')
+
+    @staticmethod
+    def handle_traces(request: HTTPRequestHandler):
+        """
+        Send the traces of the recent calls of ProxyHelper, as json or with ?format=chrome in the format of
+        chrome://tracing. Only available when tracing is enabled (setting rpc-tracing).
+        @param request:
+        @return:
+        """
+        if not TRACER.enabled:
+            request.send_content(404)
+            return
+        if parse_qs(urlparse(request.path).query).get('format') == ['chrome']:
+            content = TRACER.chrome_trace()
+        else:
+            content = TRACER.recent()
+        request.send_content(200, json.dumps(content).encode('utf-8'), 'application/json')
+
+    def lock_profile(self):
+        """
+        Get the profile of the global lock and the session lock
+        @return: the LockProfile, or None if the lock is not profiled (setting lock-profile-sampling)
+        """
+        return getattr(self.lock, 'profile', None)
+
+    def handle_locks(self, request: HTTPRequestHandler):
+        """
+        Send the wait and hold times of the global lock and the session lock per call site
+        (LockProfile.statistics) as json. Only available when the locks are profiled.
+        @param request:
+        @return:
+        """
+        profile = self.lock_profile()
+        if profile is None:
+            request.send_content(404)
+            return
+        request.send_content(200, json.dumps(profile.statistics()).encode('utf-8'), 'application/json')
 
     def handle_head(self, request: HTTPRequestHandler):
         """
@@ -482,10 +966,7 @@ class ProxyServer(http.server.ThreadingHTTPServer):
             if '/manifest' in path:
                 self.handle_manifest(request, 'head')
             else:
-                request.send_response(501)
-                request.send_header('Content-Type','text/html')
-                request.end_headers()
-                request.wfile('/manifest missing')
+                request.send_content(501, bytes('/manifest missing', 'utf-8'), 'text/html')
         except ConnectionResetError as exc:
             xbmc.log('Connection reset during processing: {0}'.format(exc), xbmc.LOGERROR)
             xbmc.log(traceback.format_exc(), xbmc.LOGDEBUG)
@@ -508,18 +989,11 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         """
         Function to check is a BaseURL exists in the manifest file. If so, extract and return it.
         This was required because some channels use relative url's (RTL8 and others).
+        The manifest is scanned incrementally, scanning stops at the first BaseURL.
         @param manifest:
         @return:
         """
-        document = minidom.parseString(manifest)
-        for parent in document.getElementsByTagName('MPD'):
-            periods = parent.getElementsByTagName('Period')
-            for period in periods:
-                baseURL = period.getElementsByTagName('BaseURL')
-                if baseURL.length == 0:
-                    return None
-                return baseURL[0].childNodes[0].data
-        return None
+        return mpd.baseurl_from_manifest(manifest)
 
     def run(self):
         """
@@ -532,6 +1006,8 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         finally:
             xbmc.log('Proxy server shutting down', xbmc.LOGINFO)
             self.server_close()
+            self.connectionPool.close_all()
+            self.batchExecutor.shutdown(wait=False)
             xbmc.log('Proxy server closed', xbmc.LOGINFO)
 
     def stop(self):
@@ -539,6 +1015,23 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         Function to stop the proxyserver
         After shutdown is called a connection is made to the server to make sure it stops
         """
+        self.session.changeFeed.close()
+        self.streamsession.close()
+        if TRACER.enabled:
+            try:
+                TRACER.dump(os.path.join(self.profileDir, G.TRACE_FILE))
+            except OSError as exc:
+                xbmc.log('Traces not written: {0}'.format(exc), xbmc.LOGERROR)
+        profile = self.lock_profile()
+        if profile is not None:
+            for site in profile.statistics()['sites'][:5]:
+                xbmc.log('Lock {0}: {1} sampled, wait {2}ms, hold {3}ms'.format(
+                    site['site'], site['wait']['count'], site['wait']['totalMs'], site['hold']['totalMs']),
+                    xbmc.LOGINFO)
+            try:
+                profile.export(os.path.join(self.profileDir, G.LOCK_PROFILE_FILE))
+            except OSError as exc:
+                xbmc.log('Lock profile not written: {0}'.format(exc), xbmc.LOGERROR)
         self.shutdown()
         try:
             with socket.create_connection(self.server_address, timeout=1):
@@ -546,3 +1039,113 @@ class ProxyServer(http.server.ThreadingHTTPServer):
         # pylint: disable=broad-exception-caught
         except Exception:
             pass # Is expected here because the server is already down
+
+
+class RpcServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Listener on a unix domain socket for the calls of ProxyHelper (/function). The calls are executed by the
+    ProxyServer, but do not share its listener and threads with the manifest, segment and license requests
+    of the player.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketPath: str, proxy: ProxyServer):
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)  # left behind by a service which was not stopped properly
+        self.socketPath = socketPath
+        self.proxy = proxy
+        self.countersLock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.openConnections = set()
+        super().__init__(socketPath, HTTPRequestHandler)
+
+    def get_request(self):
+        connection, _ = self.socket.accept()
+        with self.countersLock:
+            self.openConnections.add(connection)
+        # BaseHTTPRequestHandler expects an (address, port) tuple
+        return connection, ('local', 0)
+
+    def shutdown_request(self, request):
+        with self.countersLock:
+            self.openConnections.discard(request)
+        super().shutdown_request(request)
+
+    def count_connection(self):
+        """
+        Function called by the HTTPRequestHandler when a connection is accepted
+        @return:
+        """
+        with self.countersLock:
+            self.connections += 1
+
+    def count_request(self):
+        """
+        Function called by the HTTPRequestHandler for every request received on a connection
+        @return:
+        """
+        with self.countersLock:
+            self.requests += 1
+
+    def statistics(self) -> dict:
+        """
+        Get the number of connections accepted and requests handled
+        @return: dict with the counters
+        """
+        with self.countersLock:
+            return {'connections': self.connections, 'requests': self.requests}
+
+    def handle_get(self, request: HTTPRequestHandler):
+        """
+        Function to handle the calls sent with GET
+        @param request:
+        @return:
+        """
+        if request.path.startswith(('/function/', '/debug/traces', '/debug/locks')):
+            self.proxy.handle_get(request)
+        else:
+            request.send_content(404)
+
+    def handle_post(self, request: HTTPRequestHandler):
+        """
+        Function to handle the calls sent with POST
+        @param request:
+        @return:
+        """
+        if request.path.startswith('/function/'):
+            self.proxy.handle_post(request)
+        else:
+            length = int(request.headers.get('content-length', 0))
+            request.rfile.read(length)
+            request.send_content(404)
+
+    def handle_options(self, request: HTTPRequestHandler):
+        """
+        Function to handle OPTIONS, not supported
+        @param request:
+        @return:
+        """
+        request.send_content(404)
+
+    def handle_head(self, request: HTTPRequestHandler):
+        """
+        Function to handle HEAD, not supported
+        @param request:
+        @return:
+        """
+        request.send_content(404)
+
+    def server_close(self):
+        super().server_close()
+        # End the kept-alive connections, the clients continue on a new connection
+        with self.countersLock:
+            for connection in self.openConnections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        try:
+            os.unlink(self.socketPath)
+        except OSError:
+            pass
@@ -5,13 +5,14 @@ import dataclasses
 import datetime
 from enum import IntEnum
 import json
+import time
 from pathlib import Path
 
 import xbmcaddon
 import xbmcvfs
 import xbmc
 
-from resources.lib import utils
+from resources.lib import changefeed, recordingsync, utils
 from resources.lib.globals import G
 from resources.lib.savedstates import BaseSavedStateList
 from resources.lib.webcalls import LoginSession
@@ -243,6 +244,8 @@ class RecordingList:
     container class for a list of recordings of any type
     """
     # pylint: disable=too-few-public-methods, too-many-instance-attributes
+    MAX_AGE = 600  # seconds
+
     def __init__(self, addon: xbmcaddon.Addon):
         self.addon = addon
         self.helper = utils.ProxyHelper(addon)
@@ -252,41 +255,73 @@ class RecordingList:
         self.size = 0
         self.occupied = 0
         self.recordingDetails = {}
+        self.parsed = {}  # (recordingtype, key) -> recording, reused when its entry did not change
+        self.changes = utils.ChangeTracker(self.helper, topics=[changefeed.RECORDINGS], name='recordings',
+                                           home=utils.SharedProperties(addon=self.addon))
 
         self.file = xbmcvfs.translatePath(self.addon.getAddonInfo('profile')) + G.RECORDINGS_INFO
         self.__load_and_parse()
 
+    @property
+    def version(self):
+        """
+        The version of the recordings received from the service, None if unknown
+        @return:
+        """
+        return self.recordingDetails.get('version') if isinstance(self.recordingDetails, dict) else None
+
     def __load_and_parse(self):
         """
         function to load the recordings details from file and parse it to fill the recordings list
         @return:
         """
         if Path(self.file).exists():
-            self.recs = []
-            self.total = 0
-            self.quota = 0
-            self.size = 0
-            recordings = json.loads(Path(self.file).read_text(encoding='utf-8'))
-            self.__parse(recordings['planned'], RecordingType.PLANNED)
-            self.__parse(recordings['recorded'], RecordingType.RECORDED)
+            self.recordingDetails = json.loads(Path(self.file).read_text(encoding='utf-8'))
+            self.parsed = {}
+            self.__parse_all()
+
+    def __parse_all(self, changed: dict = None):
+        """
+        function to fill the recordings list from the recordings details
+        @param changed: per list the keys of the entries which changed, the recordings of the other entries are
+            reused. None to parse all entries.
+        @return:
+        """
+        self.recs = []
+        self.total = 0
+        self.quota = 0
+        self.size = 0
+        if not isinstance(self.recordingDetails, dict) or 'planned' not in self.recordingDetails:
+            return
+        previous = self.parsed
+        self.parsed = {}
+        for name, recordingtype in (('planned', RecordingType.PLANNED), ('recorded', RecordingType.RECORDED)):
+            self.__parse(self.recordingDetails[name], recordingtype,
+                         previous if changed is not None else {}, changed.get(name, {}) if changed else {})
 
-    def __parse(self, recordingsJson, recordingtype: str):
+    def __parse(self, recordingsJson, recordingtype: str, previous: dict, changed):
 
         self.total += recordingsJson['total']
         self.size += recordingsJson['size']
         self.quota += recordingsJson['quota']['quota']
         self.occupied = recordingsJson['quota']['occupied']
-        for data in recordingsJson['data']:
-            if data['type'] in ['season', 'show']:
-                season = SeasonRecording(data, recordingtype)
-                self.recs.append(season)
-            elif data['type'] == 'single':
-                if data['recordingState'] == 'planned':
-                    recPlanned = PlannedRecording(data)
-                    self.recs.append(recPlanned)
-                else:
-                    recSingle = SingleRecording(data)
-                    self.recs.append(recSingle)
+        for key, data in zip(recordingsync.entry_keys(recordingsJson['data']), recordingsJson['data']):
+            rec = previous.get((recordingtype, key)) if key not in changed else None
+            if rec is None:
+                rec = self.__build(data, recordingtype)
+            if rec is not None:
+                self.parsed[(recordingtype, key)] = rec
+                self.recs.append(rec)
+
+    @staticmethod
+    def __build(data, recordingtype: str):
+        if data['type'] in ['season', 'show']:
+            return SeasonRecording(data, recordingtype)
+        if data['type'] == 'single':
+            if data['recordingState'] == 'planned':
+                return PlannedRecording(data)
+            return SingleRecording(data)
+        return None
 
     def __save_recordings_details(self):
         """
@@ -418,18 +453,53 @@ class RecordingList:
 
     def refresh(self):
         """
-        function to refresh the recordings list by reloading the details from file and re-parsing it
+        function to refresh the recordings list with the changes since the version of the recordings details,
+        only the recordings of the changed entries are parsed again
         @return:
         """
-        recordings = self.helper.dynamic_call(LoginSession.refresh_recordings,
-                                              includeAdult=self.addon.getSettingBool('adult-allowed'))
-        self.recordingDetails = recordings
-        self.__save_recordings_details()
-        self.__load_and_parse()
+        includeAdult = self.addon.getSettingBool('adult-allowed')
+        position = self.changes.position()
+        try:
+            delta = self.helper.dynamic_call(LoginSession.sync_recordings, version=self.version,
+                                             includeAdult=includeAdult)
+            self.changes.poll()  # the changes seen by the service, including this refresh, are in the recordings
+            try:
+                recordings = recordingsync.apply_delta(self.recordingDetails, delta)
+            except KeyError:
+                # The recordings details on file do not match the version, e.g. written by an older version
+                delta = self.helper.dynamic_call(LoginSession.sync_recordings, version=None,
+                                                 includeAdult=includeAdult)
+                recordings = recordingsync.apply_delta(None, delta)
+            self.recordingDetails = recordings
+            self.__save_recordings_details()
+        except Exception:
+            # The changes are not in the recordings, the next refresh_if_changed must see them again
+            self.changes.rewind(position)
+            raise
+        if delta['full']:
+            self.parsed = {}
+            self.__parse_all()
+        else:
+            self.__parse_all({name: delta[name]['changed'] for name in recordingsync.LISTS})
+
+    def refresh_if_changed(self):
+        """
+        function to refresh the recordings list only when the service saw a change of the recordings since the
+        last refresh, or when the recordings details on file are older than MAX_AGE (recordings which finished
+        or were changed on another device)
+        @return:
+        """
+        path = Path(self.file)
+        position = self.changes.position()
+        if (self.changes.poll() or not path.exists()
+                or time.time() - path.stat().st_mtime > self.MAX_AGE):
+            self.changes.rewind(position)  # the changes are taken by refresh, when it succeeds
+            self.refresh()
 
     def delete_recording(self, plannedrec: Recording):
         """
-        function to delete a recording
+        function to delete a recording. The recording is removed from the recordings list and details at once,
+        without waiting for the next refresh.
         @param recording: the recording to delete
         @return:
          """
@@ -443,10 +513,10 @@ class RecordingList:
                                     event=plannedrec.id,
                                     show=None,
                                     channelId=plannedrec.channelId)
-        for rec in self.recs:
+        for rec in list(self.recs):
             if isinstance(rec, SeasonRecording):
                 season: SeasonRecording = rec
-                for seasonrec in season.episodes:
+                for seasonrec in list(season.episodes):
                     if seasonrec.id == plannedrec.id:
                         season.episodes.remove(seasonrec)
                         xbmc.log("Episode with id {0} deleted".format(seasonrec.id), xbmc.LOGDEBUG)
@@ -454,12 +524,74 @@ class RecordingList:
                 singlerec: SingleRecording = rec
                 if singlerec.id == plannedrec.id:
                     self.recs.remove(singlerec)
-                    xbmc.log("Recording with id {0} deleted".format(seasonrec.id), xbmc.LOGDEBUG)
+                    xbmc.log("Recording with id {0} deleted".format(singlerec.id), xbmc.LOGDEBUG)
             elif isinstance(rec, PlannedRecording):
                 bookedrec: PlannedRecording = rec
                 if bookedrec.id == plannedrec.id:
                     self.recs.remove(bookedrec)
-                    xbmc.log("Planned recording with id {0} deleted".format(seasonrec.id), xbmc.LOGDEBUG)
+                    xbmc.log("Planned recording with id {0} deleted".format(bookedrec.id), xbmc.LOGDEBUG)
+        self.__remove_details(plannedrec.id)
+
+    def __remove_details(self, recordingId, episodes: bool = True):
+        """
+        function to remove the entries, and the episodes of seasons, with an id from the recordings details and
+        save them. The version is kept: the next refresh receives the entries changed by the deletion.
+        @param recordingId: id of the entries or episodes
+        @param episodes: also remove the episodes with the id from the seasons
+        @return:
+        """
+        if not isinstance(self.recordingDetails, dict) or 'planned' not in self.recordingDetails:
+            return
+        for name in recordingsync.LISTS:
+            listJson = self.recordingDetails[name]
+            listJson['data'] = [data for data in listJson['data'] if data['id'] != recordingId]
+            if not episodes:
+                continue
+            for data in listJson['data']:
+                if 'episodes' in data:
+                    data['episodes']['data'] = [episode for episode in data['episodes']['data']
+                                                if episode.get('id', episode.get('episodeId')) != recordingId]
+        self.__save_recordings_details()
+
+    def record_event(self, event, channelId):
+        """
+        function to record an event. A planned recording of the event is added to the recordings list and details at
+        once, it is replaced by the recording of the service at the next refresh.
+        @param event: the event to record
+        @param channelId: the channel of the event
+        @return:
+        """
+        self.helper.dynamic_call(LoginSession.record_event, eventId=event.id)
+        self.__add_planned(event, channelId)
+
+    def record_show(self, event, channelId):
+        """
+        function to record the show of an event. The show is not added at once like the event of record_event:
+        the season and its episodes are only known by the service, so the recordings list is refreshed.
+        @param event: an event of the show
+        @param channelId: the channel of the event
+        @return:
+        """
+        self.helper.dynamic_call(LoginSession.record_show, eventId=event.id, channelId=channelId)
+        self.refresh()
+
+    def __add_planned(self, event, channelId):
+        def isotime(unixTime):
+            return datetime.datetime.fromtimestamp(unixTime, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+        data = {'id': event.id,
+                'type': 'single',
+                'source': 'single',
+                'recordingState': 'planned',
+                'title': event.title,
+                'channelId': channelId,
+                'startTime': isotime(event.startTime),
+                'endTime': isotime(event.endTime),
+                'minimumAge': event.minimumAge}
+        self.recs.append(PlannedRecording(data))
+        if isinstance(self.recordingDetails, dict) and 'planned' in self.recordingDetails:
+            self.recordingDetails['planned']['data'].append(data)
+            self.__save_recordings_details()
 
     def __can_delete_whole_season(self, season: SeasonRecording, deleteBookedAndRecorded: bool):
         """
@@ -506,27 +638,25 @@ class RecordingList:
                 elif season.recordingType == RecordingType.RECORDED and episode.isRecorded:
                     self.delete_recording(episode)
         else:
+            arguments = {'show': showId, 'channelId': season.channelId}
             if season.recordingType == RecordingType.PLANNED:
-                self.helper.dynamic_call(LoginSession.delete_recordings_planned,
-                                        show=showId,
-                                        channelId=season.channelId)
                 # With the current API there is no need to delete the recordings, because they
                 # are automatically deleted when the planned season recording is deleted, but we do it anyway to be sure
                 # to delete all recordings of the season, including the recorded ones
-                self.helper.dynamic_call(LoginSession.delete_recordings,
-                                    show=showId,
-                                    channelId=season.channelId)
+                calls = [(LoginSession.delete_recordings_planned, arguments),
+                         (LoginSession.delete_recordings, arguments)]
             else:
-                self.helper.dynamic_call(LoginSession.delete_recordings,
-                                    show=showId,
-                                    channelId=season.channelId)
                 # With the current API there is no need to delete the plannedrecordings, because they
                 # are automatically deleted when the season recording is deleted, but we do it anyway to be sure
                 # to delete all recordings of the season, including the recorded ones
-                self.helper.dynamic_call(LoginSession.delete_recordings_planned,
-                                    show=showId,
-                                    channelId=season.channelId)
-            self.recs.remove(season)
+                calls = [(LoginSession.delete_recordings, arguments),
+                         (LoginSession.delete_recordings_planned, arguments)]
+            for result in self.helper.dynamic_batch(calls):
+                if isinstance(result, utils.WebException):
+                    raise result
+            # The show is deleted from both lists
+            self.recs = [rec for rec in self.recs if not (isinstance(rec, SeasonRecording) and rec.id == season.id)]
+            self.__remove_details(season.id, episodes=False)
         xbmc.log(f"Recording of complete show with id {season.showId} deleted", xbmc.LOGDEBUG)
 
 class SavedStateList(BaseSavedStateList):
@@ -0,0 +1,145 @@
+"""
+Module with the delta synchronisation of the recordings between the service and the windows: the service keeps a
+versioned snapshot of the recordings, a window receives only the entries which changed since its version
+"""
+import json
+import threading
+import typing
+import uuid
+import zlib
+
+LISTS = ('planned', 'recorded')
+
+
+def entry_keys(data: list) -> typing.List[str]:
+    """
+    Get the keys of the entries of a list of recordings: the id, followed by '#n' for the n-th entry with the
+    same id (a season can be listed more than once)
+    @param data: the entries of the list
+    @return: the keys, in the order of the entries
+    """
+    seen = {}
+    keys = []
+    for entry in data:
+        entryId = entry['id']
+        count = seen.get(entryId, 0) + 1
+        seen[entryId] = count
+        keys.append(entryId if count == 1 else '{0}#{1}'.format(entryId, count))
+    return keys
+
+
+def digest(value) -> int:
+    """
+    Get a digest of a json value, independent of the order of the keys
+    @param value:
+    @return: crc32 of the value
+    """
+    return zlib.crc32(json.dumps(value, sort_keys=True).encode('utf-8'))
+
+
+class RecordingsSnapshot:
+    """
+    The recordings last obtained by the service, with a version. Every entry (single recording or season with its
+    episodes) remembers the version in which it last changed, so a window with the recordings of an older version
+    only receives the entries which changed since then. The version contains the id of the snapshot: a window
+    with the version of another snapshot (e.g. from before the service restarted) receives all entries.
+    """
+
+    def __init__(self):
+        self.snapshotId = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.lock = threading.RLock()  # reentrant, sync calls update and delta with the lock
+        # list name -> {'meta': the list without data, 'keys': [key], 'entries': {key: (digest, version, entry)}}
+        self.lists = {name: {'meta': {}, 'keys': [], 'entries': {}} for name in LISTS}
+
+    def update(self, recordings: dict) -> bool:
+        """
+        Replace the snapshot with the recordings obtained by the service
+        @param recordings: dict with the planned and recorded lists, as returned by LoginSession.refresh_recordings
+        @return: True if the recordings changed, the version is then incremented
+        """
+        with self.lock:
+            nextVersion = self.version + 1
+            changed = False
+            for name in LISTS:
+                current = self.lists[name]
+                data = recordings[name]['data']
+                meta = {key: value for key, value in recordings[name].items() if key != 'data'}
+                keys = entry_keys(data)
+                entries = {}
+                for key, entry in zip(keys, data):
+                    entryDigest = digest(entry)
+                    previous = current['entries'].get(key)
+                    if previous is not None and previous[0] == entryDigest:
+                        entries[key] = previous
+                    else:
+                        entries[key] = (entryDigest, nextVersion, entry)
+                        changed = True
+                if keys != current['keys'] or meta != current['meta']:
+                    changed = True
+                self.lists[name] = {'meta': meta, 'keys': keys, 'entries': entries}
+            if changed:
+                self.version = nextVersion
+            return changed
+
+    def sync(self, recordings: dict, version: str = None) -> dict:
+        """
+        Replace the snapshot with the recordings obtained by the service and get the changes since a version, at
+        once: the delta is of these recordings, also when another call replaces the snapshot at the same time
+        @param recordings: dict with the planned and recorded lists, as returned by LoginSession.refresh_recordings
+        @param version: the version of the recordings of the window, None if it has none
+        @return: the changes, see delta
+        """
+        with self.lock:
+            self.update(recordings)
+            return self.delta(version)
+
+    def __since(self, version: typing.Optional[str]) -> typing.Optional[int]:
+        if version is None:
+            return None
+        snapshotId, _, number = version.partition(':')
+        if snapshotId != self.snapshotId or not number.isdigit() or int(number) > self.version:
+            return None
+        return int(number)
+
+    def delta(self, version: str = None) -> dict:
+        """
+        Get the changes of the recordings since a version
+        @param version: the version of the recordings of the window, None if it has none
+        @return: dict with the current version, whether all entries are included (full) and per list the list
+            without data (meta), the keys of all entries in order and the changed entries by key
+        """
+        with self.lock:
+            since = self.__since(version)
+            full = since is None
+            delta = {'version': '{0}:{1}'.format(self.snapshotId, self.version), 'full': full}
+            for name in LISTS:
+                current = self.lists[name]
+                delta[name] = {'meta': current['meta'],
+                               'keys': current['keys'],
+                               'changed': {key: entry for key, (_, entryVersion, entry) in current['entries'].items()
+                                           if full or entryVersion > since}}
+            return delta
+
+
+def apply_delta(recordings: typing.Optional[dict], delta: dict) -> dict:
+    """
+    Apply the changes received from the service to the recordings of a window
+    @param recordings: the recordings of the version sent to the service, None if there are none
+    @param delta: the changes returned by RecordingsSnapshot.delta
+    @return: the recordings of the new version, with the version
+    @raise KeyError: if an unchanged entry is missing from the recordings, they must be obtained in full then
+    """
+    result = {'version': delta['version']}
+    for name in LISTS:
+        changes = delta[name]
+        if delta['full']:
+            known = {}
+        elif recordings is None or name not in recordings:
+            raise KeyError(name)
+        else:
+            known = dict(zip(entry_keys(recordings[name]['data']), recordings[name]['data']))
+        changed = changes['changed']
+        result[name] = dict(changes['meta'])
+        result[name]['data'] = [changed[key] if key in changed else known[key] for key in changes['keys']]
+    return result
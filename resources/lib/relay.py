@@ -0,0 +1,205 @@
+"""
+Module containing the relay of segment bodies from the upstream host to the player
+"""
+import http.client
+import threading
+import typing
+from http.client import HTTPResponse
+
+
+class BufferPool:
+    """
+    Pool of preallocated buffers. The ThreadingHTTPServer creates a thread per connection, so buffers
+    are not kept per thread but handed out by the pool and returned after the relay of a segment.
+    """
+    def __init__(self, bufferSize: int, maxBuffers: int = 8):
+        self.bufferSize = bufferSize
+        self.maxBuffers = maxBuffers
+        self.lock = threading.Lock()
+        self.buffers: typing.List[memoryview] = []
+
+    def acquire(self) -> memoryview:
+        """
+        Get a buffer from the pool, a new one is allocated if none is available
+        @return: memoryview on a buffer of bufferSize bytes
+        """
+        with self.lock:
+            if self.buffers:
+                return self.buffers.pop()
+        return memoryview(bytearray(self.bufferSize))
+
+    def release(self, buffer: memoryview):
+        """
+        Return a buffer to the pool
+        @param buffer: buffer obtained via acquire()
+        @return:
+        """
+        with self.lock:
+            if len(self.buffers) < self.maxBuffers:
+                self.buffers.append(buffer)
+
+
+class SegmentRelay:
+    """
+    Relays the body of an upstream response to the player without intermediate copies.
+    Data is read with readinto() in preallocated buffers and written with a scatter write (sendmsg),
+    so the chunk header, the data and the trailing CRLF are sent without concatenating them.
+    The size of the blocks adapts to the speed of the upstream host: a block that is filled completely
+    doubles the next block, a block that is less than half filled halves it.
+    Bodies with a Content-Length are passed through as is or, if rechunk is set, re-chunked. Bodies without
+    a Content-Length are always chunked, so the connection with the player can be kept alive.
+    The body can also be copied to a tee while it is relayed, to store the segment without delaying the player.
+    """
+    MIN_BLOCK_SIZE = 16 * 1024
+    MAX_BLOCK_SIZE = 1024 * 1024
+    INITIAL_BLOCK_SIZE = 64 * 1024
+    CRLF = b'\r\n'
+    LAST_CHUNK = b'0\r\n\r\n'
+    CONNECTION_HEADERS = ['connection', 'keep-alive']
+
+    def __init__(self, rechunk: bool = False, maxBuffers: int = 8):
+        """
+        @param rechunk: send bodies with a Content-Length as chunked
+        @param maxBuffers: number of buffers kept for reuse
+        """
+        self.rechunk = rechunk
+        self.bufferPool = BufferPool(self.MAX_BLOCK_SIZE, maxBuffers)
+
+    def __next_block_size(self, blockSize: int, received: int) -> int:
+        if received >= blockSize:
+            return min(blockSize * 2, self.MAX_BLOCK_SIZE)
+        if received < blockSize // 2:
+            return max(blockSize // 2, self.MIN_BLOCK_SIZE)
+        return blockSize
+
+    @staticmethod
+    def send_vectored(request, buffers: typing.List[typing.Union[bytes, memoryview]]):
+        """
+        Write the buffers to the player in one system call if possible (scatter write).
+        Partial writes are continued with the remaining data.
+        @param request: the HTTPRequestHandler of the player
+        @param buffers: the buffers to send
+        @return:
+        """
+        sock = getattr(request, 'connection', None)
+        if sock is None or not hasattr(sock, 'sendmsg'):
+            for buffer in buffers:
+                request.wfile.write(buffer)
+            return
+        request.wfile.flush()
+        views = [memoryview(buffer) for buffer in buffers if len(buffer) > 0]
+        while views:
+            sent = sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if views and sent > 0:
+                views[0] = views[0][sent:]
+
+    def relay(self, response: HTTPResponse, request, tee: bytearray = None) -> int:
+        """
+        Send status, headers and body of the upstream response to the player
+        @param response: the response of the upstream host
+        @param request: the HTTPRequestHandler of the player
+        @param tee: if given, the body is appended to it as it is relayed
+        @return: number of body bytes relayed
+        """
+        chunked = False
+        contentLength = None
+        for header in response.headers:
+            value = response.headers[header]
+            if header.lower() == 'transfer-encoding' and value.lower() == 'chunked':
+                #  We don't know the length upfront
+                chunked = True
+            if header.lower() == 'content-length':
+                contentLength = int(value)
+        rechunk = not chunked and response.status not in (204, 304) and (self.rechunk or contentLength is None)
+        request.send_response(response.status)
+        for header in response.headers:
+            if header.lower() in self.CONNECTION_HEADERS:
+                continue  # the connection with the player is not the connection with the host
+            if header.lower() == 'content-length' and rechunk:
+                continue
+            request.send_header(header, response.headers[header])
+        if rechunk:
+            request.send_header('Transfer-Encoding', 'chunked')
+        request.end_headers()
+
+        if chunked:
+            return self.__relay_chunked(response, request, tee)
+        return self.__relay_fixed_length(response, request, contentLength, rechunk, tee)
+
+    def __relay_fixed_length(self, response: HTTPResponse, request, contentLength: typing.Optional[int],
+                             rechunk: bool, tee: typing.Optional[bytearray]) -> int:
+        # pylint: disable=too-many-arguments, too-many-positional-arguments
+        """
+        Relay a body with a Content-Length. Without a Content-Length (HTTP/1.0 host) the body is read
+        until the host closes the connection, it is sent chunked.
+        """
+        buffer = self.bufferPool.acquire()
+        lenProcessed = 0
+        try:
+            blockSize = self.INITIAL_BLOCK_SIZE
+            while contentLength is None or lenProcessed < contentLength:
+                toRead = blockSize if contentLength is None else min(blockSize, contentLength - lenProcessed)
+                received = response.readinto(buffer[:toRead])
+                if received == 0:
+                    if contentLength is None:
+                        break
+                    raise http.client.IncompleteRead(b'', contentLength - lenProcessed)
+                if tee is not None:
+                    tee += buffer[:received]
+                if rechunk:
+                    self.send_vectored(request, [b'%x\r\n' % received, buffer[:received], self.CRLF])
+                else:
+                    self.send_vectored(request, [buffer[:received]])
+                lenProcessed += received
+                blockSize = self.__next_block_size(blockSize, received)
+            if rechunk:
+                self.send_vectored(request, [self.LAST_CHUNK])
+        finally:
+            self.bufferPool.release(buffer)
+        response.close()
+        return lenProcessed
+
+    def __relay_chunked(self, response: HTTPResponse, request, tee: typing.Optional[bytearray]) -> int:
+        """
+        Pass the chunks through as received. The chunk header is read from the raw stream, the chunk
+        data is read with readinto() and sent in blocks, followed by the CRLF.
+        """
+        fp = response.fp
+        buffer = self.bufferPool.acquire()
+        lenProcessed = 0
+        try:
+            blockSize = self.INITIAL_BLOCK_SIZE
+            while True:
+                chunkHeader = fp.readline()
+                length = int(chunkHeader.split(b';', 1)[0], 16)
+                if length == 0:
+                    break
+                pieces = [chunkHeader]
+                remaining = length
+                while remaining > 0:
+                    received = fp.readinto(buffer[:min(blockSize, remaining)])
+                    if received == 0:
+                        raise http.client.IncompleteRead(b'', remaining)
+                    remaining -= received
+                    if tee is not None:
+                        tee += buffer[:received]
+                    pieces.append(buffer[:received])
+                    if remaining == 0:
+                        pieces.append(self.CRLF)
+                    self.send_vectored(request, pieces)
+                    pieces = []
+                    blockSize = self.__next_block_size(blockSize, received)
+                fp.readline()  # CRLF after the chunk data
+                lenProcessed += length
+            # Skip the (optional) trailers and the empty line ending the body, otherwise they
+            # will be seen as the start of the next response on the kept-alive connection
+            while fp.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            self.send_vectored(request, [self.LAST_CHUNK])
+        finally:
+            self.bufferPool.release(buffer)
+        response.close()
+        return lenProcessed
@@ -0,0 +1,128 @@
+"""
+Module with the framing of the calls of ProxyHelper to the service and their results
+"""
+import pickle
+import struct
+import typing
+import zlib
+
+VERSION = 1
+VERSION_HEADER = 'X-Rpc-Version'
+COMPRESSION_HEADER = 'X-Rpc-Compression'
+STREAM_HEADER = 'X-Rpc-Stream'
+CONTENT_TYPE = 'application/x-ziggo-rpc'
+COMPRESSION = 'zlib'
+COMPRESS_THRESHOLD = 256 * 1024
+
+_HEADER = struct.Struct('!BBI')  # version, flags, length of the payload
+_FLAG_ZLIB = 0x01
+_FLAG_END = 0x02
+_FLAG_ERROR = 0x04
+
+
+class FrameError(ValueError):
+    """
+    Raised when a frame cannot be decoded
+    """
+
+
+class StreamError(Exception):
+    """
+    Raised when the service sends an error frame in a stream: the method failed after the first frames were sent
+    """
+
+    def __init__(self, status: int, content: bytes):
+        super().__init__('Stream failed with status {0}'.format(status))
+        self.status = status
+        self.content = content
+
+
+def encode_frame(value: typing.Any, compress: bool = False, threshold: int = COMPRESS_THRESHOLD) -> bytes:
+    """
+    Pickle a value into a frame: a header with the version, the flags and the length of the payload,
+    followed by the payload
+    @param value: the value to send
+    @param compress: compress the payload with zlib if it is larger than threshold
+    @param threshold: minimum size in bytes of a payload to compress
+    @return: the frame
+    """
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    flags = 0
+    if compress and len(payload) >= threshold:
+        payload = zlib.compress(payload, 1)
+        flags |= _FLAG_ZLIB
+    return _HEADER.pack(VERSION, flags, len(payload)) + payload
+
+
+def decode_frame(frame: typing.Union[bytes, memoryview]) -> typing.Any:
+    """
+    Get the value from a frame
+    @param frame: the frame as created by encode_frame
+    @return: the value
+    """
+    if len(frame) < _HEADER.size:
+        raise FrameError('Frame too short: {0} bytes'.format(len(frame)))
+    version, flags, length = _HEADER.unpack_from(frame)
+    if version != VERSION:
+        raise FrameError('Unsupported frame version: {0}'.format(version))
+    payload = memoryview(frame)[_HEADER.size:]
+    if len(payload) != length:
+        raise FrameError('Frame length {0} does not match payload of {1} bytes'.format(length, len(payload)))
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
+
+
+def encode_end_frame() -> bytes:
+    """
+    Get the frame which ends a stream of frames
+    @return: the frame
+    """
+    return _HEADER.pack(VERSION, _FLAG_END, 0)
+
+
+def encode_error_frame(status: int, content: bytes) -> bytes:
+    """
+    Get the frame which reports the failure of the method of which the values were streamed
+    @param status: http status code of the failure
+    @param content: the content of the error response
+    @return: the frame
+    """
+    payload = pickle.dumps((status, content), protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(VERSION, _FLAG_ERROR, len(payload)) + payload
+
+
+def iter_frames(chunks: typing.Iterable[bytes]) -> typing.Iterator[typing.Any]:
+    """
+    Get the values from a stream of frames, each value as soon as its frame is complete. The stream is a
+    sequence of frames created by encode_frame, ended by the frame of encode_end_frame.
+    @param chunks: the body of the response in the pieces in which it is received
+    @return: iterator over the values
+    @raise StreamError: if the stream contains an error frame
+    @raise FrameError: if a frame cannot be decoded or the stream ends before the end frame
+    """
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    def fill(size: int):
+        while len(buffer) < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise FrameError('Stream ended after {0} of {1} bytes of a frame'.format(len(buffer), size))
+            buffer.extend(chunk)
+
+    while True:
+        fill(_HEADER.size)
+        version, flags, length = _HEADER.unpack_from(buffer)
+        if version != VERSION:
+            raise FrameError('Unsupported frame version: {0}'.format(version))
+        fill(_HEADER.size + length)
+        payload = bytes(buffer[_HEADER.size:_HEADER.size + length])
+        del buffer[:_HEADER.size + length]
+        if flags & _FLAG_END:
+            return
+        if flags & _FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        if flags & _FLAG_ERROR:
+            raise StreamError(*pickle.loads(payload))
+        yield pickle.loads(payload)
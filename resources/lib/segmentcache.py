@@ -0,0 +1,62 @@
+"""
+Module containing the on-disk cache of segments of replay, vod and recording streams
+"""
+import typing
+
+from resources.lib.filestore import FileStore
+from resources.lib.prefetcher import PrefetchedSegment
+
+
+class SegmentCache(FileStore):
+    """
+    Content-addressed cache of segments in a directory. The key is the upstream path of the segment without the
+    streaming token, the meta data of a file is the status and the headers.
+    The total size of the files is limited, when it is exceeded the least recently used files are removed.
+    """
+
+    def __init__(self, directory: str, maxBytes: int):
+        """
+        @param directory: directory for the cache files, created if it does not exist
+        @param maxBytes: max. total size of the files
+        """
+        self.hits = 0
+        self.misses = 0
+        super().__init__(directory, maxBytes)
+
+    def get(self, key: str) -> typing.Optional[PrefetchedSegment]:
+        """
+        Get a segment from the cache
+        @param key: upstream path of the segment without token
+        @return: the segment or None if not cached
+        """
+        stored = self.read(key)
+        with self.lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # The modification time keeps the order of use when the cache is loaded again
+        self.touch(key)
+        meta, body, _ = stored
+        return PrefetchedSegment(meta['status'], [tuple(header) for header in meta['headers']], body)
+
+    def put(self, key: str, segment: PrefetchedSegment):
+        """
+        Store a segment in the cache. Only complete (status 200) segments are stored.
+        @param key: upstream path of the segment without token
+        @param segment: the segment
+        @return:
+        """
+        if segment.status != 200:
+            return
+        self.write(key, {'status': segment.status, 'headers': segment.headers}, segment.body)
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the cache
+        @return: dict with hits, misses, stored and evicted segments and the size of the cache
+        """
+        statistics = super().statistics()
+        with self.lock:
+            statistics.update({'hits': self.hits, 'misses': self.misses})
+        return statistics
@@ -12,9 +12,11 @@ import xbmcgui
 import xbmcvfs
 
 from resources.lib.channel import SavedChannelsList
-from resources.lib.proxyserver import ProxyServer
+from resources.lib.lockprofile import LockProfile
+from resources.lib.proxyserver import ProxyServer, RpcServer
 from resources.lib.recording import SavedStateList
-from resources.lib.utils import Timer, SharedProperties, ServiceStatus, ProxyHelper, WebException, KodiLock, ZiggoKeyMap
+from resources.lib.utils import Timer, SharedProperties, ServiceStatus, ProxyHelper, WebException, KodiLock, \
+    ZiggoKeyMap, rpc_socket_path
 from resources.lib.webcalls import LoginSession
 
 
@@ -34,6 +36,8 @@ class HttpProxyService:
         self.isShutDown = True
         self.httpServerThread = None
         self.proxyServer: ProxyServer = None  # started by me
+        self.rpcServer: RpcServer = None
+        self.rpcServerThread = None
         self.settingsChangeLock = threading.Lock()
         xbmc.log("Proxy service initialized", xbmc.LOGDEBUG)
 
@@ -69,9 +73,33 @@ class HttpProxyService:
         self.httpServerThread = thread
         xbmc.log("ProxyService started listening on {0}-{1}".format(self.address,
                                                                     self.port), xbmc.LOGDEBUG)
+        if self.addon.getSettingBool('rpc-unix-socket'):
+            self.start_rpc_server()
+
+    def start_rpc_server(self):
+        """start the listener for the calls of ProxyHelper on a unix socket"""
+        socketPath = rpc_socket_path(self.PROFILE_FOLDER)
+        if socketPath is None or self.proxyServer is None:
+            return
+        try:
+            Path(self.PROFILE_FOLDER).mkdir(parents=True, exist_ok=True)
+            self.rpcServer = RpcServer(socketPath, self.proxyServer)
+        except OSError as exc:
+            xbmc.log('Cannot listen on {0}: {1}'.format(socketPath, exc), xbmc.LOGERROR)
+            self.rpcServer = None
+            return
+        self.rpcServerThread = threading.Thread(target=self.rpcServer.serve_forever)
+        self.rpcServerThread.start()
+        xbmc.log("ProxyService started listening on {0}".format(socketPath), xbmc.LOGDEBUG)
 
     def stop_http_server(self):
         """stop the http server"""
+        if self.rpcServer is not None:
+            self.rpcServer.shutdown()
+            self.rpcServerThread.join()
+            self.rpcServer.server_close()
+            self.rpcServer = None
+            self.rpcServerThread = None
         if self.proxyServer is not None:
             self.proxyServer.stop()
             xbmc.log("PROXY SERVER STOPPPED", xbmc.LOGDEBUG)
@@ -103,7 +131,8 @@ class ServiceMonitor(xbmc.Monitor):
     def __init__(self):
         super().__init__()
         #self.lock = threading.Lock()
-        self.lock = KodiLock()
+        sampling = int(self.ADDON.getSettingNumber('lock-profile-sampling'))
+        self.lock = KodiLock(LockProfile(sampling) if sampling > 0 else None)
 
         #  Start the HTTP Proxy server
         port = self.ADDON.getSettingNumber('proxy-port')
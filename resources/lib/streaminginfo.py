@@ -19,6 +19,7 @@ class StreamingInfo:
             self.isAdult = streamingJson['isAdult']
         self.token = None
         self.url = None
+        self.refreshInterval = None  # seconds, from the x-streaming-token-refresh-interval header
 
 
 @dataclasses.dataclass
@@ -0,0 +1,155 @@
+"""
+Module with the scheduler of the periodic work of the service, like refreshing the streaming tokens
+"""
+import math
+import threading
+import time
+import typing
+
+import xbmc
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: one thread runs the timers of all streams. A timer is kept in the slot of the tick in which
+    it expires, so scheduling and cancelling is O(1). The thread sleeps until the first tick with an expired timer
+    instead of waking up every tick, and ends when no timers are left; it is started again by the next schedule.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        """
+        @param tick: the resolution of the timers in seconds
+        @param slots: number of slots, timers expiring within slots ticks are found without looking at the others
+        """
+        self.tick = tick
+        self.slots = slots
+        self.condition = threading.Condition()
+        self.wheel: typing.List[typing.Dict[typing.Hashable, typing.Tuple[int, typing.Callable]]] = \
+            [{} for _ in range(slots)]
+        self.timers: typing.Dict[typing.Hashable, int] = {}  # key -> tick in which it expires
+        self.origin = time.monotonic()
+        self.current = 0  # the timers up to and including this tick have run
+        self.thread: threading.Thread = None
+        self.closed = False
+        self.scheduled = 0
+        self.fired = 0
+        self.wakeups = 0
+        self.threads = 0
+
+    def __now(self) -> int:
+        return int((time.monotonic() - self.origin) / self.tick)
+
+    def __remove(self, key) -> bool:
+        due = self.timers.pop(key, None)
+        if due is None:
+            return False
+        del self.wheel[due % self.slots][key]
+        return True
+
+    def schedule(self, key: typing.Hashable, delay: float, callback: typing.Callable[[], None]):
+        """
+        Run a function after a delay. A timer with the same key is replaced.
+        @param key: identifies the timer, e.g. the id of the stream
+        @param delay: seconds from now
+        @param callback: the function, called without arguments by the thread of the wheel
+        @return:
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.__remove(key)
+            due = max(math.ceil((time.monotonic() + delay - self.origin) / self.tick), self.current + 1)
+            self.wheel[due % self.slots][key] = (due, callback)
+            self.timers[key] = due
+            self.scheduled += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run, name='TimerWheel', daemon=True)
+                self.threads += 1
+                self.thread.start()
+            else:
+                self.condition.notify()
+
+    def cancel(self, key: typing.Hashable) -> bool:
+        """
+        Cancel a timer
+        @param key: the key used to schedule it
+        @return: True if the timer was scheduled
+        """
+        with self.condition:
+            removed = self.__remove(key)
+            if removed:
+                self.condition.notify()
+            return removed
+
+    def __next_due(self) -> int:
+        for due in range(self.current + 1, self.current + self.slots + 1):
+            for timerDue, _ in self.wheel[due % self.slots].values():
+                if timerDue == due:
+                    return due
+        # Only timers more than one revolution ahead
+        return min(self.timers.values())
+
+    def __expired(self, now: int) -> typing.List[typing.Callable]:
+        expired = []
+        for due in range(self.current + 1, min(now, self.current + self.slots) + 1):
+            slot = self.wheel[due % self.slots]
+            for key, (timerDue, callback) in list(slot.items()):
+                if timerDue <= now:
+                    del slot[key]
+                    del self.timers[key]
+                    expired.append(callback)
+        self.current = now
+        return expired
+
+    def __run(self):
+        with self.condition:
+            while not self.closed and self.timers:
+                delay = self.origin + self.__next_due() * self.tick - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    self.wakeups += 1
+                    continue
+                expired = self.__expired(self.__now())
+                self.fired += len(expired)
+                self.condition.release()
+                try:
+                    for callback in expired:
+                        try:
+                            callback()
+                        # pylint: disable=broad-exception-caught
+                        except Exception as exc:
+                            xbmc.log('TimerWheel callback failed: {0}'.format(exc), xbmc.LOGERROR)
+                finally:
+                    self.condition.acquire()
+            self.thread = None
+
+    def close(self):
+        """
+        Cancel all timers and stop the thread
+        @return:
+        """
+        with self.condition:
+            self.closed = True
+            self.timers.clear()
+            for slot in self.wheel:
+                slot.clear()
+            thread = self.thread
+            self.condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the wheel
+        @return: dict with the number of timers, running threads, timers scheduled and fired and the wakeups
+        """
+        with self.condition:
+            return {
+                'timers': len(self.timers),
+                'threads': 0 if self.thread is None else 1,
+                'threadsStarted': self.threads,
+                'scheduled': self.scheduled,
+                'fired': self.fired,
+                'wakeups': self.wakeups
+            }
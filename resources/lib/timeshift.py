@@ -0,0 +1,186 @@
+"""
+Module containing the time-shift buffer of live channels
+"""
+import collections
+import mmap
+import os
+import threading
+import time
+import typing
+from pathlib import Path
+
+import xbmc
+
+from resources.lib.mpd import SegmentTemplate, extend_timelines, segment_templates_from_manifest
+from resources.lib.prefetcher import PrefetchedSegment
+
+
+class BufferedSegment:
+    """
+    Location of a segment in the ring buffer
+    """
+    # pylint: disable=too-few-public-methods, too-many-arguments, too-many-positional-arguments
+    def __init__(self, offset: int, length: int, headers: typing.List[typing.Tuple[str, str]],
+                 timelineKey: typing.Optional[typing.Tuple[str, str, int]], added: float):
+        self.offset = offset
+        self.length = length
+        self.headers = headers
+        self.timelineKey = timelineKey
+        self.added = added
+
+
+class TimeShiftBuffer:
+    """
+    Ring buffer recording the segments of a live channel while it is played. The segments are stored in a
+    memory-mapped file of a fixed size, so the buffer does not use memory of the Python heap. Segments are
+    removed when they are overwritten or when they are older than the window.
+    The live manifest is rewritten to make the buffered segments available to the player, which allows
+    pausing and seeking back further than the window of the CDN.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, filename: str, windowSeconds: float, maxBytes: int):
+        """
+        @param filename: file for the ring buffer, created with a size of maxBytes
+        @param windowSeconds: max. age of the segments in the buffer
+        @param maxBytes: size of the ring buffer
+        """
+        self.filename = filename
+        self.windowSeconds = windowSeconds
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.segments: typing.OrderedDict[str, BufferedSegment] = collections.OrderedDict()
+        self.timelines: typing.Dict[typing.Tuple[str, str], typing.Dict[int, int]] = {}
+        self.templates: typing.List[SegmentTemplate] = []
+        self.writeOffset = 0
+        self.hits = 0
+        self.misses = 0
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        with open(filename, 'wb') as file:
+            file.truncate(maxBytes)
+        self.file = open(filename, 'r+b')  # pylint: disable=consider-using-with
+        self.buffer = mmap.mmap(self.file.fileno(), maxBytes)
+
+    def __timeline_key(self, path: str) -> typing.Optional[typing.Tuple[str, str, int]]:
+        for template in self.templates:
+            entry = template.timeline_entry(path)
+            if entry is not None:
+                segmentTime, duration = entry
+                self.timelines.setdefault((template.media, template.representationId), {})[segmentTime] = duration
+                return template.media, template.representationId, segmentTime
+        return None
+
+    def __remove(self, path: str):
+        segment = self.segments.pop(path)
+        if segment.timelineKey is not None:
+            media, representationId, segmentTime = segment.timelineKey
+            timeline = self.timelines.get((media, representationId), {})
+            timeline.pop(segmentTime, None)
+
+    def __expire(self, now: float):
+        while self.segments:
+            path, oldest = next(iter(self.segments.items()))
+            if now - oldest.added <= self.windowSeconds:
+                break
+            self.__remove(path)
+
+    def __contains__(self, path: str):
+        with self.lock:
+            return path in self.segments
+
+    def update_manifest(self, manifest: bytes, templates: typing.List[SegmentTemplate] = None) -> bytes:
+        """
+        Update the segment templates from the live manifest and add the buffered segments to it
+        @param manifest: content of the manifest from the host
+        @param templates: the segment templates if already extracted from the manifest
+        @return: the rewritten manifest
+        """
+        if templates is None:
+            try:
+                templates = segment_templates_from_manifest(manifest)
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                xbmc.log('TimeShiftBuffer could not parse manifest: {0}'.format(exc), xbmc.LOGERROR)
+                return manifest
+        with self.lock:
+            self.templates = templates
+            self.__expire(time.monotonic())
+            if not self.segments:
+                return manifest
+            bufferedSeconds = time.monotonic() - next(iter(self.segments.values())).added
+            timelines = {key: dict(timeline) for key, timeline in self.timelines.items()}
+        return extend_timelines(manifest, timelines, bufferedSeconds)
+
+    def put(self, path: str, segment: PrefetchedSegment):
+        """
+        Store a segment in the ring buffer
+        @param path: path requested by the player
+        @param segment: the segment
+        @return:
+        """
+        length = len(segment.body)
+        if segment.status != 200 or length > self.maxBytes:
+            return
+        with self.lock:
+            if self.buffer.closed or path in self.segments:
+                return
+            now = time.monotonic()
+            self.__expire(now)
+            if self.writeOffset + length > self.maxBytes:
+                # Wrap around, the segments at the end of the buffer are the oldest
+                for oldPath in [key for key, value in self.segments.items() if value.offset >= self.writeOffset]:
+                    self.__remove(oldPath)
+                self.writeOffset = 0
+            while self.segments:
+                oldPath, oldest = next(iter(self.segments.items()))
+                if oldest.offset >= self.writeOffset + length or oldest.offset + oldest.length <= self.writeOffset:
+                    break
+                self.__remove(oldPath)
+            self.buffer[self.writeOffset:self.writeOffset + length] = segment.body
+            self.segments[path] = BufferedSegment(self.writeOffset, length, segment.headers,
+                                                  self.__timeline_key(path), now)
+            self.writeOffset += length
+
+    def get(self, path: str) -> typing.Optional[PrefetchedSegment]:
+        """
+        Get a segment from the ring buffer
+        @param path: path requested by the player
+        @return: the segment or None if it is not buffered
+        """
+        with self.lock:
+            segment = self.segments.get(path)
+            if segment is None or self.buffer.closed:
+                self.misses += 1
+                return None
+            self.hits += 1
+            body = self.buffer[segment.offset:segment.offset + segment.length]
+        return PrefetchedSegment(200, segment.headers, body)
+
+    def close(self):
+        """
+        Release the ring buffer and remove its file
+        @return:
+        """
+        with self.lock:
+            self.segments.clear()
+            self.timelines.clear()
+            if not self.buffer.closed:
+                self.buffer.close()
+                self.file.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+    def statistics(self) -> dict:
+        """
+        Get the counters of the buffer
+        @return: dict with hits, misses, number of segments and bytes buffered
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'segments': len(self.segments),
+                'bytes': sum(segment.length for segment in self.segments.values())
+            }
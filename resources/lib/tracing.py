@@ -0,0 +1,242 @@
+"""
+Module with the tracing of the calls of ProxyHelper: the time spent in the parts of a call is recorded in spans,
+the traces of the recent calls are kept
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+
+TRACE_HEADER = 'X-Trace-Id'
+DURATION_HEADER = 'X-Trace-Duration'  # milliseconds the service spent on the call
+
+
+def new_trace_id() -> str:
+    """
+    Get an id for a new trace
+    @return: the id
+    """
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """
+    The spans of one call
+    """
+
+    def __init__(self, traceId: str, name: str, start: float = None):
+        self.traceId = traceId
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.wallStart = time.time() - (time.perf_counter() - self.start)
+        self.end = None
+        self.thread = threading.get_ident()
+        self.spans: typing.List[tuple] = []  # (name, start, end, thread, url)
+
+    def add_span(self, name: str, start: float, end: float, url: str = None):
+        """
+        Add a span measured by the caller
+        @param name: the name of the span
+        @param start: time.perf_counter() at the start
+        @param end: time.perf_counter() at the end
+        @param url: the url of an upstream request, only its path is kept
+        @return:
+        """
+        self.spans.append((name, start, end, threading.get_ident(), url))
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration of the trace in seconds, up to now if it did not end yet
+        @return:
+        """
+        return (time.perf_counter() if self.end is None else self.end) - self.start
+
+    def to_dict(self) -> dict:
+        """
+        Get the trace as it is shown by /debug/traces, times in milliseconds
+        @return:
+        """
+        spans = []
+        for name, start, end, thread, url in self.spans:
+            span = {'name': name,
+                    'start': round((start - self.start) * 1000, 3),
+                    'duration': round((end - start) * 1000, 3),
+                    'thread': thread}
+            if url is not None:
+                span['path'] = urlparse(url).path
+            spans.append(span)
+        return {'id': self.traceId,
+                'name': self.name,
+                'time': self.wallStart,
+                'duration': round(self.duration * 1000, 3),
+                'spans': spans}
+
+
+class Span:
+    """
+    Context manager which adds the time spent in its block as a span to a trace
+    """
+    def __init__(self, trace: Trace, name: str, url: str = None):
+        self.trace = trace
+        self.name = name
+        self.url = url
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.trace.add_span(self.name, self.start, time.perf_counter(), self.url)
+
+
+class _NoSpan:
+    """
+    Context manager used when nothing is traced, cheaper than contextlib.nullcontext
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Keeps the traces of the recent calls in a ring buffer. A trace is started by the thread handling a call,
+    spans are added to the trace of the current thread. When tracing is disabled, span() returns a shared
+    context manager which does nothing.
+    """
+    MAX_TRACES = 200
+
+    def __init__(self, maxTraces: int = MAX_TRACES):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.traces: typing.Deque[Trace] = deque(maxlen=maxTraces)
+        self.local = threading.local()
+
+    def configure(self, enabled: bool, maxTraces: int = None):
+        """
+        Enable or disable tracing
+        @param enabled:
+        @param maxTraces: number of traces kept, default the current number
+        @return:
+        """
+        with self.lock:
+            self.enabled = enabled
+            if maxTraces is not None and maxTraces != self.traces.maxlen:
+                self.traces = deque(self.traces, maxlen=maxTraces)
+
+    def begin(self, name: str, traceId: str = None, start: float = None) -> typing.Optional[Trace]:
+        """
+        Start the trace of a call in the current thread
+        @param name: the name of the call, e.g. the qualified name of the method
+        @param traceId: the id received from the caller, or None for a new id
+        @param start: time.perf_counter() at which the call was received, default now
+        @return: the trace, or None if tracing is disabled
+        """
+        if not self.enabled:
+            return None
+        trace = Trace(traceId or new_trace_id(), name, start)
+        self.local.trace = trace
+        return trace
+
+    def finish(self, trace: typing.Optional[Trace]):
+        """
+        End the trace of a call and keep it
+        @param trace: the trace returned by begin
+        @return:
+        """
+        if trace is None:
+            return
+        trace.end = time.perf_counter()
+        self.local.trace = None
+        with self.lock:
+            self.traces.append(trace)
+
+    def current(self) -> typing.Optional[Trace]:
+        """
+        Get the trace of the current thread
+        @return: the trace, or None
+        """
+        if not self.enabled:
+            return None
+        return getattr(self.local, 'trace', None)
+
+    @contextlib.contextmanager
+    def attach(self, trace: typing.Optional[Trace]):
+        """
+        Add the spans of the current thread to a trace of another thread, e.g. for the calls of a batch
+        @param trace: the trace, or None
+        @return:
+        """
+        previous = getattr(self.local, 'trace', None)
+        self.local.trace = trace
+        try:
+            yield trace
+        finally:
+            self.local.trace = previous
+
+    def span(self, name: str, url: str = None):
+        """
+        Get a context manager which adds the time spent in its block to the trace of the current thread
+        @param name: the name of the span
+        @param url: the url of an upstream request, its path is added when the trace is shown
+        @return: the context manager
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        trace = getattr(self.local, 'trace', None)
+        if trace is None:
+            return _NO_SPAN
+        return Span(trace, name, url)
+
+    def recent(self) -> typing.List[dict]:
+        """
+        Get the kept traces, the most recent first
+        @return: list of Trace.to_dict
+        """
+        with self.lock:
+            traces = list(self.traces)
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def chrome_trace(self) -> dict:
+        """
+        Get the kept traces in the Trace Event Format of chrome://tracing and Perfetto
+        @return: dict to dump as json
+        """
+        with self.lock:
+            traces = list(self.traces)
+        pid = os.getpid()
+        events = []
+        for trace in traces:
+            events.append({'name': trace.name, 'cat': 'rpc', 'ph': 'X', 'pid': pid, 'tid': trace.thread,
+                           'ts': trace.start * 1e6, 'dur': trace.duration * 1e6, 'args': {'trace': trace.traceId}})
+            for name, start, end, thread, url in trace.spans:
+                args = {'trace': trace.traceId}
+                if url is not None:
+                    args['path'] = urlparse(url).path
+                events.append({'name': name, 'cat': 'span', 'ph': 'X', 'pid': pid, 'tid': thread,
+                               'ts': start * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path: str):
+        """
+        Write the kept traces to a file for chrome://tracing
+        @param path: the path of the file
+        @return:
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.chrome_trace(), file)
+
+
+TRACER = Tracer()
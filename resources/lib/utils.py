@@ -1,21 +1,25 @@
 """
 module with utility functions
 """
-import base64
+# pylint: disable=too-many-lines
 import os
 import shutil
+import socket
 import sys
 import binascii
+import functools
 import inspect
 import traceback
 from datetime import datetime, timedelta, timezone
 from enum import IntEnum
 import threading
 import time
-from typing import Any
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, List, Tuple
 import json
-import pickle
 import uuid
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from http.client import HTTPConnection, HTTPException, RemoteDisconnected
 import requests
 
 import xbmc
@@ -23,6 +27,10 @@ import xbmcaddon
 import xbmcgui
 import xbmcvfs
 from requests import Response
+from requests.adapters import HTTPAdapter
+from resources.lib import changefeed, rpcframing, tracing
+from resources.lib.globals import G
+from resources.lib.lockprofile import LockProfile, call_site
 
 
 def hexlify(barr):
@@ -118,6 +126,18 @@ class SharedProperties:
         """get the uuid"""
         return self.window.getProperty(self.addon.getAddonInfo('id') + 'UUID')
 
+    def set_change_position(self, name: str, feedId: str, version: int):
+        """store the position in the change feed of the service reached by a ChangeTracker"""
+        self.window.setProperty(self.addon.getAddonInfo('id') + 'Changes.' + name, '{0}:{1}'.format(feedId, version))
+
+    def get_change_position(self, name: str) -> Tuple[str, int]:
+        """get the position in the change feed of the service reached by a ChangeTracker, or (None, 0)"""
+        position = self.window.getProperty(self.addon.getAddonInfo('id') + 'Changes.' + name)
+        if ':' not in position:
+            return None, 0
+        feedId, version = position.split(':', 1)
+        return feedId, int(version)
+
     def get_kodi_version_major(self) -> int:
         """return the major version number of Kodi"""
         return int(self.kodiVersionMajor)
@@ -222,24 +242,19 @@ class Timer(threading.Thread):
     """
 
     def __init__(self, interval, callback_function=None):
-        self.timerRuns = threading.Event()
-        self.timerRuns.set()
+        self.timerStopped = threading.Event()
         self.interval = interval
         self.callbackFunction = callback_function
         super().__init__()
 
     def run(self):
-        expiredSecs = 0
-        while self.timerRuns.is_set():
-            time.sleep(1)
-            expiredSecs += 1
-            if expiredSecs >= self.interval:
-                self.timer()
-                expiredSecs = 0
+        # Sleep the whole interval, stop() wakes the thread up
+        while not self.timerStopped.wait(self.interval):
+            self.timer()
 
     def stop(self):
         """stop the timer"""
-        self.timerRuns.clear()
+        self.timerStopped.set()
         self.join()
 
     def timer(self):
@@ -336,17 +351,334 @@ class WebException(Exception):
         return self._response.status_code
 
 
-class ProxyHelper:
+def rpc_socket_path(profileFolder: str) -> str:
+    """
+    Get the path of the unix socket on which the service listens for the calls of ProxyHelper
+    @param profileFolder: the profile folder of the addon
+    @return: the path, or None if unix sockets are not available (Windows) or the path is too long
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = os.path.join(profileFolder, G.RPC_SOCKET)
+    if len(path.encode('utf-8')) > 100:  # sun_path is 104 or 108 bytes
+        return None
+    return path
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    HTTPConnection to a server listening on a unix socket
+    """
+
+    def __init__(self, socketPath: str, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socketPath)
+
+
+class RpcClient:
+    """
+    HTTP client for the calls of ProxyHelper to the service. One instance is shared by all ProxyHelpers of the
+    process, its connections to the proxy are kept alive and reused by the next call, also from other threads.
+    """
+    POOL_SIZE = 8
+    _INSTANCE = None
+    _INSTANCE_LOCK = threading.Lock()
+
+    def __init__(self, poolSize: int = POOL_SIZE):
+        self.poolSize = poolSize
+        self.session = requests.Session()
+        self.session.trust_env = False  # the proxy is local, skip the lookup of proxy settings in the environment
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=poolSize, pool_block=False))
+        self.unixLock = threading.Lock()
+        self.unixConnections: List[UnixHTTPConnection] = []  # idle connections
+
+    @classmethod
+    def instance(cls) -> 'RpcClient':
+        """
+        Get the instance shared by the process
+        @return: the RpcClient
+        """
+        with cls._INSTANCE_LOCK:
+            if cls._INSTANCE is None:
+                cls._INSTANCE = RpcClient()
+            return cls._INSTANCE
+
+    def get(self, url: str, params=None, timeout=None) -> Response:
+        """
+        Send a GET request over a kept-alive connection
+        @param url:
+        @param params: query parameters
+        @param timeout: seconds
+        @return: the response
+        """
+        return self.session.get(url, params=params, timeout=timeout)
+
+    def post(self, url: str, data: bytes, headers: dict = None, timeout=None) -> Response:
+        """
+        Send a POST request over a kept-alive connection
+        @param url:
+        @param data: the body
+        @param headers: extra headers
+        @param timeout: seconds
+        @return: the response
+        """
+        return self.session.post(url, data=data, headers=headers, timeout=timeout)
+
+    def post_stream(self, url: str, data: bytes, headers: dict = None, timeout=None) -> 'RpcStream':
+        """
+        Send a POST request over a kept-alive connection, the body of the response is read while it is received
+        @param url:
+        @param data: the body
+        @param headers: extra headers
+        @param timeout: seconds
+        @return: the response
+        """
+        response = self.session.post(url, data=data, headers=headers, timeout=timeout, stream=True)
+        if response.status_code != 200:
+            return RpcStream(response.status_code, response.content)
+        # The connection is reused when the body was read completely, otherwise it is closed
+        return RpcStream(200, chunks=response.iter_content(chunk_size=None), release=lambda _: response.close())
+
+    def post_unix(self, socketPath: str, path: str, data: bytes, headers: dict = None, timeout=None):
+        """
+        Send a POST request over a kept-alive connection to a unix socket
+        @param socketPath: the path of the socket
+        @param path: the path of the request
+        @param data: the body
+        @param headers: extra headers
+        @param timeout: seconds
+        @return: the response with status_code, content and headers like a requests.Response
+        @raise OSError: if no connection can be made
+        """
+        connection, response = self.__request_unix(socketPath, path, data, headers, timeout)
+        try:
+            content = response.read()
+        except (OSError, HTTPException):
+            connection.close()
+            raise
+        self.__release_unix(connection, response)
+        return SimpleNamespace(status_code=response.status, content=content, headers=dict(response.getheaders()))
+
+    def post_unix_stream(self, socketPath: str, path: str, data: bytes, headers: dict = None,
+                         timeout=None) -> 'RpcStream':
+        """
+        Send a POST request over a kept-alive connection to a unix socket, the body of the response is read while
+        it is received
+        @param socketPath: the path of the socket
+        @param path: the path of the request
+        @param data: the body
+        @param headers: extra headers
+        @param timeout: seconds
+        @return: the response
+        @raise OSError: if no connection can be made
+        """
+        connection, response = self.__request_unix(socketPath, path, data, headers, timeout)
+        if response.status != 200:
+            content = response.read()
+            self.__release_unix(connection, response)
+            return RpcStream(response.status, content)
+
+        def release(reuse: bool):
+            if reuse:
+                self.__release_unix(connection, response)
+            else:
+                connection.close()
+
+        return RpcStream(200, chunks=iter(functools.partial(response.read1, 64 * 1024), b''), release=release)
+
+    def __request_unix(self, socketPath: str, path: str, data: bytes, headers: dict, timeout):
+        connection = self.__idle_connection(socketPath)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = UnixHTTPConnection(socketPath, timeout=timeout)
+            try:
+                connection.request('POST', path, body=data, headers=headers or {})
+                return connection, connection.getresponse()
+            except (RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if not reused:
+                    raise
+                # The service closed the idle connection, send the request once more on a new one
+                connection = None
+                reused = False
+            except (OSError, HTTPException):
+                connection.close()
+                raise
+
+    def __release_unix(self, connection: UnixHTTPConnection, response):
+        """
+        Keep the connection for the next request, the response must have been read
+        """
+        if response.will_close:
+            connection.close()
+            return
+        with self.unixLock:
+            if len(self.unixConnections) < self.poolSize:
+                self.unixConnections.append(connection)
+                return
+        connection.close()
+
+    def __idle_connection(self, socketPath: str):
+        with self.unixLock:
+            while self.unixConnections:
+                connection = self.unixConnections.pop()
+                if connection.socketPath == socketPath:
+                    return connection
+                connection.close()
+        return None
+
+    def close(self):
+        """
+        Close the connections
+        @return:
+        """
+        self.session.close()
+        with self.unixLock:
+            for connection in self.unixConnections:
+                connection.close()
+            self.unixConnections.clear()
+
+
+class RpcStream:
+    """
+    Response of the service of which the body is read in the chunks in which it is received
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, status: int, content: bytes = b'', chunks: Iterator[bytes] = None,
+                 release: Callable[[bool], None] = None):
+        """
+        @param status: http status code
+        @param content: the body of an error response
+        @param chunks: the body of a successful response
+        @param release: function called with True to keep the connection for the next request, with False to
+        close it
+        """
+        self.status_code = status  # pylint: disable=invalid-name
+        self.content = content
+        self.chunks = chunks if chunks is not None else iter(())
+        self.release = release
+
+    def close(self, reuse: bool = False):
+        """
+        Close the response
+        @param reuse: the body was read up to its end, so the connection can be used for the next request
+        @return:
+        """
+        if self.release is None:
+            return
+        if reuse:
+            for _ in self.chunks:  # the end of the chunked body
+                pass
+        self.release(reuse)
+        self.release = None
+
+
+class ProxyHelper:  # pylint: disable=too-many-instance-attributes
     """
     class with functions to call function of LoginSession via the http-proxy
     """
 
+    RPC_HEADERS = {
+        'Content-Type': rpcframing.CONTENT_TYPE,
+        rpcframing.VERSION_HEADER: str(rpcframing.VERSION)
+    }
+    UNIX_RETRY_INTERVAL = 30  # seconds before the unix socket is tried again after a failed connect
+
     # pylint: disable=too-few-public-methods
     def __init__(self, addon: xbmcaddon.Addon):
         self.port = addon.getSetting('proxy-port')
         self.ip = addon.getSetting('proxy-ip')
         self.host = 'http://{0}:{1}/'.format(self.ip, self.port)
         self.dataTimeout = addon.getSettingNumber('data-timeout')
+        self.client = RpcClient.instance()
+        # Over the loopback interface compressing large results costs more time than it saves
+        self.compressResults = False
+        self.socketPath = None
+        if addon.getSettingBool('rpc-unix-socket'):
+            self.socketPath = rpc_socket_path(xbmcvfs.translatePath(addon.getAddonInfo('profile')))
+        self.unixFailedAt = 0.0
+        self.tracing = addon.getSettingBool('rpc-tracing')
+
+    def __getstate__(self):
+        # A ProxyHelper is pickled with the AvStream returned to the UI, it uses the client of the receiving process
+        state = self.__dict__.copy()
+        del state['client']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client = RpcClient.instance()
+
+    def __post(self, function: str, value: Any, timeout: float = None, stream: bool = False,
+               traceId: str = None):
+        # pylint: disable=too-many-arguments, too-many-positional-arguments
+        """
+        Send a value in a frame to /function
+        @param function: the qualified name of the function, batch or changes
+        @param value: the named arguments or the list of calls
+        @param timeout: seconds to wait for the result, default the data-timeout setting
+        @param stream: ask for the values of a streamed function in a frame each
+        @param traceId: the id under which the service traces the call, or None
+        @return: the response, an RpcStream if stream is set
+        """
+        timeout = self.dataTimeout if timeout is None else timeout
+        headers = self.RPC_HEADERS
+        if self.compressResults or stream or traceId is not None:
+            headers = dict(headers)
+        if self.compressResults:
+            headers[rpcframing.COMPRESSION_HEADER] = rpcframing.COMPRESSION
+        if stream:
+            headers[rpcframing.STREAM_HEADER] = '1'
+        if traceId is not None:
+            headers[tracing.TRACE_HEADER] = traceId
+        path = 'function/{function}'.format(function=function)
+        data = rpcframing.encode_frame(value, compress=self.compressResults)
+        response = None
+        if self.socketPath is not None and time.monotonic() - self.unixFailedAt > self.UNIX_RETRY_INTERVAL:
+            post = self.client.post_unix_stream if stream else self.client.post_unix
+            try:
+                response = post(self.socketPath, '/' + path, data=data, headers=headers, timeout=timeout)
+            except (FileNotFoundError, ConnectionRefusedError) as exc:
+                # The service does not listen on the socket (yet), use the http-proxy for a while
+                xbmc.log('RPC via {0} not available: {1}'.format(self.socketPath, exc), xbmc.LOGDEBUG)
+                self.unixFailedAt = time.monotonic()
+        if response is None:
+            post = self.client.post_stream if stream else self.client.post
+            response = post(url=self.host + path, data=data, headers=headers, timeout=timeout)
+        if response.status_code != 200:
+            raise WebException(response)
+        return response
+
+    def __post_frame(self, function: str, value: Any, timeout: float = None) -> Any:
+        """
+        Send a value in a frame to /function and return the value in the frame received
+        @param function: the qualified name of the function, batch or changes
+        @param value: the named arguments or the list of calls
+        @param timeout: seconds to wait for the result, default the data-timeout setting
+        @return: the value returned
+        """
+        if not self.tracing:
+            return rpcframing.decode_frame(self.__post(function, value, timeout).content)
+        traceId = tracing.new_trace_id()
+        start = time.perf_counter()
+        response = self.__post(function, value, timeout, traceId=traceId)
+        received = time.perf_counter()
+        result = rpcframing.decode_frame(response.content)
+        end = time.perf_counter()
+        # The time of the service is in the response, the rest is spent on the way or waiting for a thread
+        service = float(response.headers.get(tracing.DURATION_HEADER, 0))
+        xbmc.log('RPC {0} trace {1}: {2:.1f}ms, service {3:.1f}ms, transfer and queueing {4:.1f}ms, '
+                 'decode {5:.1f}ms'.format(function, traceId, (end - start) * 1000, service,
+                                           (received - start) * 1000 - service, (end - received) * 1000),
+                 xbmc.LOGDEBUG)
+        return result
 
     def dynamic_call(self, method, **kwargs) -> Any:
         """
@@ -354,30 +686,28 @@ class ProxyHelper:
         If successful, the response will be the response from the called function.
         On failure, a WebException will be raised, which contains the response from
         the server.
+        The named arguments and the response are sent as frames in the body (see rpcframing).
 
         method: the function to be called e.g. LoginSession.login
         kwargs: the named arguments of the function to be called.
 
         example: helper.dynamicCall(LoginSession.login,username='a',password='b'
         """
+        return self.dynamic_call_with(method, kwargs)
+
+    def dynamic_call_with(self, method, arguments: dict, timeout: float = None) -> Any:
+        """
+        Helper function to call a function in the service which is running, like dynamic_call, with the named
+        arguments in a dict and a timeout for this call.
+
+        method: the function to be called e.g. LoginSession.obtain_asset_details
+        arguments: the named arguments of the function to be called
+        timeout: seconds to wait for the result, default the data-timeout setting
+
+        example: helper.dynamic_call_with(LoginSession.obtain_asset_details, {'assetId': 'a'}, timeout=10)
+        """
         try:
-            if kwargs is None:
-                arguments = {}
-            else:
-                arguments = kwargs
-            response = requests.get(
-                url=self.host + 'function/{method}'.format(method=method.__qualname__),
-                params={'args': base64.b64encode(pickle.dumps(arguments))},
-                timeout=self.dataTimeout)
-            if response.status_code != 200:
-                raise WebException(response)
-            contentType = response.headers.get('content-type')
-            if contentType == 'text/html':
-                return response.content
-            if contentType == 'application/octet-stream':
-                result = pickle.loads(response.content)
-                return result
-            return None
+            return self.__post_frame(method.__qualname__, arguments if arguments is not None else {}, timeout)
         except WebException as exc:
             raise exc
         # pylint: disable=broad-exception-caught
@@ -386,42 +716,360 @@ class ProxyHelper:
             xbmc.log(traceback.format_exc(), xbmc.LOGDEBUG)
             raise exc
 
+    def dynamic_stream(self, method, **kwargs) -> Iterator[Any]:
+        """
+        Helper function to call a function in the service which returns its result in parts, e.g.
+        LoginSession.stream_events. The iterator returns each part as soon as it is received, so it can be
+        processed while the service still receives the next ones and the complete result is never in memory.
+        The call is made when the first part is requested. On failure, also after the first parts,
+        a WebException will be raised, which contains the response from the server.
+
+        method: the streamed function to be called e.g. LoginSession.stream_events
+        kwargs: the named arguments of the function to be called.
+
+        example: for entry in helper.dynamic_stream(LoginSession.stream_events, startTime='20240101000000'):
+        """
+        response = self.__post(method.__qualname__, kwargs, stream=True)
+        completed = False
+        try:
+            yield from rpcframing.iter_frames(response.chunks)
+            completed = True
+        except rpcframing.StreamError as exc:
+            raise WebException(SimpleNamespace(status_code=exc.status, content=exc.content)) from exc
+        finally:
+            response.close(reuse=completed)
+
+    def dynamic_batch(self, calls: List[Tuple[Callable, dict]]) -> List[Any]:
+        """
+        Helper function to call several functions in the service in one request. Consecutive calls of
+        read only methods of LoginSession are executed concurrently by the service, the others in order.
+        The result contains for each call the response from the called function, or the WebException
+        of a failed call (it is not raised).
+
+        calls: list of (function, named arguments) e.g. [(LoginSession.get_channels, {})]
+
+        example: channels, entitlements = helper.dynamic_batch([(LoginSession.get_channels, {}),
+                                                                (LoginSession.get_entitlements, {})])
+        """
+        arguments = [(method.__qualname__, kwargs if kwargs is not None else {}) for method, kwargs in calls]
+        try:
+            results = []
+            for status, result in self.__post_frame('batch', arguments):
+                if status == 200:
+                    results.append(result)
+                else:
+                    results.append(WebException(SimpleNamespace(status_code=status, content=result)))
+            return results
+        except WebException as exc:
+            raise exc
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            xbmc.log('Exception during dynamic batch: {0} {1}'.format([name for name, _ in arguments], exc),
+                     xbmc.LOGERROR)
+            xbmc.log(traceback.format_exc(), xbmc.LOGDEBUG)
+            raise exc
+
+    def wait_for_changes(self, since: int, feedId: str = None, timeout: float = 0) -> dict:
+        """
+        Get the events of the change feed of the service after a version, waiting for them at most timeout
+        seconds (long-poll).
+
+        since: the last version seen
+        feedId: the feed id received before, another id means that the service was restarted
+        timeout: seconds to wait when there are no events yet
+
+        example: result = helper.wait_for_changes(0, None)
+                 result = helper.wait_for_changes(result['version'], result['feed'], timeout=30)
+        """
+        return self.__post_frame('changes', {'since': since, 'feedId': feedId, 'timeout': timeout},
+                                 timeout=timeout + self.dataTimeout)
+
+
+class AsyncProxyHelper:
+    """
+    Helper to call many functions of the service at once, e.g. to load the details of all items of a window.
+    The calls run on a bounded pool of threads sharing the connections of the RpcClient and return a Future.
+    Calls which did not start yet are cancelled by cancel(), a call which is running completes.
+    """
+    MAX_WORKERS = 4
+
+    def __init__(self, addon: xbmcaddon.Addon, maxWorkers: int = MAX_WORKERS):
+        self.helper = ProxyHelper(addon)
+        self.executor = ThreadPoolExecutor(max_workers=min(maxWorkers, RpcClient.POOL_SIZE),
+                                           thread_name_prefix='rpc')
+        self.lock = threading.Lock()
+        self.futures: set = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+
+    def __track(self, future: Future) -> Future:
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self.__untrack)
+        return future
+
+    def __untrack(self, future: Future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def submit(self, method, arguments: dict = None, timeout: float = None) -> Future:
+        """
+        Call a function in the service
+        @param method: the function to be called e.g. LoginSession.obtain_asset_details
+        @param arguments: the named arguments of the function
+        @param timeout: seconds to wait for the result of this call, default the data-timeout setting
+        @return: Future with the response from the called function or the exception
+        """
+        return self.__track(self.executor.submit(self.helper.dynamic_call_with, method, arguments, timeout))
+
+    def submit_task(self, task: Callable, *args) -> Future:
+        """
+        Run a function which makes several calls to the service one after the other, with self.helper
+        @param task: the function
+        @param args: its arguments
+        @return: Future with the value returned by the function or the exception
+        """
+        return self.__track(self.executor.submit(task, *args))
+
+    def wait_all(self, futures: List[Future], progress: Callable[[int, int], bool] = None) -> List[Any]:
+        """
+        Wait for the results of a list of calls
+        @param futures: the futures returned by submit or submit_task
+        @param progress: function called with the number of completed calls and the total, when it returns
+        False the calls which did not start yet are cancelled
+        @return: for each call in the order of futures the result, or the exception of a failed or cancelled call
+        """
+        done = 0
+        for _ in as_completed(futures):
+            done += 1
+            if progress is not None and not progress(done, len(futures)):
+                self.cancel()
+                break
+        results = []
+        for future in futures:
+            if future.cancelled() or not future.done():
+                # A call still running when the calls were cancelled completes, its result is not used
+                results.append(CancelledError())
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+    def cancel(self):
+        """
+        Cancel the calls which did not start yet
+        @return: the number of calls cancelled
+        """
+        with self.lock:
+            futures = list(self.futures)
+        return sum(1 for future in futures if future.cancel())
+
+    def close(self):
+        """
+        Cancel the calls which did not start yet and release the threads
+        @return:
+        """
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class ChangeTracker:
+    """
+    Tracks the change feed of the service for a window or list. poll() returns what changed since the previous
+    poll, so the data of the other topics does not have to be fetched again. With a name the position in the
+    feed is kept in the shared properties, so it survives the window.
+    """
+
+    def __init__(self, helper: ProxyHelper, topics=changefeed.TOPICS, name: str = None,
+                 home: 'SharedProperties' = None):
+        self.helper = helper
+        self.topics = frozenset(topics)
+        self.name = name
+        self.home = home
+        self.feedId = None
+        self.version = 0
+        if name is not None and home is not None:
+            self.feedId, self.version = home.get_change_position(name)
+
+    def poll(self, timeout: float = 0) -> dict:
+        """
+        Get the changes since the previous poll
+        @param timeout: seconds to wait when nothing changed yet
+        @return: dict with per changed topic the set of changed keys, the key None means the whole topic. All
+        topics are returned on the first poll, after a restart of the service or when the feed cannot be read.
+        """
+        everything = {topic: {None} for topic in self.topics}
+        try:
+            result = self.helper.wait_for_changes(self.version, self.feedId, timeout)
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            xbmc.log('Change feed not available: {0}'.format(exc), xbmc.LOGDEBUG)
+            return everything
+        self.rewind((result['feed'], result['version']))
+        if result['reset']:
+            return everything
+        changes = {}
+        for event in result['events']:
+            if event['topic'] in self.topics:
+                changes.setdefault(event['topic'], set()).add(event['key'])
+        return changes
+
+    def position(self) -> Tuple[str, int]:
+        """
+        Get the position reached in the feed, e.g. to go back to it when the changes polled since could not be
+        handled
+        @return: (feed id, version)
+        """
+        return self.feedId, self.version
+
+    def rewind(self, position: Tuple[str, int]):
+        """
+        Go to a position in the feed, the next poll returns the changes since that position
+        @param position: the value returned by position()
+        @return:
+        """
+        self.feedId, self.version = position
+        if self.name is not None and self.home is not None:
+            self.home.set_change_position(self.name, self.feedId, self.version)
+
 
 class KodiLock:
     """
-    Note: we are using the [2] entry from the stack, because we always use 'with'
-        if [1] is used one would always see __enter or __exit
+    The global lock of the service. With a LockProfile the sampled acquisitions record how long they waited
+    for the lock, how long they held it and their call site. The call site is only looked up for a sampled
+    acquisition.
     """
-    def __init__(self):
+    def __init__(self, profile: LockProfile = None):
         self._lock = threading.Lock()
+        self.profile = profile
+        self._sample = None  # (site, wait, acquired) of the holder, if sampled
 
-    def acquire(self):
+    def acquire(self, site: str = None):
         """
         Function called to acquire lock
+        @param site: the name under which a sampled acquisition is recorded, default its call site
         @return:
         """
-        # xbmc.log('KODILOCK acquire {0}'.format(inspect.stack()[2].function), xbmc.LOGDEBUG)
-        # traceback.print_tb
+        if self.profile is None:
+            # pylint: disable=consider-using-with
+            self._lock.acquire()
+        else:
+            self.__acquire_profiled(site)
+
+    def __acquire_profiled(self, site: str):
+        if not self.profile.sample():
+            # pylint: disable=consider-using-with
+            self._lock.acquire()
+            return
+        start = time.perf_counter()
         # pylint: disable=consider-using-with
         self._lock.acquire()
-        # xbmc.log('KODILOCK acquired {0}'.format(inspect.stack()[2].function), xbmc.LOGDEBUG)
+        acquired = time.perf_counter()
+        if site is None:
+            site = call_site(depth=3)  # the caller of acquire or __enter__
+        self._sample = (site, acquired - start, acquired)
 
     def release(self):
         """
         Function called to release lock
         @return:
         """
-        # xbmc.log('KODILOCK release {0}'.format(inspect.stack()[2].function), xbmc.LOGDEBUG)
-        # traceback.print_tb
+        sample = self._sample
+        if sample is not None:
+            self._sample = None
+            self.profile.record(sample[0], sample[1], time.perf_counter() - sample[2])
         self._lock.release()
-        # xbmc.log('KODILOCK released {0}'.format(inspect.stack()[2].function), xbmc.LOGDEBUG)
 
     def __enter__(self):
-        self.acquire()
+        if self.profile is None:
+            # pylint: disable=consider-using-with
+            self._lock.acquire()
+        else:
+            self.__acquire_profiled(None)
 
     def __exit__(self, _type, value, _traceback):
         self.release()
 
+
+class SharedLock:
+    """
+    Readers-writer lock. Any number of threads can hold the lock shared, one thread can hold it exclusive.
+    Both are reentrant and a thread holding the lock exclusive can also take it shared. Waiting writers
+    have precedence over new readers. Upgrading from shared to exclusive is not possible, because two
+    threads doing that would wait for each other forever.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writerDepth = 0
+        self._waitingWriters = 0
+        self._local = threading.local()
+
+    def acquire_shared(self):
+        """
+        Function called to acquire the lock shared
+        @return:
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0 and self._writer != threading.get_ident():
+            with self._condition:
+                while self._writer is not None or self._waitingWriters > 0:
+                    self._condition.wait()
+                self._readers += 1
+            self._local.counted = True
+        elif depth == 0:
+            self._local.counted = False
+        self._local.depth = depth + 1
+
+    def release_shared(self):
+        """
+        Function called to release the lock taken shared
+        @return:
+        """
+        self._local.depth -= 1
+        if self._local.depth == 0 and self._local.counted:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    def acquire_exclusive(self):
+        """
+        Function called to acquire the lock exclusive
+        @return:
+        """
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writerDepth += 1
+            return
+        if getattr(self._local, 'depth', 0) > 0:
+            raise RuntimeError('SharedLock cannot be upgraded from shared to exclusive')
+        with self._condition:
+            self._waitingWriters += 1
+            while self._writer is not None or self._readers > 0:
+                self._condition.wait()
+            self._waitingWriters -= 1
+            self._writer = me
+            self._writerDepth = 1
+
+    def release_exclusive(self):
+        """
+        Function called to release the lock taken exclusive
+        @return:
+        """
+        self._writerDepth -= 1
+        if self._writerDepth == 0:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
+
 def invoke_debugger(enableDebug: bool, debugType:str):
     """
         debug_type: one of 'vscode', 'eclipse', 'web'
@@ -13,7 +13,7 @@ from resources.lib import utils
 from resources.lib.avstream import AvStream, StreamSession
 from resources.lib.channel import Channel, ChannelList
 from resources.lib.listitemhelper import ListitemHelper
-from resources.lib.recording import SavedStateList, SingleRecording
+from resources.lib.recording import RecordingList, SavedStateList, SingleRecording
 from resources.lib.streaminginfo import ReplayStreamingInfo
 from resources.lib.urltools import UrlTools
 from resources.lib.events import Event
@@ -334,26 +334,33 @@ class VideoHelpers:
                 self.helper.dynamic_call(StreamSession.stop_stream, streamid=avstream.id)
             return None
 
-    def __record_event(self, event):
-        self.helper.dynamic_call(LoginSession.record_event, eventId=event.id)
+    def __record_event(self, event, channel, recordings: RecordingList = None):
+        if recordings is not None:
+            recordings.record_event(event, channel.id)
+        else:
+            self.helper.dynamic_call(LoginSession.record_event, eventId=event.id)
         xbmcgui.Dialog().notification('Info',
                                       self.addon.getLocalizedString(S.MSG_EVENT_SCHEDULED),
                                       xbmcgui.NOTIFICATION_INFO,
                                       2000)
 
-    def __record_show(self, event, channel):
-        self.helper.dynamic_call(LoginSession.record_show, eventId=event.id, channelId=channel.id)
+    def __record_show(self, event, channel, recordings: RecordingList = None):
+        if recordings is not None:
+            recordings.record_show(event, channel.id)
+        else:
+            self.helper.dynamic_call(LoginSession.record_show, eventId=event.id, channelId=channel.id)
         xbmcgui.Dialog().notification('Info',
                                       self.addon.getLocalizedString(S.MSG_SHOW_SCHEDULED),
                                       xbmcgui.NOTIFICATION_INFO,
                                       2000)
 
     # pylint: disable=too-many-branches
-    def play_epg(self, event: Event, channel: Channel):
+    def play_epg(self, event: Event, channel: Channel, recordings: RecordingList = None):
         """
         Function to play something from the EPG. Can be an event, record event, record show, switch to channel
         @param event:
         @param channel:
+        @param recordings: the recordings shown in the EPG, a recorded event is added to them at once
         @return:
         """
         self.stop_player()
@@ -385,9 +392,9 @@ class VideoHelpers:
         elif action == 'replay':
             self.__replay_event(event, channel)
         elif action == 'record':
-            self.__record_event(event)
+            self.__record_event(event, channel, recordings)
         elif action == 'recordshow':
-            self.__record_show(event, channel)
+            self.__record_show(event, channel, recordings)
         elif action == 'cancel':
             pass
 
@@ -4,8 +4,14 @@ Module with classes to support the API of ziggo-go
 # pylint: disable=too-many-lines
 import base64
 import datetime
+import functools
 import json
-from typing import List
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
 from http.cookiejar import Cookie
 
 from datetime import timezone
@@ -17,10 +23,17 @@ import xbmcaddon
 import xbmcvfs
 
 from resources.lib.utils import b2ah, WebException
+from resources.lib import changefeed, jsonstream, recordingsync
 from resources.lib.channel import Channel
+from resources.lib.changefeed import ChangeFeed
+from resources.lib.filememo import FileMemo
+from resources.lib.httpcache import HttpCache
+from resources.lib.lockprofile import LockProfile
+from resources.lib.recordingsync import RecordingsSnapshot
 from resources.lib.globals import G, CONST_BASE_HEADERS, ALLOWED_LICENSE_HEADERS
+from resources.lib.tracing import TRACER
 from resources.lib.streaminginfo import StreamingInfo, ReplayStreamingInfo, VodStreamingInfo, RecordingStreamingInfo
-from resources.lib.utils import DatetimeHelper
+from resources.lib.utils import DatetimeHelper, SharedLock
 
 
 class Web(requests.Session):
@@ -36,6 +49,7 @@ class Web(requests.Session):
         self.addonPath = xbmcvfs.translatePath(addon.getAddonInfo('profile'))
         self.connectTimeout = addon.getSettingNumber('connection-timeout')
         self.dataTimeout = addon.getSettingNumber('data-timeout')
+        self.httpCache: HttpCache = None
 #        self.load_cookies()
 
     def pluginpath(self, name):
@@ -146,8 +160,9 @@ class Web(requests.Session):
             headers.update({"Content-Type": "application/json; charset=utf-8"})
         for key in extraHeaders:
             headers.update({key: extraHeaders[key]})
-        response = super().post(url, data=data, json=jsonData, headers=headers, params=params,
-                                timeout=(self.connectTimeout, self.dataTimeout))
+        with TRACER.span('upstream POST', url):
+            response = super().post(url, data=data, json=jsonData, headers=headers, params=params,
+                                    timeout=(self.connectTimeout, self.dataTimeout))
         self.print_dialog(response)
         return response
 
@@ -168,11 +183,100 @@ class Web(requests.Session):
             headers.update({"Content-Type": "application/json; charset=utf-8"})
         for key in extraHeaders:
             headers.update({key: extraHeaders[key]})
-        response = super().get(url, data=data, json=jsonData, headers=headers, params=params,
-                               timeout=(self.connectTimeout, self.dataTimeout))
+        if self.httpCache is not None and data is None and jsonData is None:
+            return self.__cached_get(url, headers, params)
+        with TRACER.span('upstream GET', url):
+            response = super().get(url, data=data, json=jsonData, headers=headers, params=params,
+                                   timeout=(self.connectTimeout, self.dataTimeout))
         self.print_dialog(response)
         return response
 
+    def __cached_get(self, url: str, headers: dict, params=None):
+        """
+        GET via the http cache: a fresh cached response is returned without asking the host, a stale one is
+        revalidated with a conditional GET
+        :param url: web address to connect to
+        :param headers: the headers to send
+        :param params: (optional) params used in query request (get)
+        :return: response
+        """
+        prepared = requests.PreparedRequest()
+        prepared.prepare_url(url, params)
+        cached = self.httpCache.get(prepared.url)
+        if cached is not None:
+            if cached.fresh:
+                return cached.to_response(prepared.url)
+            headers.update(cached.validators())
+        with TRACER.span('upstream GET', url):
+            response = super().get(url, headers=headers, params=params,
+                                   timeout=(self.connectTimeout, self.dataTimeout))
+        if response.status_code == 304 and cached is not None:
+            self.httpCache.validate(prepared.url)
+            response = cached.to_response(prepared.url, response.request)
+        else:
+            self.httpCache.put(prepared.url, response)
+        self.print_dialog(response)
+        return response
+
+    def do_get_stream(self, url: str, extraHeaders=None, params=None):
+        """
+         Like do_get, the body is not read: it is received while it is read from the response, e.g. with
+         iter_content. The response must be closed when done.
+         :param url: web address to connect to
+         :param extraHeaders: (optional) extra headers to add to default headers send
+         :param params: (optional) params used in query request (get)
+         :return: response
+         """
+        headers = dict(CONST_BASE_HEADERS)
+        headers.update(extraHeaders or {})
+        # Like do_get via the http cache, a response which is not cached yet is stored when it was read
+        cacheUrl = None
+        cached = None
+        if self.httpCache is not None:
+            prepared = requests.PreparedRequest()
+            prepared.prepare_url(url, params)
+            if self.httpCache.ttl(prepared.url) is not None:
+                cacheUrl = prepared.url
+                cached = self.httpCache.get(cacheUrl)
+        if cached is not None:
+            if cached.fresh:
+                return cached.to_response(cacheUrl)
+            headers.update(cached.validators())
+        with TRACER.span('upstream GET', url):
+            response = super().get(url, headers=headers, params=params, stream=True,
+                                   timeout=(self.connectTimeout, self.dataTimeout))
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            self.httpCache.validate(cacheUrl)
+            return cached.to_response(cacheUrl, response.request)
+        if cacheUrl is not None and response.status_code == 200:
+            self.__store_when_read(cacheUrl, response)
+        if not response.ok:
+            # The body of an error response is read, it is used for the WebException
+            _ = response.content
+            self.print_dialog(response)
+        elif self.printNetworkTraffic:
+            print("URL: {0} {1} (streamed)".format(response.request.method, response.url))
+            print("Status-code: {0}".format(response.status_code))
+        return response
+
+    def __store_when_read(self, url: str, response: requests.Response):
+        """
+        Store a streamed response in the http cache when its body was read completely with iter_content
+        :param url: the url with query
+        :param response: the streamed response
+        :return:
+        """
+        iterContent = response.iter_content
+
+        def iter_content(*args, **kwargs):
+            body = bytearray()
+            for chunk in iterContent(*args, **kwargs):
+                body += chunk
+                yield chunk
+            self.httpCache.put_body(url, response.headers, bytes(body))
+        response.iter_content = iter_content
+
     def do_head(self, url: str, data=None, jsonData=None, extraHeaders=None, params=None):
         # pylint: disable=too-many-positional-arguments, too-many-arguments
         """
@@ -190,8 +294,9 @@ class Web(requests.Session):
             headers.update({"Content-Type": "application/json; charset=utf-8"})
         for key in extraHeaders:
             headers.update({key: extraHeaders[key]})
-        response = super().head(url, data=data, json=jsonData, headers=headers, params=params,
-                                timeout=(self.connectTimeout, self.dataTimeout))
+        with TRACER.span('upstream HEAD', url):
+            response = super().head(url, data=data, json=jsonData, headers=headers, params=params,
+                                    timeout=(self.connectTimeout, self.dataTimeout))
         self.print_dialog(response)
         return response
 
@@ -212,23 +317,166 @@ class Web(requests.Session):
             headers.update({"Content-Type": "application/json; charset=utf-8"})
         for key in extraHeaders:
             headers.update({key: extraHeaders[key]})
-        response = super().delete(url, data=data, json=jsonData, headers=headers, params=params,
-                                  timeout=(self.connectTimeout, self.dataTimeout))
+        with TRACER.span('upstream DELETE', url):
+            response = super().delete(url, data=data, json=jsonData, headers=headers, params=params,
+                                      timeout=(self.connectTimeout, self.dataTimeout))
         self.print_dialog(response)
         return response
 
 
+def acquire_session_lock(session, exclusive: bool) -> Optional[tuple]:
+    """
+    Acquire the session lock of a LoginSession. With a lock profile a sampled acquisition records how long it
+    waited for the lock.
+    @param session: the LoginSession
+    @param exclusive: acquire the lock exclusive, otherwise shared
+    @return: (wait, acquired) of a sampled acquisition, to pass to release_session_lock, otherwise None
+    """
+    profile = session.lockProfile
+    sampled = profile is not None and profile.sample()
+    start = time.perf_counter() if sampled else 0
+    with TRACER.span('session lock wait'):
+        if exclusive:
+            session.sessionLock.acquire_exclusive()
+        else:
+            session.sessionLock.acquire_shared()
+    if not sampled:
+        return None
+    acquired = time.perf_counter()
+    return acquired - start, acquired
+
+
+def release_session_lock(session, exclusive: bool, site: str, sample: Optional[tuple]):
+    """
+    Release the session lock of a LoginSession, a sampled acquisition is recorded in the lock profile
+    @param session: the LoginSession
+    @param exclusive: the lock was acquired exclusive
+    @param site: the name under which the acquisition is recorded, the qualified name of the method
+    @param sample: the value returned by acquire_session_lock
+    @return:
+    """
+    if sample is not None:
+        session.lockProfile.record(site, sample[0], time.perf_counter() - sample[1])
+    if exclusive:
+        session.sessionLock.release_exclusive()
+    else:
+        session.sessionLock.release_shared()
+
+
+def session_region(func):
+    """
+    Methods which change the session state (session info, customer info, cookies and extra headers).
+    They run exclusive: no other LoginSession method runs at the same time.
+    """
+    site = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        sample = acquire_session_lock(self, True)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            release_session_lock(self, True, site, sample)
+    wrapper.lockRegion = 'session'
+    return wrapper
+
+
+def catalog_region(func):
+    """
+    Methods which only read the session state, e.g. catalog, epg and recording calls. They run in parallel
+    with each other and with the streaming methods. A method with a streamed result (apply streamed_result
+    first) holds the lock while it gets the next value, not while the value is used by the caller: a session
+    method waiting for the lock runs between two values.
+    """
+    site = func.__qualname__
+    if getattr(func, 'streamedResult', False):
+        @functools.wraps(func)
+        def stream_wrapper(self, *args, **kwargs):
+            values = func(self, *args, **kwargs)
+            try:
+                while True:
+                    sample = acquire_session_lock(self, False)
+                    try:
+                        value = next(values)
+                    except StopIteration:
+                        return
+                    finally:
+                        release_session_lock(self, False, site, sample)
+                    yield value
+            finally:
+                values.close()
+        stream_wrapper.lockRegion = 'catalog'
+        return stream_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        sample = acquire_session_lock(self, False)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            release_session_lock(self, False, site, sample)
+    wrapper.lockRegion = 'catalog'
+    return wrapper
+
+
+def streaming_region(func):
+    """
+    Methods for streaming tokens, licenses and manifests. They read the session state and run in parallel, the
+    streaming token state they change is guarded by streamingLock.
+    """
+    wrapper = catalog_region(func)
+    wrapper.lockRegion = 'streaming'
+    return wrapper
+
+
+def read_only(func):
+    """
+    Methods which only get information: they change nothing at the service or in the session, so calling them
+    twice or in another order gives the same result. The ProxyServer executes them concurrently in a batch,
+    other methods are executed in the order of the batch.
+    """
+    func.readOnly = True
+    return func
+
+
+def memoized_result(func):
+    """
+    Methods which return a value from the FileMemo: the same object until the file is written again. The
+    ProxyServer sends the frame it encoded for the previous call when the object did not change.
+    """
+    func.memoizedResult = True
+    return func
+
+
+def streamed_result(func):
+    """
+    Methods which return an iterator over the parts of a large result. The ProxyServer sends each part in its
+    own frame as soon as it is available (see ProxyHelper.dynamic_stream), for other callers it collects the
+    parts in a list.
+    """
+    func.streamedResult = True
+    return func
+
+
 class LoginSession(Web):
     """
     Implements the ziggo-go API (partially)
     """
 
     # pylint: disable=too-many-instance-attributes, too-many-public-methods
+    FEED_TOPICS = {G.CHANNEL_INFO: changefeed.CHANNELS, G.ENTITLEMENTS_INFO: changefeed.ENTITLEMENTS}
+    STREAM_CHUNK_SIZE = 64 * 1024
+    SEASON_WORKERS = 8  # below the 10 connections per host of the connection pool of requests
+    PAGE_WORKERS = 4
+    PAGE_SIZE = 100  # the max. limit of the recording service
+    SEASON_MAX_AGE = 1800  # seconds
+
     def __init__(self, addon):
         super().__init__(addon)
         self.sessionInfo = {}
         self.channels: List[Channel] = []
         self.customerInfo = {}
+        self.trackingId = None
         self.recStreamInfo: RecordingStreamingInfo = None
         self.vodStreamInfo: VodStreamingInfo = None
         self.replayStreamInfo: ReplayStreamingInfo = None
@@ -238,11 +486,67 @@ class LoginSession(Web):
         self.extraHeaders = {}
         self.streamInfo: StreamingInfo = None
         self.username = None
+        self.sessionLock = SharedLock()
+        self.lockProfile: Optional[LockProfile] = None  # set by the ProxyServer when the locks are profiled
+        self.streamingLock = threading.Lock()
+        self.fileMemo = FileMemo()
+        self.changeFeed = ChangeFeed()
+        self.recordingsSnapshot = RecordingsSnapshot()
+        self.seasonCache = {}  # (channelId, showId, rectype) -> (digest of the entry, time, episodes)
+        cacheSize = int(addon.getSettingNumber('http-cache-size')) * 1024 * 1024
+        if cacheSize > 0:
+            self.httpCache = HttpCache(self.pluginpath(G.HTTP_CACHE), cacheSize, self.cache_policies())
         # self.get_channels()
         # self.get_session_info() # We always start with a clean session
         # self.get_customer_info()
         # self.get_entitlements()
 
+    def __save_info(self, name: str, info):
+        """
+        Write information to a file in the profile folder and forget the value loaded from it before
+        @param name: the name of the file
+        @param info: the information in json format
+        @return: nothing
+        """
+        path = self.pluginpath(name)
+        text = json.dumps(info)
+        Path(path).write_text(text, encoding='utf-8')
+        self.fileMemo.invalidate(path)
+        if name in self.FEED_TOPICS:
+            self.changeFeed.publish_if_changed(self.FEED_TOPICS[name], None, text.encode('utf-8'))
+
+    def __load_info(self, name: str, build=json.loads):
+        """
+        Get the information loaded from a file in the profile folder, it is only read again when the file changed
+        @param name: the name of the file
+        @param build: function to build the information from the text of the file
+        @return: the information, or None if the file does not exist
+        """
+        return self.fileMemo.load(self.pluginpath(name), build)
+
+    @staticmethod
+    def __build_channels(text: str) -> List[Channel]:
+        channels = []
+        for info in json.loads(text):
+            channel = Channel(info)
+            if channel.isHidden:
+                continue
+            channels.append(channel)
+        return channels
+
+    @staticmethod
+    def cache_policies():
+        """
+        The urls of which the responses are kept in the http cache, with the seconds they are used without
+        asking the host. The entitlements are always revalidated, they change when a subscription changes.
+        @return: list of (regular expression matching the url, ttl in seconds)
+        """
+        return [(re.escape(G.CHANNELS_URL) + r'\?', 3600),
+                (re.escape(G.ENTITLEMENTS_URL).replace(r'\{householdid\}', '[^/]+') + r'\?', 0),
+                (re.escape(G.EVENTS_URL), 900),
+                (re.escape(G.VOD_SERVICE_URL + 'structure/'), 3600),
+                (re.escape(G.VOD_SERVICE_URL + 'collections-screen/'), 600)]
+
     def __status_code_ok(self, response):
         """
         If status_code == 401 the session_info is reset
@@ -256,58 +560,57 @@ class LoginSession(Web):
             return True
         if response.status_code == 401:  # not authenticated
             self.sessionInfo = {}
-            Path(self.pluginpath(G.SESSION_INFO)).write_text(json.dumps(self.sessionInfo), encoding='utf-8')
+            self.__save_info(G.SESSION_INFO, self.sessionInfo)
         return False
 
+    @session_region
+    @memoized_result
     def get_session_info(self):
         """
         load session information from disk
         @return: nothing
         """
-        if Path(self.pluginpath(G.SESSION_INFO)).exists():
-            self.sessionInfo = json.loads(Path(self.pluginpath(G.SESSION_INFO)).read_text(encoding='utf-8'))
-        else:
-            self.sessionInfo = {}
+        sessionInfo = self.__load_info(G.SESSION_INFO)
+        self.sessionInfo = sessionInfo if sessionInfo is not None else {}
         return self.sessionInfo
 
+    @session_region
+    @memoized_result
     def get_customer_info(self) -> dict:
         """
         load customer information from disk
         @return: customer information in json format
         """
-        if Path(self.pluginpath(G.CUSTOMER_INFO)).exists():
-            self.customerInfo = json.loads(Path(self.pluginpath(G.CUSTOMER_INFO)).read_text(encoding='utf-8'))
+        customerInfo = self.__load_info(G.CUSTOMER_INFO)
+        if customerInfo is not None:
+            self.customerInfo = customerInfo
             self.set_active_profile(self.get_profiles()[0])
         else:
             self.__obtain_customer_info()
         return self.customerInfo
 
+    @catalog_region
+    @read_only
+    @memoized_result
     def get_channels(self):
         """
         load the channels from disk
         @return: list of Channel objects
         """
-        if Path(self.pluginpath(G.CHANNEL_INFO)).exists():
-            channelInfo = json.loads(Path(self.pluginpath(G.CHANNEL_INFO)).read_text(encoding='utf-8'))
-            self.channels.clear()
-            for info in channelInfo:
-                channel = Channel(info)
-                if channel.isHidden:
-                    continue
-                self.channels.append(channel)
-        else:
-            self.channels = []
+        channels = self.__load_info(G.CHANNEL_INFO, self.__build_channels)
+        self.channels = channels if channels is not None else []
         return self.channels
 
+    @catalog_region
+    @read_only
+    @memoized_result
     def get_entitlements(self):
         """
         load entitlement information from disk
         @return: entitlement json string
         """
-        if Path(self.pluginpath(G.ENTITLEMENTS_INFO)).exists():
-            self.entitlementsInfo = json.loads(Path(self.pluginpath(G.ENTITLEMENTS_INFO)).read_text(encoding='utf-8'))
-        else:
-            self.entitlementsInfo = {}
+        entitlementsInfo = self.__load_info(G.ENTITLEMENTS_INFO)
+        self.entitlementsInfo = entitlementsInfo if entitlementsInfo is not None else {}
         return self.entitlementsInfo
 
     def __obtain_customer_info(self):
@@ -322,9 +625,36 @@ class LoginSession(Web):
             if not self.__status_code_ok(response):
                 raise WebException(response)
             self.customerInfo = response.json()
-            Path(self.pluginpath(G.CUSTOMER_INFO)).write_text(json.dumps(self.customerInfo), encoding='utf-8')
+            self.__save_info(G.CUSTOMER_INFO, self.customerInfo)
             self.refresh_channels()  # Should be sufficient to this only here
 
+    def __tracking_id(self):
+        """
+        get the tracking id of the customer, without reloading the customer information like get_customer_info
+        does, so it can be used while the session is shared. Read from disk once if the customer information is not
+        in memory (yet)
+        @return: the hashed customer id
+        """
+        customerInfo = self.customerInfo
+        if customerInfo is not None and len(customerInfo) > 0:
+            return customerInfo["hashedCustomerId"]
+        if self.trackingId is None:
+            self.trackingId = self.__load_info(G.CUSTOMER_INFO)["hashedCustomerId"]
+        return self.trackingId
+
+    @staticmethod
+    def __refresh_interval(response) -> Optional[int]:
+        """
+        get the interval in which the streaming token must be refreshed, as indicated by the server
+        @param response: the response with the streaming token
+        @return: seconds, None if the header is missing or invalid
+        """
+        try:
+            interval = int(response.headers.get('x-streaming-token-refresh-interval', ''))
+        except ValueError:
+            return None
+        return interval if interval > 0 else None
+
     @staticmethod
     def __date_expired(unixDateTime) -> bool:
         dateToCheck = DatetimeHelper.from_unix(unixDateTime)
@@ -390,6 +720,7 @@ class LoginSession(Web):
 
         return False
 
+    @session_region
     def login(self, username: str, password: str):
         """
         Function to authenticate against the API
@@ -411,7 +742,7 @@ class LoginSession(Web):
                 if not self.__status_code_ok(response):
                     raise WebException(response)
                 self.sessionInfo = response.json()
-                Path(self.pluginpath(G.SESSION_INFO)).write_text(json.dumps(self.sessionInfo), encoding='utf-8')
+                self.__save_info(G.SESSION_INFO, self.sessionInfo)
                 self.refresh_entitlements()
             else:
                 xbmc.log("Login: refresh token expired, new login required", xbmc.LOGDEBUG)
@@ -424,7 +755,7 @@ class LoginSession(Web):
                 if not self.__status_code_ok(response):
                     raise WebException(response)
                 self.sessionInfo = response.json()
-                Path(self.pluginpath(G.SESSION_INFO)).write_text(json.dumps(self.sessionInfo), encoding='utf-8')
+                self.__save_info(G.SESSION_INFO, self.sessionInfo)
                 self.refresh_entitlements()
 
         self.__obtain_customer_info()
@@ -439,6 +770,7 @@ class LoginSession(Web):
         }
         return self.sessionInfo
 
+    @session_region
     def refresh_channels(self):
         """
         Obtain list of channels via the API and store on disk
@@ -451,8 +783,9 @@ class LoginSession(Web):
                                   extraHeaders=self.extraHeaders)
         if not self.__status_code_ok(response):
             raise WebException(response)
-        Path(self.pluginpath(G.CHANNEL_INFO)).write_text(json.dumps(response.json()), encoding='utf-8')
+        self.__save_info(G.CHANNEL_INFO, response.json())
 
+    @session_region
     def refresh_entitlements(self):
         """
         Obtain entitlements via the API and store on disk
@@ -464,8 +797,9 @@ class LoginSession(Web):
                                   extraHeaders=self.extraHeaders)
         if not self.__status_code_ok(response):
             raise WebException(response)
-        Path(self.pluginpath(G.ENTITLEMENTS_INFO)).write_text(json.dumps(response.json()), encoding='utf-8')
+        self.__save_info(G.ENTITLEMENTS_INFO, response.json())
 
+    @session_region
     def refresh_widevine_license(self):
         """
         Obtain widevine license via the API and store on disk
@@ -478,6 +812,7 @@ class LoginSession(Web):
         encodedContent = base64.b64encode(response.content)
         Path(self.pluginpath(G.WIDEVINE_LICENSE)).write_text(encodedContent.decode("ascii"), encoding='ascii')
 
+    @streaming_region
     def obtain_tv_streaming_token(self, channelId, assetType) -> StreamingInfo:
         """
         obtain streaming token for watching a channel
@@ -486,7 +821,6 @@ class LoginSession(Web):
         @return: StreamingInfo object
         """
         url = G.STREAMING_URL.format(householdid=self.sessionInfo['householdId']) + '/live'
-        self.extraHeaders = {}
         response = super().do_post(url,
                                    params={
                                        'channelId': channelId,
@@ -494,13 +828,17 @@ class LoginSession(Web):
                                        'profileId': self.activeProfile['profileId'],
                                        'liveContentTimestamp': DatetimeHelper.now(timezone.utc).isoformat()
                                    },
-                                   extraHeaders=self.extraHeaders)
+                                   extraHeaders={})
         if not self.__status_code_ok(response):
             raise WebException(response)
-        self.streamInfo = StreamingInfo(json.loads(response.content))
-        self.streamInfo.token = response.headers["x-streaming-token"]
-        return self.streamInfo
-
+        streamInfo = StreamingInfo(json.loads(response.content))
+        streamInfo.token = response.headers["x-streaming-token"]
+        streamInfo.refreshInterval = self.__refresh_interval(response)
+        with self.streamingLock:
+            self.streamInfo = streamInfo
+        return streamInfo
+
+    @streaming_region
     def obtain_replay_streaming_token(self, path) -> ReplayStreamingInfo:
         """
         obtain streaming token for replay of an event
@@ -508,20 +846,23 @@ class LoginSession(Web):
         @return: ReplayStreamingInfo object
         """
         url = G.STREAMING_URL.format(householdid=self.sessionInfo['householdId']) + '/replay'
-        self.extraHeaders = {}
         response = super().do_post(url,
                                    params={
                                        'eventId': path,
                                        'abrType': 'BR-AVC-DASH',
                                        'profileId': self.activeProfile['profileId']
                                    },
-                                   extraHeaders=self.extraHeaders)
+                                   extraHeaders={})
         if not self.__status_code_ok(response):
             raise WebException(response)
-        self.replayStreamInfo = ReplayStreamingInfo(json.loads(response.content))
-        self.replayStreamInfo.token = response.headers["x-streaming-token"]
-        return self.replayStreamInfo
-
+        streamInfo = ReplayStreamingInfo(json.loads(response.content))
+        streamInfo.token = response.headers["x-streaming-token"]
+        streamInfo.refreshInterval = self.__refresh_interval(response)
+        with self.streamingLock:
+            self.replayStreamInfo = streamInfo
+        return streamInfo
+
+    @streaming_region
     def obtain_vod_streaming_token(self, streamId) -> VodStreamingInfo:
         """
         obtain streaming token for play of a Video On Demand
@@ -529,20 +870,23 @@ class LoginSession(Web):
         @return: VodStreamingInfo object
         """
         url = G.STREAMING_URL.format(householdid=self.sessionInfo['householdId']) + '/vod'
-        self.extraHeaders = {}
         response = super().do_post(url,
                                    params={
                                        'contentId': streamId,
                                        'abrType': 'BR-AVC-DASH',
                                        'profileId': self.activeProfile['profileId']
                                    },
-                                   extraHeaders=self.extraHeaders)
+                                   extraHeaders={})
         if not self.__status_code_ok(response):
             raise WebException(response)
-        self.vodStreamInfo = VodStreamingInfo(json.loads(response.content))
-        self.vodStreamInfo.token = response.headers["x-streaming-token"]
-        return self.vodStreamInfo
-
+        streamInfo = VodStreamingInfo(json.loads(response.content))
+        streamInfo.token = response.headers["x-streaming-token"]
+        streamInfo.refreshInterval = self.__refresh_interval(response)
+        with self.streamingLock:
+            self.vodStreamInfo = streamInfo
+        return streamInfo
+
+    @streaming_region
     def obtain_recording_streaming_token(self, streamid) -> RecordingStreamingInfo:
         """
         obtain streaming token for play of a recording
@@ -550,20 +894,23 @@ class LoginSession(Web):
         @return: RecordingStreamingInfo object
         """
         url = G.STREAMING_URL.format(householdid=self.sessionInfo['householdId']) + '/recording'
-        self.extraHeaders = {}
         response = super().do_post(url,
                                    params={
                                        'recordingId': streamid,
                                        'abrType': 'BR-AVC-DASH',
                                        'profileId': self.activeProfile['profileId']
                                    },
-                                   extraHeaders=self.extraHeaders)
+                                   extraHeaders={})
         if not self.__status_code_ok(response):
             raise WebException(response)
-        self.recStreamInfo = RecordingStreamingInfo(json.loads(response.content))
-        self.recStreamInfo.token = response.headers["x-streaming-token"]
-        return self.recStreamInfo
-
+        streamInfo = RecordingStreamingInfo(json.loads(response.content))
+        streamInfo.token = response.headers["x-streaming-token"]
+        streamInfo.refreshInterval = self.__refresh_interval(response)
+        with self.streamingLock:
+            self.recStreamInfo = streamInfo
+        return streamInfo
+
+    @streaming_region
     def get_license(self, contentId, requestData, licenseHeaders):
         """
         Get a license to play a channel, recording, vod etc via the API
@@ -585,9 +932,11 @@ class LoginSession(Web):
                                    data=requestData,
                                    extraHeaders=licenseHeaders)
         if 'x-streaming-token' in response.headers:
-            self.streamingToken = response.headers['x-streaming-token']
+            with self.streamingLock:
+                self.streamingToken = response.headers['x-streaming-token']
         return response
 
+    @streaming_region
     def update_token(self, streamingToken):
         """
         update a streaming token via the API
@@ -596,8 +945,8 @@ class LoginSession(Web):
         """
         url = G.LICENSE_URL + '/token'
         profileId = self.activeProfile["profileId"]
-        trackingId = self.get_customer_info()["hashedCustomerId"]
-        self.extraHeaders = {
+        trackingId = self.__tracking_id()
+        extraHeaders = {
             #            'X-OESP-Username': self.username,
             'x-tracking-id': trackingId,
             'X-Profile': profileId,
@@ -606,15 +955,16 @@ class LoginSession(Web):
         response = super().do_post(url,
                                    data=None,
                                    params=None,
-                                   extraHeaders=self.extraHeaders)
+                                   extraHeaders=extraHeaders)
         if not self.__status_code_ok(response):
             raise WebException(response)
         if 'x-streaming-token' in response.headers:
-            self.streamingToken = response.headers['x-streaming-token']
+            with self.streamingLock:
+                self.streamingToken = response.headers['x-streaming-token']
             return response.headers["x-streaming-token"]
-        self.extraHeaders = {}
         return ''
 
+    @streaming_region
     def delete_token(self, streamingId):
         """
         delete streaming token via the API
@@ -623,8 +973,8 @@ class LoginSession(Web):
         """
         url = G.LICENSE_URL + '/token'
         profileId = self.activeProfile["profileId"]
-        trackingId = self.get_customer_info()["hashedCustomerId"]
-        self.extraHeaders = {
+        trackingId = self.__tracking_id()
+        extraHeaders = {
             #            'X-OESP-Username': self.username,
             'x-tracking-token': trackingId,
             'X-Profile': profileId,
@@ -633,11 +983,12 @@ class LoginSession(Web):
         response = super().do_delete(url,
                                      data=None,
                                      params=None,
-                                     extraHeaders=self.extraHeaders)
-        self.extraHeaders = {}
+                                     extraHeaders=extraHeaders)
         if not self.__status_code_ok(response):
             raise WebException(response)
 
+    @streaming_region
+    @read_only
     def get_manifest(self, url):
         """
         Get a manifest file via the API
@@ -647,6 +998,8 @@ class LoginSession(Web):
         response = super().do_get(url, data=None, params=None)
         return response
 
+    @catalog_region
+    @read_only
     def get_profiles(self):
         """
         get the user profiles
@@ -654,6 +1007,7 @@ class LoginSession(Web):
         """
         return self.customerInfo["profiles"]
 
+    @session_region
     def set_active_profile(self, profile):
         """
         set the active user profile
@@ -676,6 +1030,8 @@ class LoginSession(Web):
             return 0
         return ''
 
+    @catalog_region
+    @read_only
     def obtain_structure(self):
         """
         Obtain structure for the web-page. Currently not used
@@ -696,6 +1052,8 @@ class LoginSession(Web):
             raise WebException(response)
         return response.content
 
+    @catalog_region
+    @read_only
     def obtain_home_collection(self, collection: List[any]):
         """
         Obtain the home collection for the web-page. Currently not used
@@ -731,6 +1089,8 @@ class LoginSession(Web):
 
         return response.content
 
+    @catalog_region
+    @read_only
     def obtain_grid_screen_details(self, collectionId):
         """
         obtain a list of movies or series to list in the addon menu
@@ -761,6 +1121,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def obtain_vod_screen_details(self, collectionId):
         """
         obtain a list of genres
@@ -789,6 +1151,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def obtain_asset_details(self, assetId, brandingProviderId=None):
         """
         Obtain movie details
@@ -816,6 +1180,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def obtain_series_overview(self, seriesId):
         """
         obtain series details
@@ -835,6 +1201,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def obtain_vod_screens(self):
         """
         get a list of additional items to show in the addon menu (e.g. Sky Showtime etc.)
@@ -858,6 +1226,8 @@ class LoginSession(Web):
 
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def get_episode_list(self, item):
         """
         get a list of episode for a series/show
@@ -882,6 +1252,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def get_episode(self, item):
         """
         get information of an episode for a series/show
@@ -925,6 +1297,8 @@ class LoginSession(Web):
             return mostrelevantEpisode, asset
         return '', ''
 
+    @catalog_region
+    @read_only
     def get_mostwatched_channels(self):
         """
         get a list of most watched channels (not used)
@@ -941,6 +1315,8 @@ class LoginSession(Web):
             raise WebException(response)
         return response.content
 
+    @catalog_region
+    @read_only
     def get_events(self, startTime: str):
         """
         get a list of events to use in the EPG
@@ -951,8 +1327,130 @@ class LoginSession(Web):
         response = super().do_get(url=url)
         if not self.__status_code_ok(response):
             raise WebException(response)
+        self.changeFeed.publish_if_changed(changefeed.EPG, startTime, response.content)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
+    @streamed_result
+    def stream_events(self, startTime: str) -> Iterator[dict]:
+        """
+        get the events to use in the EPG like get_events, each entry as soon as it is received
+        :param startTime: datetime in format 'yyyymmddhhss'
+        :return: iterator over the events per channel (the entries of get_events)
+        """
+        url = G.EVENTS_URL + startTime
+        response = super().do_get_stream(url=url)
+        if not self.__status_code_ok(response):
+            raise WebException(response)
+        return self.__stream_entries(response, startTime)
+
+    def __stream_entries(self, response: requests.Response, startTime: str) -> Iterator[dict]:
+        """
+        Parse the entries of the events while they are received. The change of the EPG is published when all
+        entries are received.
+        """
+        digest = 0
+
+        def chunks():
+            nonlocal digest
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                digest = zlib.crc32(chunk, digest)
+                yield chunk
+
+        received = chunks()
+        try:
+            yield from jsonstream.iter_array(received, 'entries')
+            # The rest of the document after the entries, the response is complete when it was read to the end
+            for _ in received:
+                pass
+        finally:
+            response.close()
+        self.changeFeed.publish_if_digest_changed(changefeed.EPG, startTime, digest)
+
+    @staticmethod
+    def __map_concurrently(function, argsList: list, workers: int) -> Iterator:
+        """
+        Call a function for each of the arguments on a bounded pool of threads sharing the connections of the
+        session. The results are yielded in the order of the arguments as soon as they are available.
+        When a call fails (e.g. 401 because the session expired) the calls which did not start yet are cancelled
+        and the exception is raised, a 401 before other exceptions.
+        @param function: the function to call
+        @param argsList: list of tuples with the arguments of the calls
+        @param workers: max. number of calls at the same time
+        @return: iterator of the results
+        """
+        if len(argsList) == 0:
+            return
+        trace = TRACER.current()
+
+        def call(args):
+            with TRACER.attach(trace):
+                return function(*args)
+
+        def cancel_on_failure(future):
+            if not future.cancelled() and future.exception() is not None:
+                for other in futures:
+                    other.cancel()
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=min(workers, len(argsList)), thread_name_prefix='webcalls') as executor:
+            futures = [executor.submit(call, args) for args in argsList]
+            for future in futures:
+                future.add_done_callback(cancel_on_failure)
+            try:
+                for future in futures:
+                    if future.cancelled() or future.exception() is not None:
+                        break
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                failed.append(future.exception())
+        if failed:
+            # A 401 resets the session info, the calls started after it fail because of that
+            unauthorized = [exc for exc in failed if isinstance(exc, WebException) and exc.status == 401]
+            raise (unauthorized + failed)[0]
+
+    def __get_page(self, url: str, params: dict, offset: int) -> dict:
+        """
+        Obtain one page of an offset/limit endpoint
+        @param url:
+        @param params: the query params, without offset and limit
+        @param offset: the index of the first item of the page
+        @return: the page in json format
+        """
+        response = super().do_get(url, params=dict(params, offset=offset, limit=self.PAGE_SIZE))
+        if not self.__status_code_ok(response):
+            raise WebException(response)
+        return json.loads(response.content)
+
+    def get_all_pages(self, url: str, params: dict, workers: int = None) -> dict:
+        """
+        Obtain all items of an offset/limit endpoint. The first page gives the total, the other pages are
+        obtained concurrently and their data is added to the data of the first page in order. When the endpoint
+        does not return a total, the pages are obtained one after the other until a page is not full.
+        @param url:
+        @param params: the query params, without offset and limit
+        @param workers: max. number of pages obtained at the same time, default PAGE_WORKERS
+        @return: the first page with the data of all pages
+        """
+        result = self.__get_page(url, params, 0)
+        if 'total' not in result:
+            page = result
+            while len(page['data']) == self.PAGE_SIZE:
+                page = self.__get_page(url, params, len(result['data']))
+                result['data'].extend(page['data'])
+            return result
+        offsets = range(self.PAGE_SIZE, result['total'], self.PAGE_SIZE)
+        pages = self.__map_concurrently(self.__get_page, [(url, params, offset) for offset in offsets],
+                                        workers or self.PAGE_WORKERS)
+        for page in pages:
+            result['data'].extend(page['data'])
+        return result
+
     def __get_recordings_planned(self, isAdult: bool):
         """
         Obtain list of planned recordings
@@ -960,16 +1458,11 @@ class LoginSession(Web):
         @return:
         """
         url = G.RECORDINGS_URL.format(householdid=self.sessionInfo['householdId']) + 'bookings'
-        response = super().do_get(url, params={'isAdult': isAdult,
-                                               'offset': 0,
-                                               'limit': 100,
+        return self.get_all_pages(url, params={'isAdult': isAdult,
                                                # 'sort': 'time',
                                                # 'sortOrder': 'desc',
                                                # 'profileId': self.activeProfile['profileId'],
                                                'language': 'nl'})
-        if not self.__status_code_ok(response):
-            raise WebException(response)
-        return json.loads(response.content)
 
     def __get_recordings_recorded(self, isAdult: bool):
         """
@@ -978,16 +1471,11 @@ class LoginSession(Web):
         @return:
         """
         url = G.RECORDINGS_URL.format(householdid=self.sessionInfo['householdId']) + 'recordings'
-        response = super().do_get(url, params={'isAdult': isAdult,
-                                               'offset': 0,
-                                               'limit': 100,
+        return self.get_all_pages(url, params={'isAdult': isAdult,
                                                # 'sort': 'time',
                                                # 'sortOrder': 'desc',
                                                # 'profileId': self.activeProfile['profileId'],
                                                'language': 'nl'})
-        if not self.__status_code_ok(response):
-            raise WebException(response)
-        return json.loads(response.content)
 
     def __get_recordings_season(self, channelId, showId, sourcetype):
         """
@@ -1000,20 +1488,19 @@ class LoginSession(Web):
         @return:
         """
         url = G.RECORDINGS_URL.format(householdid=self.sessionInfo['householdId']) + 'episodes/shows/' + showId
-        response = super().do_get(url, params={'source': sourcetype,
+        # The shows are already obtained concurrently, the pages of a show one after the other
+        return self.get_all_pages(url, params={'source': sourcetype,
                                                'isAdult': 'false',
-                                               'offset': 0,
-                                               'limit': 100,
                                                # 'sort': 'time',
                                                # 'sortOrder': 'desc',
                                                'profileId': self.activeProfile['profileId'],
                                                'language': 'nl',
                                                'channelId': channelId
-                                               })
-        if not self.__status_code_ok(response):
-            raise WebException(response)
-        return json.loads(response.content)
+                                               },
+                                  workers=1)
 
+    @catalog_region
+    @read_only
     def get_recording_details(self, recordingId):
         """
         get the details of a recording
@@ -1028,6 +1515,7 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
     def delete_recordings_planned(self, event=None, show=None, channelId=None):
         """
         delete planned recordings
@@ -1047,8 +1535,11 @@ class LoginSession(Web):
         response = super().do_delete(url=url, jsonData=request)
         if not self.__status_code_ok(response):
             raise WebException(response)
+        self.__forget_seasons(showId=show, episodeId=event)
+        self.changeFeed.publish(changefeed.RECORDINGS)
         return json.loads(response.content)
 
+    @catalog_region
     def delete_recordings(self, event=None, show=None, channelId=None):
         """
         delete a list of recordings
@@ -1068,8 +1559,11 @@ class LoginSession(Web):
         response = super().do_delete(url=url, jsonData=request)
         if not self.__status_code_ok(response):
             raise WebException(response)
+        self.__forget_seasons(showId=show, episodeId=event)
+        self.changeFeed.publish(changefeed.RECORDINGS)
         return json.loads(response.content)
 
+    @catalog_region
     def record_event(self, eventId):
         """
         Record an event
@@ -1082,8 +1576,10 @@ class LoginSession(Web):
         response = super().do_post(url=url, jsonData=request)
         if not self.__status_code_ok(response):
             raise WebException(response)
+        self.changeFeed.publish(changefeed.RECORDINGS)
         return json.loads(response.content)
 
+    @catalog_region
     def record_show(self, eventId, channelId):
         """
         record a show/series/season
@@ -1098,14 +1594,19 @@ class LoginSession(Web):
         response = super().do_post(url=url, jsonData=request)
         if not self.__status_code_ok(response):
             raise WebException(response)
+        self.changeFeed.publish(changefeed.RECORDINGS)
         return json.loads(response.content)
 
-    def __update_recording_season(self, recording, rectype):
+    @staticmethod
+    def __season_key(recording, rectype):
         if 'showId' in recording:
             seasonid = recording['showId']
         else:
             seasonid = recording['id']
-        seasonRecordings = self.__get_recordings_season(recording['channelId'], seasonid,rectype)
+        return recording['channelId'], seasonid, rectype
+
+    @staticmethod
+    def __apply_recording_season(recording, seasonRecordings):
         # Note after this, there is duplicate info in the SeasonRecording. The 'episodes'
         #      key contains all info, but we extract some items to make them easier to access
         recording.update({'episodes': seasonRecordings})
@@ -1117,6 +1618,44 @@ class LoginSession(Web):
         if 'shortSynopsis' in seasonRecordings:
             recording.update({'shortSynopsis': seasonRecordings['shortSynopsis']})
 
+    def __update_recording_seasons(self, recordings: List[tuple]):
+        """
+        Add the episodes to the seasons/shows. The episodes of a show are only obtained again when its entry in the
+        list changed or when they were obtained more than SEASON_MAX_AGE seconds ago. They are obtained concurrently
+        and added in the order of the recordings.
+        @param recordings: list of (recording, rectype), rectype one of 'booking'|'recording'
+        @return: nothing
+        """
+        keys = {}
+        for recording, rectype in recordings:
+            keys.setdefault(self.__season_key(recording, rectype), recordingsync.digest(recording))
+        now = time.time()
+        seasonCache = {}
+        expand = []
+        for key, entryDigest in keys.items():
+            cached = self.seasonCache.get(key)
+            if cached is not None and cached[0] == entryDigest and now - cached[1] < self.SEASON_MAX_AGE:
+                seasonCache[key] = cached
+            else:
+                expand.append(key)
+        seasons = self.__map_concurrently(self.__get_recordings_season, expand, self.SEASON_WORKERS)
+        for seasonRecordings, key in zip(seasons, expand):
+            seasonCache[key] = (keys[key], now, seasonRecordings)
+        self.seasonCache = seasonCache
+        for recording, rectype in recordings:
+            self.__apply_recording_season(recording, seasonCache[self.__season_key(recording, rectype)][2])
+
+    def __forget_seasons(self, showId=None, episodeId=None):
+        """
+        Forget the episodes of the shows changed by a deletion, they are obtained again at the next refresh
+        @param showId: the show of which the recordings are deleted
+        @param episodeId: the recording which is deleted
+        @return: nothing
+        """
+        self.seasonCache = {key: cached for key, cached in self.seasonCache.items()
+                            if key[1] != showId
+                            and all(episode.get('id') != episodeId for episode in cached[2].get('data', []))}
+
     def __extract_seasons(self, recordings):
         seasons = {'data': []}
         for data in recordings['data']:
@@ -1172,6 +1711,7 @@ class LoginSession(Web):
                         planned['data'].remove(data)
         return planned
 
+    @catalog_region
     def refresh_recordings(self, includeAdult=False) -> str:
         """
         Routine to (re)load the recordings.
@@ -1179,6 +1719,26 @@ class LoginSession(Web):
         @return: the recordings in json format, with the planned and recorded recordings 
                  merged and with the seasons updated with the episode details
         """
+        recJson = self.__obtain_recordings(includeAdult)
+        self.recordingsSnapshot.update(recJson)
+        self.changeFeed.publish_if_changed(changefeed.RECORDINGS, None, json.dumps(recJson).encode('utf-8'))
+        return recJson
+
+    @catalog_region
+    def sync_recordings(self, version: str = None, includeAdult=False) -> dict:
+        """
+        Reload the recordings like refresh_recordings, only the entries which changed since a version are returned
+        @param version: the version of the recordings of the caller, None to get all entries
+        @param includeAdult:
+        @return: the changes, see RecordingsSnapshot.delta
+        """
+        recJson = self.__obtain_recordings(includeAdult)
+        # A concurrent call can replace the snapshot, the delta must be of these recordings
+        delta = self.recordingsSnapshot.sync(recJson, version)
+        self.changeFeed.publish_if_changed(changefeed.RECORDINGS, None, json.dumps(recJson).encode('utf-8'))
+        return delta
+
+    def __obtain_recordings(self, includeAdult: bool) -> dict:
         recJson = {'planned': [], 'recorded': []}
         recordingsPlanned = self.__get_recordings_planned(isAdult=False)
         if includeAdult:
@@ -1193,17 +1753,17 @@ class LoginSession(Web):
         recordings = self.__process_recorded(recordings, recordingsPlanned)
         recordingsPlanned = self.__process_planned(recordings, recordingsPlanned)
 
-        for recording in recordingsPlanned['data']:
-            if recording['source'] in ['season','show']:
-                self.__update_recording_season(recording,'booking')
+        seasons = [(recording, 'booking') for recording in recordingsPlanned['data']
+                   if recording['source'] in ['season','show']]
+        seasons.extend([(recording, 'recording') for recording in recordings['data']
+                        if recording['source'] in ['season','show']])
+        self.__update_recording_seasons(seasons)
         recJson.update({'planned': recordingsPlanned})
-
-        for recording in recordings['data']:
-            if recording['source'] in ['season','show']:
-                self.__update_recording_season(recording,'recording')
         recJson.update({'recorded': recordings})
         return recJson
 
+    @catalog_region
+    @read_only
     def get_event_details(self, eventId):
         """
         Get the details of an event for the EPG
@@ -1221,6 +1781,8 @@ class LoginSession(Web):
             raise WebException(response)
         return json.loads(response.content)
 
+    @catalog_region
+    @read_only
     def get_extra_headers(self):
         """
         get a list of extra headers
@@ -1228,6 +1790,8 @@ class LoginSession(Web):
         """
         return self.extraHeaders
 
+    @catalog_region
+    @read_only
     def get_cookies_dict(self):
         """
         get a list of cookies
@@ -1235,6 +1799,7 @@ class LoginSession(Web):
         """
         return self.cookies.get_dict()
 
+    @session_region
     # pylint: disable=useless-parent-delegation
     def close(self):
         """
@@ -7,7 +7,7 @@ import xbmcaddon
 
 from resources.lib.channel import Channel, ChannelList, SavedChannelsList
 from resources.lib.listitemhelper import ListitemHelper
-from resources.lib.utils import ProxyHelper
+from resources.lib.utils import ProxyHelper, WebException
 from resources.lib.webcalls import LoginSession
 from resources.lib.windows.basewindow import BaseWindow
 
@@ -73,9 +73,12 @@ class ChannelWindow(BaseWindow):
         # Create a list for our items.
         listbox.reset()
         listing = []
-        channels = self.helper.dynamic_call(LoginSession.get_channels)
-        entitlements = self.helper.dynamic_call(LoginSession.get_entitlements)
-        self.channels = ChannelList(channels, entitlements)
+        results = self.helper.dynamic_batch([(LoginSession.get_channels, {}),
+                                             (LoginSession.get_entitlements, {})])
+        for result in results:
+            if isinstance(result, WebException):
+                raise result
+        self.channels = ChannelList(results[0], results[1])
         self.channels.entitledOnly = self.addon.getSettingBool('allowed-channels-only')
         self.channels.apply_filter()
 
@@ -218,6 +218,12 @@ class MovieWindow(BaseWindow):
             else:
                 listing.sort(key=lambda x: x.getVideoInfoTag().getTitle().lower(), reverse=True)
 
+    @staticmethod
+    def __loading_progress(dlg: xbmcgui.DialogProgress, start: int, done: int, total: int, message: str) -> bool:
+        # The items not loaded when the dialog is cancelled get their details when they are selected
+        dlg.update(start + done * 50 // total, message)
+        return not dlg.iscanceled()
+
     def __list_overview(self,categoryId):
         listingseries = []
         listingmovies = []
@@ -231,10 +237,10 @@ class MovieWindow(BaseWindow):
             self.series = None
         movielistctrl: xbmcgui.ControlList = self.getControl(self.MOVIELIST)
         self.series = SeriesList(self.addon, categoryId)
-        seasonerrors = 0
+        seasonerrors = self.series.update_season_details_bulk(
+            [serie for serie in self.series.series if not serie.hasdetails],
+            progress=lambda done, total: self.__loading_progress(dlg, 0, done, total, 'Loading series...'))
         for serie in self.series.series:
-            if not serie.hasdetails:
-                seasonerrors += self.series.update_season_details(serie)
             li = self.listitemHelper.listitem_from_series(serie)
             listingseries.append(li)
 
@@ -246,10 +252,10 @@ class MovieWindow(BaseWindow):
             self.movies.save()
             self.movies = None
         self.movies = MovieList(self.addon, categoryId)
-        movieerrors = 0
+        movieerrors = self.movies.update_details_bulk(
+            [movie for movie in self.movies.movies if not movie.hasdetails],
+            progress=lambda done, total: self.__loading_progress(dlg, 50, done, total, 'Loading movies...'))
         for movie in self.movies.movies:
-            if not movie.hasdetails:
-                movieerrors += self.movies.update_details(movie)
             li = self.listitemHelper.listitem_from_movie(movie)
             listingmovies.append(li)
         self.movies.save()
@@ -37,7 +37,7 @@ class RecordingWindow(BaseWindow):
         self.playingListitem = None
         self.recordingtype = RecordingType.RECORDED
         self.recordings = RecordingList(self.addon)
-        self.recordings.refresh()
+        self.recordings.refresh_if_changed()
         self.showrecordings()
 
     def onInit(self):
@@ -249,7 +249,6 @@ class RecordingWindow(BaseWindow):
         elif action == 'delete':
             self.recordings.delete_recording(recording)
             listctrl.removeItem(listctrl.getSelectedPosition())
-            self.recordings.refresh()
             xbmcgui.Dialog().notification('Info',
                                           self.addon.getLocalizedString(S.MSG_DELETE_RECORDING_COMPLETE),
                                           xbmcgui.NOTIFICATION_INFO,
@@ -261,7 +260,6 @@ class RecordingWindow(BaseWindow):
                                                    self.addon.getLocalizedString(S.MSG_DELETE_SEASON_ALL))
             self.recordings.delete_season_recording(recording, delallchoice)
             listctrl.removeItem(listctrl.getSelectedPosition())
-            self.recordings.refresh()
             xbmcgui.Dialog().notification('Info',
                                     self.addon.getLocalizedString(S.MSG_DELETE_SEASON_COMPLETE),
                                     xbmcgui.NOTIFICATION_INFO,
@@ -11,6 +11,7 @@ from resources.lib.proxyserver import ProxyServer
 from resources.lib.servicemonitor import HttpProxyService
 from resources.lib.utils import ProxyHelper
 from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import set_proxy_settings
 from tests_pytest.xbmcclasses import Addon
 
 @pytest.fixture(scope="session",name="addon")
@@ -25,6 +26,7 @@ def fixture_addon():
     addon.setSettingNumber('connection-timeout', 100)
     addon.setSettingNumber('data-timeout', 100)
     addon.setSettingBool('adult-allowed', True)
+    set_proxy_settings(addon)
     return addon
 
 class Session:
@@ -145,15 +147,28 @@ def activewebsession(websession) -> LocalSession:
 def inactivewebsession(websession) -> LocalSession:
     return websession
 
+def standin(request) -> bool:
+    """
+    Tests marked standin run against stand-in servers, they do not need the session with the real service
+    """
+    return request.node.get_closest_marker('standin') is not None
+
 @pytest.fixture(autouse=True, scope="function")
-#pylint: disable=unused-argument
-def run_around_tests(websession):
+def run_around_tests(request):
+    if standin(request):
+        yield
+        return
+    request.getfixturevalue('websession')
     print("\nThis will run before the test function")
     yield
     print("\nThis will run after the test function")
 
 @pytest.fixture(autouse=True, scope="class")
-def run_around_testclass(websession):
+def run_around_testclass(request):
+    if standin(request):
+        yield
+        return
+    websession = request.getfixturevalue('websession')
     print("\nThis will run before the test class")
     websession.start_proxy_server()
     yield
@@ -0,0 +1,222 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from resources.lib.avstream import AvStream
+from resources.lib.proxyserver import ProxyServer
+from resources.lib.streaminginfo import StreamingInfo
+from tests_pytest.xbmcclasses import Addon
+
+SEGMENT = bytes(range(256)) * 1024  # 256 KiB, roughly a 2 second audio/video segment
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+        Handler of the stand-in server, the requests are passed to the route of the server
+    """
+    protocol_version = 'HTTP/1.1'
+
+    # pylint: disable=redefined-builtin
+    def log_message(self, format, *args):
+        pass
+
+    # pylint: disable=invalid-name
+    def do_GET(self):
+        self.server.dispatch(self)
+
+    def do_POST(self):
+        self.server.dispatch(self)
+
+    def do_HEAD(self):
+        self.server.dispatch(self)
+
+    def do_DELETE(self):
+        self.server.dispatch(self)
+
+    def send_body(self, body: bytes, status=200, contentType='application/octet-stream', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_chunked(self, chunks, status=200, contentType='application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+        Local stand-in for the ziggo/CDN hosts. Counts the connections (handshakes) and requests.
+        The route is a function called with the handler for every request.
+    """
+    # pylint: disable=too-many-instance-attributes
+    daemon_threads = True
+
+    def __init__(self, route, latency: float = 0, certfile: str = None, keyfile: str = None):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.route = route
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.counterLock = threading.Lock()
+        self.thread = None
+        self.scheme = 'http'
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            self.scheme = 'https'
+
+    @property
+    def url(self):
+        return '{0}://localhost:{1}'.format(self.scheme, self.server_address[1])
+
+    def get_request(self):
+        result = super().get_request()
+        with self.counterLock:
+            self.connections += 1
+        return result
+
+    def dispatch(self, handler: StandInHandler):
+        with self.counterLock:
+            self.requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.route(handler)
+
+    def reset_counters(self):
+        with self.counterLock:
+            self.connections = 0
+            self.requests = 0
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.1})
+        self.thread.start()
+        return self
+
+    def __exit__(self, _type, value, _traceback):
+        self.shutdown()
+        self.thread.join()
+        self.server_close()
+
+
+def create_certificate(path):
+    """
+    Create a self-signed certificate for localhost with the openssl command line tool
+    @param path: directory for the certificate and key
+    @return: tuple (certfile, keyfile)
+    """
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl not available to create a certificate')
+    certfile = str(path / 'cert.pem')
+    keyfile = str(path / 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-keyout', keyfile, '-out', certfile, '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost'],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def segment_route(handler):
+    if 'chunked' in handler.path:
+        handler.send_chunked([SEGMENT[i:i + 65536] for i in range(0, len(SEGMENT), 65536)])
+    else:
+        handler.send_body(SEGMENT)
+
+
+def set_proxy_settings(addon):
+    """
+    Set the settings of the proxy server to their defaults for the tests, used by the addon of conftest and
+    by proxy_addon
+    @param addon: the addon (stub)
+    @return:
+    """
+    addon.setSettingNumber('upstream-pool-size', 4)
+    addon.setSettingNumber('upstream-idle-timeout', 30)
+    addon.setSettingNumber('prefetch-segments', 2)
+    addon.setSettingNumber('prefetch-memory', 64)
+    addon.setSettingNumber('segment-cache-size', 0)
+    addon.setSettingNumber('timeshift-window', 0)
+    addon.setSettingNumber('timeshift-size', 64)
+    addon.setSettingBool('rpc-unix-socket', False)
+    addon.setSettingBool('rpc-tracing', False)
+    addon.setSettingNumber('lock-profile-sampling', 0)
+    addon.setSettingNumber('http-cache-size', 0)
+
+
+def proxy_addon():
+    addon = Addon('plugin.video.ziggotv')
+    addon.setSetting('proxy-ip', '127.0.0.1')
+    addon.setSetting('proxy-port', str(free_port()))
+    addon.setSettingBool('print-network-traffic', False)
+    addon.setSettingBool('print-response-content', False)
+    addon.setSettingBool('print-request-content', False)
+    addon.setSettingNumber('connection-timeout', 5)
+    addon.setSettingNumber('data-timeout', 5)
+    set_proxy_settings(addon)
+    return addon
+
+
+def start_proxy(addon, baseUrl):
+    proxy = ProxyServer(addon, (addon.getSetting('proxy-ip'), int(addon.getSettingNumber('proxy-port'))),
+                        threading.Lock())
+    thread = threading.Thread(target=proxy.serve_forever)
+    thread.start()
+    info = StreamingInfo({'deviceRegistrationRequired': False, 'drmContentId': 'bench'})
+    info.token = 'benchtoken'
+    stream = AvStream(proxy.session, info)
+    stream.baseUrl = baseUrl
+    proxy.streamsession.registry.add_stream(stream)
+    return proxy, thread
+
+
+def stop_proxy(proxy, thread):
+    proxy.stop()
+    thread.join()
+    proxy.server_close()
+    proxy.connectionPool.close_all()
+
+
+def fetch_segments(addon, count, path='/segment-{0}.m4s'):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        connection = HTTPConnection(addon.getSetting('proxy-ip'), int(addon.getSettingNumber('proxy-port')),
+                                    timeout=5)
+        connection.request('GET', path.format(i), headers={'x-streaming-token': 'benchtoken'})
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200
+        assert body == SEGMENT
+    return latencies
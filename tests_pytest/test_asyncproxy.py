@@ -0,0 +1,124 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from resources.lib.movies import MovieList, SeriesList
+from resources.lib.utils import AsyncProxyHelper, WebException
+from resources.lib.webcalls import LoginSession, Web
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+ITEMS = 40
+LATENCY = 0.05
+
+
+class JsonResponse:
+    def __init__(self, value, status=200):
+        self.status_code = status
+        self.content = json.dumps(value).encode('utf-8')
+        self.headers = {}
+
+
+def screen(itemType):
+    return {'collections': [{'items': [{'id': '{0}-{1}'.format(itemType.lower(), i),
+                                        'type': itemType, 'assetType': 'Asset', 'isAdult': False}
+                                       for i in range(ITEMS)]}]}
+
+
+def vod_get(self, url, **kwargs):
+    # pylint: disable=unused-argument
+    if 'collections-screen/' in url:
+        return JsonResponse(screen(url.rsplit('/', 1)[1]))
+    time.sleep(LATENCY)
+    if 'details-screen/' in url:
+        assetId = url.rsplit('/', 1)[1]
+        if assetId.endswith('-13'):
+            return JsonResponse({'error': 'unknown'}, 404)
+        return JsonResponse({'id': assetId, 'type': 'ASSET', 'assetType': 'Asset', 'isAdult': False,
+                             'ageRating': 0, 'title': 'Film'})
+    seriesId = url.split('showPage/')[1][:-len('/nl')]
+    return JsonResponse({'id': seriesId, 'title': 'Serie', 'ageRating': 6, 'isAdult': False, 'synopsis': '',
+                         'mergedId': seriesId, 'seasons': []})
+
+
+def start_vod_proxy(monkeypatch, tmp_path):
+    monkeypatch.setattr(Web, 'do_get', vod_get)
+    monkeypatch.chdir(tmp_path)  # the lists save their details in the (empty) profile folder
+    addon = proxy_addon()
+    proxy, thread = start_proxy(addon, None)
+    proxy.session.customerInfo = {'cityId': '1'}
+    proxy.session.activeProfile = {'profileId': 'profile', 'shared': False}
+    return addon, proxy, thread
+
+
+class TestAsyncProxyHelper:
+    def test_submit_and_timeout(self, monkeypatch, tmp_path):
+        addon, proxy, thread = start_vod_proxy(monkeypatch, tmp_path)
+        try:
+            with AsyncProxyHelper(addon) as rpc:
+                futures = [rpc.submit(LoginSession.obtain_asset_details, {'assetId': 'asset-1'}),
+                           rpc.submit(LoginSession.obtain_asset_details, {'assetId': 'asset-13'}),
+                           rpc.submit(LoginSession.obtain_asset_details, {'assetId': 'asset-2'}, timeout=0.01)]
+                results = rpc.wait_all(futures)
+            assert results[0]['id'] == 'asset-1'
+            assert isinstance(results[1], WebException) and results[1].status == 404
+            assert isinstance(results[2], Exception)  # timed out
+        finally:
+            stop_proxy(proxy, thread)
+
+    def test_cancel(self, monkeypatch, tmp_path):
+        addon, proxy, thread = start_vod_proxy(monkeypatch, tmp_path)
+        try:
+            with AsyncProxyHelper(addon, maxWorkers=2) as rpc:
+                futures = [rpc.submit(LoginSession.obtain_asset_details, {'assetId': 'asset-{0}'.format(i)})
+                           for i in range(ITEMS)]
+                results = rpc.wait_all(futures, progress=lambda done, total: done < 4)
+            cancelled = sum(1 for result in results if isinstance(result, CancelledError))
+            assert sum(1 for result in results if isinstance(result, dict)) >= 4
+            assert cancelled >= ITEMS - 8
+        finally:
+            stop_proxy(proxy, thread)
+
+    def test_bulk_details(self, monkeypatch, tmp_path):
+        # pylint: disable=too-many-locals
+        addon, proxy, thread = start_vod_proxy(monkeypatch, tmp_path)
+        try:
+            movies = MovieList(addon, 'ASSET')
+            start = time.perf_counter()
+            errors = 0
+            for movie in movies.movies[:ITEMS // 2]:
+                try:
+                    errors += movies.update_details(movie)
+                except WebException:
+                    errors += 1
+            sequential = time.perf_counter() - start
+
+            progress = []
+            lock = threading.Lock()
+
+            def record(done, total):
+                with lock:
+                    progress.append((done, total))
+                return True
+
+            start = time.perf_counter()
+            errors = movies.update_details_bulk(movies.movies[ITEMS // 2:], progress=record)
+            bulk = time.perf_counter() - start
+            print('\ndetails of {0} movies with {1:.0f}ms latency: sequential {2:.0f}ms, bulk {3:.0f}ms'.format(
+                ITEMS // 2, LATENCY * 1000, sequential * 1000, bulk * 1000))
+            assert errors == 0
+            assert all(movie.hasdetails for movie in movies.movies if not movie.id.endswith('-13'))
+            assert progress[-1] == (ITEMS // 2, ITEMS // 2)
+            assert bulk < ITEMS // 2 * LATENCY  # the lower bound of sequential requests
+
+            series = SeriesList(addon, 'SERIES')
+            assert series.update_season_details_bulk(series.series) == 0
+            assert all(serie.hasdetails and serie.title == 'Serie' for serie in series.series)
+            assert [details['id'] for details in series.seriesDetails] == [serie.id for serie in series.series]
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,75 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import time
+
+import pytest
+
+from resources.lib.avstream import StreamSession
+from resources.lib.utils import ProxyHelper, WebException
+from resources.lib.webcalls import LoginSession, Web
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+from tests_pytest.test_sessionlocking import LATENCY, EventsResponse, slow_get
+
+pytestmark = pytest.mark.standin
+
+
+class TestBatch:
+    def test_batch(self, monkeypatch):
+        monkeypatch.setattr(Web, 'do_get', slow_get)
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        try:
+            start = time.perf_counter()
+            results = helper.dynamic_batch([
+                (LoginSession.get_events, {'startTime': '20240101000000'}),
+                (LoginSession.get_events, {'startTime': '20240101060000'}),
+                (LoginSession.get_events, {'startTime': '20240101120000'}),
+                (LoginSession.get_extra_headers, {}),
+                (LoginSession.get_recording_details, {'recordingId': None}),  # fails
+                (StreamSession.get_registry_statistics, {}),
+            ])
+            elapsed = time.perf_counter() - start
+            print('\nbatch of 3 calls with {0:.0f}ms latency: {1:.0f}ms'.format(LATENCY * 1000, elapsed * 1000))
+            assert results[:4] == [{'entries': []}] * 3 + [{}]
+            assert isinstance(results[4], WebException)
+            assert results[5]['defined'] == 1
+            assert elapsed < LATENCY * 3  # the get_events calls are executed concurrently, not one after the other
+            assert proxy.statistics()['requests'] == 1
+        finally:
+            stop_proxy(proxy, thread)
+
+    def test_mutations_in_order(self, monkeypatch):
+        done = []
+
+        def logged_get(self, url, **kwargs):
+            # pylint: disable=unused-argument
+            time.sleep(LATENCY / 2)
+            done.append('get')
+            return EventsResponse()
+
+        def logged_delete(self, url, **kwargs):
+            # pylint: disable=unused-argument
+            recordingId = url.rsplit('/', 1)[1]
+            time.sleep(LATENCY if recordingId == 'first' else 0)  # the second is done first when not in order
+            done.append(recordingId)
+            return EventsResponse()
+
+        monkeypatch.setattr(Web, 'do_get', logged_get)
+        monkeypatch.setattr(Web, 'do_delete', logged_delete)
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        proxy.session.sessionInfo = {'householdId': 'household'}
+        helper = ProxyHelper(addon)
+        try:
+            results = helper.dynamic_batch([
+                (LoginSession.get_events, {'startTime': '20240101000000'}),
+                (LoginSession.delete_recordings_planned, {'event': 'first'}),
+                (LoginSession.delete_recordings, {'event': 'second'}),
+                (LoginSession.get_events, {'startTime': '20240101060000'}),
+                (LoginSession.get_events, {'startTime': '20240101120000'}),
+                (LoginSession.delete_recordings, {'event': 'third'}),
+            ])
+            assert results == [{'entries': []}] * 6
+            assert done == ['get', 'first', 'second', 'get', 'get', 'third']
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,137 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import threading
+import time
+
+import pytest
+
+from resources.lib import changefeed
+from resources.lib.changefeed import ChangeFeed
+from resources.lib.utils import ChangeTracker, ProxyHelper
+from resources.lib.webcalls import LoginSession, Web
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+
+class EventsResponse:
+    # pylint: disable=too-few-public-methods
+    def __init__(self, title):
+        self.status_code = 200
+        self.content = ('{"entries": [{"channelId": "NL_000001_019401", "events": [{"title": "%s"}]}]}'
+                        % title).encode('utf-8')
+        self.headers = {}
+
+
+class Home:
+    """
+    The positions stored by SharedProperties, the window properties of the xbmcgui stub are not kept
+    """
+    def __init__(self):
+        self.positions = {}
+
+    def set_change_position(self, name, feedId, version):
+        self.positions[name] = (feedId, version)
+
+    def get_change_position(self, name):
+        return self.positions.get(name, (None, 0))
+
+
+class TestChangeFeed:
+    def test_versions(self):
+        feed = ChangeFeed(maxEvents=3)
+        first = feed.changes(0)
+        assert first['reset'] and first['version'] == 0
+        assert feed.changes(0, first['feed']) == {'feed': feed.feedId, 'version': 0, 'events': [], 'reset': False}
+        feed.publish(changefeed.CHANNELS)
+        feed.publish(changefeed.EPG, '20240101000000')
+        result = feed.changes(0, feed.feedId)
+        assert [(e['version'], e['topic'], e['key']) for e in result['events']] == [
+            (1, 'channels', None), (2, 'epg', '20240101000000')]
+        assert feed.changes(1, feed.feedId)['events'][0]['version'] == 2
+        for _ in range(3):
+            feed.publish(changefeed.RECORDINGS)
+        assert feed.changes(1, feed.feedId)['reset']  # events 2 is no longer kept
+        assert not feed.changes(2, feed.feedId)['reset']
+        assert feed.changes(2, 'restarted')['reset']
+
+    def test_publish_if_changed(self):
+        feed = ChangeFeed()
+        assert not feed.publish_if_changed(changefeed.EPG, 'a', b'1')  # first seen
+        assert not feed.publish_if_changed(changefeed.EPG, 'a', b'1')
+        assert not feed.publish_if_changed(changefeed.EPG, 'b', b'2')
+        assert feed.publish_if_changed(changefeed.EPG, 'a', b'3')
+        assert feed.version == 1
+
+    def test_long_poll(self):
+        feed = ChangeFeed()
+        waiting = threading.Event()
+        outcomes = []
+        wait_for = feed.condition.wait_for
+
+        def signal_and_wait_for(predicate, timeout):
+            waiting.set()
+            outcomes.append(wait_for(predicate, timeout))
+            return outcomes[-1]
+
+        feed.condition.wait_for = signal_and_wait_for
+        results = []
+
+        def poll(since):
+            waiting.clear()
+            thread = threading.Thread(target=lambda: results.append(feed.changes(since, feed.feedId, timeout=5)))
+            thread.start()
+            assert waiting.wait(5)  # the client waits for a change
+            return thread
+
+        thread = poll(0)
+        feed.publish(changefeed.RECORDINGS)
+        thread.join()
+        assert outcomes == [True] and results[-1]['events'][0]['topic'] == 'recordings'
+
+        # Without a change the wait ends at the timeout
+        assert feed.changes(1, feed.feedId, timeout=0.01)['events'] == []
+        assert outcomes[-1] is False
+
+        # Closing the feed releases the waiting client
+        thread = poll(1)
+        feed.close()
+        thread.join()
+        assert outcomes[-1] is True and results[-1]['events'] == []
+
+    def test_tracker_via_proxy(self, monkeypatch):
+        titles = {'20240101000000': 'Journaal'}
+        monkeypatch.setattr(Web, 'do_get', lambda self, url, **kwargs: EventsResponse(titles[url[-14:]]))
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        home = Home()
+        try:
+            tracker = ChangeTracker(helper, topics=[changefeed.EPG], name='test', home=home)
+            assert tracker.poll() == {'epg': {None}}  # first poll: everything
+            assert home.get_change_position('test') == (proxy.session.changeFeed.feedId, 0)
+            assert tracker.poll() == {}
+
+            helper.dynamic_call(LoginSession.get_events, startTime='20240101000000')
+            helper.dynamic_call(LoginSession.get_events, startTime='20240101000000')
+            assert tracker.poll() == {}
+            titles['20240101000000'] = 'Weerbericht'
+            helper.dynamic_call(LoginSession.get_events, startTime='20240101000000')
+            assert tracker.poll() == {'epg': {'20240101000000'}}
+
+            # A tracker with the same name continues at the position reached
+            assert ChangeTracker(helper, topics=[changefeed.EPG], name='test', home=home).poll() == {}
+
+            # Long-poll: the window waits for the change of another window
+            other = ProxyHelper(addon)
+            titles['20240101000000'] = 'Sport'
+            threading.Timer(0.2, lambda: other.dynamic_call(LoginSession.get_events,
+                                                            startTime='20240101000000')).start()
+            start = time.perf_counter()
+            assert tracker.poll(timeout=5) == {'epg': {'20240101000000'}}
+            print('\nchange received after {0:.0f}ms'.format((time.perf_counter() - start) * 1000))
+
+            # The recordings topic is not tracked
+            proxy.session.changeFeed.publish(changefeed.RECORDINGS)
+            assert tracker.poll() == {}
+        finally:
+            stop_proxy(proxy, thread)
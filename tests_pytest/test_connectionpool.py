@@ -0,0 +1,68 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import ssl
+import time
+
+import pytest
+
+from resources.lib.connectionpool import UpstreamConnectionPool
+from tests_pytest.standinserver import SEGMENT, StandInServer, create_certificate, fetch_segments, percentile, \
+    proxy_addon, segment_route, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+
+class TestConnectionPool:
+    def test_reuse_and_eviction(self):
+        with StandInServer(segment_route) as origin:
+            pool = UpstreamConnectionPool(maxSize=2, idleTimeout=0.2)
+            for _ in range(5):
+                connection, response = pool.request('GET', origin.url + '/segment.m4s')
+                assert response.read() == SEGMENT
+                pool.release(connection, reusable=response.isclosed())
+            assert pool.statistics()['created'] == 1
+            assert pool.statistics()['reused'] == 4
+            assert origin.connections == 1
+
+            time.sleep(0.3)
+            connection, response = pool.request('GET', origin.url + '/segment.m4s')
+            response.read()
+            pool.release(connection)
+            assert pool.statistics()['evicted'] == 1
+            assert origin.connections == 2
+            pool.close_all()
+            assert pool.statistics()['idle'] == 0
+
+    def test_stale_connection_is_replaced(self):
+        with StandInServer(segment_route) as origin:
+            pool = UpstreamConnectionPool(maxSize=2)
+            connection, response = pool.request('GET', origin.url + '/segment.m4s')
+            response.read()
+            connection.sock.shutdown(2)  # simulate a connection closed by the host while idle
+            pool.release(connection)
+            connection, response = pool.request('GET', origin.url + '/segment.m4s')
+            assert response.read() == SEGMENT
+            pool.release(connection)
+            assert pool.statistics()['created'] == 2
+
+    def test_relay_benchmark(self, tmp_path):
+        certfile, keyfile = create_certificate(tmp_path)
+        addon = proxy_addon()
+        with StandInServer(segment_route, certfile=certfile, keyfile=keyfile) as origin:
+            proxy, thread = start_proxy(addon, origin.url + '/dash/bench/manifest.mpd')
+            proxy.connectionPool.sslContext = ssl.create_default_context(cafile=certfile)
+            try:
+                results = {}
+                for label, poolSize in (('new connection per segment', 0), ('pooled', 4)):
+                    proxy.connectionPool.maxSize = poolSize
+                    proxy.connectionPool.close_all()
+                    origin.reset_counters()
+                    latencies = fetch_segments(addon, 100)
+                    latencies.extend(fetch_segments(addon, 20, '/chunked-{0}.m4s'))
+                    results[label] = origin.connections
+                    print('{0}: handshakes={1} p50={2:.2f}ms p99={3:.2f}ms'.format(
+                        label, origin.connections,
+                        percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+                assert results['new connection per segment'] == 120
+                assert results['pooled'] <= 4
+            finally:
+                stop_proxy(proxy, thread)
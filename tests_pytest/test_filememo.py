@@ -0,0 +1,111 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import json
+import os
+import time
+
+import pytest
+
+from resources.lib import rpcframing
+from resources.lib.channel import Channel
+from resources.lib.globals import G
+from resources.lib.utils import ProxyHelper
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import percentile, proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+CHANNELS = 400
+ROUNDS = 50
+
+
+def channel_info(count, name='Kanaal'):
+    return [{'id': 'NL_{0:06d}_019{0}'.format(i),
+             'name': '{0} {1}'.format(name, i),
+             'logicalChannelNumber': i,
+             'isHidden': i % 50 == 49,
+             'logo': {'focused': 'https://static.example.com/logo/{0}.png'.format(i)},
+             'locators': {'Orion-DASH': 'https://live.example.com/{0}/manifest.mpd'.format(i)},
+             'locator': 'https://live.example.com/{0}/manifest.mpd'.format(i),
+             'genre': ['Algemeen'],
+             'linearProducts': ['product-{0}'.format(p) for p in range(20)]} for i in range(count)]
+
+
+def uncached_channels(session):
+    """
+    LoginSession.get_channels before the memo: read, parse and build the channels on every call
+    """
+    with open(session.pluginpath(G.CHANNEL_INFO), encoding='utf-8') as file:
+        channelInfo = json.loads(file.read())
+    return [Channel(info) for info in channelInfo if not info.get('isHidden', False)]
+
+
+def uncached_call(proxy, helper):
+    proxy.session.fileMemo.invalidate()
+    return helper.dynamic_call(LoginSession.get_channels)
+
+
+def measure(call):
+    values = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        call()
+        values.append(time.perf_counter() - start)
+    return percentile(values, 50)
+
+
+class TestFileMemo:
+    def test_channels_memo(self, tmp_path):
+        addon = proxy_addon()
+        session = LoginSession(addon)
+        session.addonPath = str(tmp_path) + os.sep
+        assert session.get_channels() == []
+        assert session.get_entitlements() == {}
+
+        path = session.pluginpath(G.CHANNEL_INFO)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(channel_info(10), file)
+        channels = session.get_channels()
+        assert [channel.name for channel in channels] == ['Kanaal {0}'.format(i) for i in range(10)]
+        assert session.get_channels() is channels
+        assert session.fileMemo.statistics() == {'entries': 1, 'hits': 1, 'misses': 1}
+
+        # Written by another process: the modification time changes
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(channel_info(5, 'Zender'), file)
+        os.utime(path, ns=(time.time_ns() + 10 ** 9, time.time_ns() + 10 ** 9))
+        assert [channel.name for channel in session.get_channels()][0] == 'Zender 0'
+
+        # Written by the session: invalidated, even within the resolution of the modification time
+        stat = os.stat(path)
+        session._LoginSession__save_info(G.CHANNEL_INFO, channel_info(5, 'Omroep'))  # pylint: disable=protected-access
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert [channel.name for channel in session.get_channels()][0] == 'Omroep 0'
+
+    def test_frames_reused(self, tmp_path):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        proxy.session.addonPath = str(tmp_path) + os.sep
+        with open(proxy.session.pluginpath(G.CHANNEL_INFO), 'w', encoding='utf-8') as file:
+            json.dump(channel_info(CHANNELS), file)
+        with open(proxy.session.pluginpath(G.ENTITLEMENTS_INFO), 'w', encoding='utf-8') as file:
+            json.dump({'entitlements': [{'id': 'product-1'}]}, file)
+        helper = ProxyHelper(addon)
+        try:
+            channels = helper.dynamic_call(LoginSession.get_channels)
+            assert len(channels) == CHANNELS - CHANNELS // 50
+            assert [c.id for c in helper.dynamic_call(LoginSession.get_channels)] == [c.id for c in channels]
+            assert helper.dynamic_call(LoginSession.get_entitlements) == {'entitlements': [{'id': 'product-1'}]}
+            assert proxy.statistics()['frameHits'] == 1
+
+            service = measure(lambda: rpcframing.encode_frame(uncached_channels(proxy.session)))
+            uncached = measure(lambda: uncached_call(proxy, helper))
+            hits = proxy.statistics()['frameHits']
+            memoized = measure(lambda: helper.dynamic_call(LoginSession.get_channels))
+            print('\nget_channels with {0} channels p50: service parse, build and pickle {1:.2f}ms, '
+                  'call {2:.2f}ms, memoized call {3:.2f}ms'.format(CHANNELS, service * 1000, uncached * 1000,
+                                                                  memoized * 1000))
+            # Every memoized call sends the frame encoded before, the times are only printed
+            assert hits == 1
+            assert proxy.statistics()['frameHits'] == 1 + ROUNDS
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,221 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import json
+import os
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import pytest
+
+from resources.lib.globals import G
+from resources.lib.httpcache import HttpCache
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon
+from tests_pytest.test_filememo import channel_info
+from tests_pytest.test_streamrpc import epg_document
+
+pytestmark = pytest.mark.standin
+
+LAST_MODIFIED = 'Mon, 01 Jan 2024 06:00:00 GMT'
+
+
+class Upstream:
+    """
+    Documents of the stand-in server, the channels and entitlements with an ETag, the EPG with Last-Modified.
+    Counts the full (200) and Not Modified (304) responses.
+    """
+    def __init__(self):
+        self.documents = {'/channels': json.dumps(channel_info(100)).encode('utf-8'),
+                          '/household/entitlements': b'{"entitlements": [{"id": "basis"}]}',
+                          '/epg/20240101060000': epg_document(50),
+                          '/recordings': b'{"data": []}'}
+        self.full = 0
+        self.notModified = 0
+
+    def route(self, handler):
+        path = handler.path.split('?')[0]
+        document = self.documents[path]
+        etag = '"{0:08x}"'.format(zlib.crc32(document))
+        if path.startswith('/epg/'):
+            validators = {'Last-Modified': LAST_MODIFIED}
+            notModified = handler.headers.get('If-Modified-Since') == LAST_MODIFIED
+        else:
+            validators = {'ETag': etag}
+            notModified = handler.headers.get('If-None-Match') == etag
+        if notModified:
+            self.notModified += 1
+            handler.send_response(304)
+            for key, value in validators.items():
+                handler.send_header(key, value)
+            handler.end_headers()
+            return
+        self.full += 1
+        handler.send_body(document, contentType='application/json', headers=validators)
+
+    def counters(self):
+        return self.full, self.notModified
+
+
+def cached_session(monkeypatch, tmp_path, upstream):
+    monkeypatch.setattr(G, 'CHANNELS_URL', upstream.url + '/channels')
+    monkeypatch.setattr(G, 'ENTITLEMENTS_URL', upstream.url + '/{householdid}/entitlements')
+    monkeypatch.setattr(G, 'EVENTS_URL', upstream.url + '/epg/')
+    monkeypatch.chdir(tmp_path)  # the cache is created in the (empty) profile folder
+    addon = proxy_addon()
+    addon.setSettingNumber('http-cache-size', 1)
+    session = LoginSession(addon)
+    session.customerInfo = {'cityId': '65535'}
+    session.sessionInfo = {'householdId': 'household'}
+    return session
+
+
+def expire(session, url):
+    # Pretend the response was validated longer ago than its ttl
+    path = os.path.join(session.httpCache.directory, [name for name in os.listdir(session.httpCache.directory)
+                                                      if url in read_url(session, name)][0])
+    past = time.time() - 86400
+    os.utime(path, (past, past))
+
+
+def read_url(session, name):
+    with open(os.path.join(session.httpCache.directory, name), 'rb') as file:
+        return json.loads(file.readline())['url']
+
+
+def response(body, headers):
+    result = requests.Response()
+    result.status_code = 200
+    result.headers = CaseInsensitiveDict(headers)
+    result._content = body  # pylint: disable=protected-access
+    return result
+
+
+class TestHttpCache:
+    def test_conditional_get(self, monkeypatch, tmp_path):
+        upstream = Upstream()
+        with StandInServer(upstream.route) as server:
+            session = cached_session(monkeypatch, tmp_path, server)
+            session.refresh_channels()
+            channels = session.get_channels()
+            assert upstream.counters() == (1, 0)
+
+            # Within the ttl the cached response is used without asking the host
+            session.refresh_channels()
+            assert upstream.counters() == (1, 0)
+
+            # After the ttl it is revalidated: 304, served from the cache
+            expire(session, '/channels')
+            session.refresh_channels()
+            assert upstream.counters() == (1, 1)
+            assert [channel.name for channel in session.get_channels()] == [channel.name for channel in channels]
+
+            # Changed upstream: full response
+            upstream.documents['/channels'] = json.dumps(channel_info(101)).encode('utf-8')
+            expire(session, '/channels')
+            session.refresh_channels()
+            assert upstream.counters() == (2, 1)
+            assert len(session.get_channels()) == len(channels) + 1
+
+            # The entitlements are always revalidated
+            for _ in range(3):
+                session.refresh_entitlements()
+            assert session.get_entitlements() == {'entitlements': [{'id': 'basis'}]}
+            assert upstream.counters() == (3, 3)
+
+            # The EPG is revalidated with If-Modified-Since
+            events = session.get_events('20240101060000')
+            expire(session, '/epg/')
+            assert session.get_events('20240101060000') == events
+            assert upstream.counters() == (4, 4)
+
+            assert session.httpCache.statistics() == {'hits': 1, 'revalidated': 4, 'misses': 3, 'stored': 4,
+                                                      'evicted': 0, 'files': 3,
+                                                      'totalBytes': session.httpCache.totalBytes}
+
+    def test_streamed_epg(self, monkeypatch, tmp_path):
+        upstream = Upstream()
+        with StandInServer(upstream.route) as server:
+            session = cached_session(monkeypatch, tmp_path, server)
+            expected = json.loads(upstream.documents['/epg/20240101060000'])['entries']
+            assert list(session.stream_events('20240101060000')) == expected
+            assert upstream.counters() == (1, 0) and session.httpCache.statistics()['stored'] == 1
+
+            # Within the ttl the entries are read from the cache, after it they are revalidated
+            assert list(session.stream_events('20240101060000')) == expected
+            assert upstream.counters() == (1, 0)
+            expire(session, '/epg/')
+            assert list(session.stream_events('20240101060000')) == expected
+            assert upstream.counters() == (1, 1)
+
+            # A response which is not read completely is not stored
+            session.httpCache.remove(G.EVENTS_URL + '20240101060000')
+            entries = session.stream_events('20240101060000')
+            next(entries)
+            entries.close()
+            assert G.EVENTS_URL + '20240101060000' not in session.httpCache
+            assert session.httpCache.statistics()['stored'] == 1
+
+    def test_uncached_urls(self, monkeypatch, tmp_path):
+        upstream = Upstream()
+        with StandInServer(upstream.route) as server:
+            session = cached_session(monkeypatch, tmp_path, server)
+            for _ in range(2):
+                assert session.do_get(server.url + '/recordings').json() == {'data': []}
+            assert upstream.counters() == (2, 0)
+            assert session.httpCache.statistics()['files'] == 0
+
+            # Disabled
+            addon = proxy_addon()
+            assert LoginSession(addon).httpCache is None
+
+    def test_bandwidth(self, monkeypatch, tmp_path):
+        upstream = Upstream()
+        with StandInServer(upstream.route) as server:
+            session = cached_session(monkeypatch, tmp_path, server)
+            monkeypatch.setattr(session.httpCache, 'policies', [(pattern, 0) for pattern, _ in
+                                                                session.httpCache.policies])
+            rounds = 20
+            received = 0
+            start = time.perf_counter()
+            for _ in range(rounds):
+                received += len(session.do_get(G.EVENTS_URL + '20240101060000').content)
+            elapsed = time.perf_counter() - start
+            full, notModified = upstream.counters()
+            assert (full, notModified) == (1, rounds - 1)
+            print('\nEPG {0} times: {1} full and {2} 304 responses, {3} KiB sent instead of {4} KiB, '
+                  '{5:.1f}ms per call'.format(rounds, full, notModified,
+                                              len(upstream.documents['/epg/20240101060000']) // 1024,
+                                              received // 1024, elapsed / rounds * 1000))
+
+    def test_lru(self, tmp_path):
+        directory = str(tmp_path / G.HTTP_CACHE)
+        cache = HttpCache(directory, 1200, [('https://example.com/', 60)])
+        body = b'x' * 300
+        for name in ('a', 'b', 'c'):
+            cache.put('https://example.com/' + name, response(body, {'ETag': '"{0}"'.format(name)}))
+        assert cache.get('https://example.com/a').validators() == {'If-None-Match': '"a"'}
+        cache.put('https://example.com/d', response(body, {}))
+        assert cache.get('https://example.com/b') is None  # least recently used
+        assert cache.statistics()['evicted'] == 1 and cache.statistics()['files'] == 3
+        assert cache.get('https://example.com/a').to_response('https://example.com/a').content == body
+
+        # Not matching a policy, not complete or too large: not stored
+        cache.put('https://example.org/', response(body, {}))
+        cache.put('https://example.com/large', response(b'x' * 1201, {}))
+        failed = response(body, {})
+        failed.status_code = 500
+        cache.put('https://example.com/failed', failed)
+        assert cache.statistics()['stored'] == 4
+
+        # The files are kept in a new session, the size limit applies
+        reloaded = HttpCache(directory, 800, [('https://example.com/', 60)])
+        assert reloaded.statistics()['files'] == 2
+        assert reloaded.get('https://example.com/d').body == body
+
+    def test_validators(self, tmp_path):
+        cache = HttpCache(str(tmp_path / G.HTTP_CACHE), 1200, [('https://example.com/', 60)])
+        cache.put('https://example.com/a', response(b'{}', {'etag': '"a"', 'last-modified': LAST_MODIFIED}))
+        assert cache.get('https://example.com/a').validators() == {'If-None-Match': '"a"',
+                                                                   'If-Modified-Since': LAST_MODIFIED}
@@ -0,0 +1,110 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import base64
+import pickle
+from http.client import HTTPConnection
+from urllib.parse import quote
+
+import pytest
+
+from tests_pytest.standinserver import SEGMENT, StandInServer, proxy_addon, segment_route, start_proxy, stop_proxy
+from tests_pytest.test_manifestcache import ManifestResponse
+from tests_pytest.test_timeshift import live_manifest
+
+pytestmark = pytest.mark.standin
+
+SEGMENT_DURATION = 2  # seconds
+PLAYBACK = 60  # seconds
+
+
+def manifest_path():
+    return '/manifest?path={0}&hostname={1}'.format(quote('/live/bench/manifest.mpd'), 'live.example.com')
+
+
+def function_path(method, **kwargs):
+    return '/function/{0}?args={1}'.format(method, quote(base64.b64encode(pickle.dumps(kwargs))))
+
+
+def playback_requests():
+    """
+    The requests of InputStream Adaptive during a minute of live playback: a manifest refresh, a video and an
+    audio segment every segment duration
+    """
+    requests = []
+    for i in range(PLAYBACK // SEGMENT_DURATION):
+        requests.append(manifest_path())
+        requests.append('/live/bench/video-{0}.m4s'.format(i * 2000))
+        requests.append('/live/bench/audio-{0}.m4s'.format(i * 2000))
+    return requests
+
+
+def load_generator(addon, requests, keepAlive):
+    connection = None
+    for path in requests:
+        if connection is None:
+            connection = HTTPConnection(addon.getSetting('proxy-ip'), addon.getSettingInt('proxy-port'), timeout=5)
+        connection.request('GET', path, headers={'x-streaming-token': 'benchtoken'})
+        response = connection.getresponse()
+        body = response.read()
+        assert response.status == 200
+        assert body == (live_manifest(0) if path.startswith('/manifest') else SEGMENT)
+        if not keepAlive:
+            connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+
+
+def run_playback(keepAlive):
+    addon = proxy_addon()
+    addon.setSettingNumber('prefetch-segments', 0)
+    with StandInServer(segment_route) as origin:
+        proxy, thread = start_proxy(addon, origin.url)
+        manifest = ManifestResponse(live_manifest(0), {'Cache-Control': 'no-cache'})
+        manifest.url = origin.url + '/live/bench/manifest.mpd'
+        proxy.session.get_manifest = lambda url: manifest
+        try:
+            load_generator(addon, playback_requests(), keepAlive)
+            return proxy.statistics()
+        finally:
+            stop_proxy(proxy, thread)
+
+
+class TestKeepAlive:
+    def test_connections_per_minute(self):
+        closing = run_playback(keepAlive=False)
+        keptAlive = run_playback(keepAlive=True)
+        print('\nper minute of playback, new connection per request: connections={0} threads={1}'.format(
+            closing['connections'], closing['threads']))
+        print('per minute of playback, kept-alive connection: connections={0} threads={1}'.format(
+            keptAlive['connections'], keptAlive['threads']))
+        assert closing['requests'] == keptAlive['requests'] == 3 * PLAYBACK // SEGMENT_DURATION
+        assert closing['connections'] == closing['requests']
+        assert keptAlive['connections'] == 1
+        assert keptAlive['threads'] == 1
+
+    def test_framing_of_error_responses(self):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        try:
+            connection = HTTPConnection(addon.getSetting('proxy-ip'), addon.getSettingInt('proxy-port'), timeout=5)
+            expected = [
+                ('GET', '/manifest?path=missing', 404),
+                ('GET', '/segment.m4s', 500),  # x-streaming-token missing
+                ('GET', '/function/LoginSession.get_extra_headers', 400),
+                ('GET', function_path('LoginSession.get_extra_headers'), 200),
+                ('GET', function_path('LoginSession.no_such_method'), 500),
+                ('POST', '/unknown', 404),
+                ('HEAD', '/unknown', 501),
+                ('OPTIONS', '/license', 200),
+            ]
+            for method, path, status in expected:
+                headers = {'x-streaming-token': 'benchtoken'} if path != '/segment.m4s' else {}
+                connection.request(method, path, body=b'challenge' if method == 'POST' else None, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                assert response.status == status, path
+                assert not response.will_close, path
+            assert proxy.statistics()['connections'] == 1
+            connection.close()
+        finally:
+            stop_proxy(proxy, thread)
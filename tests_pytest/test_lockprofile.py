@@ -0,0 +1,148 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import json
+import threading
+import time
+
+import requests
+
+import pytest
+
+from resources.lib.globals import G
+from resources.lib.lockprofile import Histogram, LockProfile
+from resources.lib.proxyserver import ProxyServer
+from resources.lib.utils import KodiLock, ProxyHelper
+from resources.lib.webcalls import LoginSession, session_region
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+HOLD = 0.02
+ACQUISITIONS = 100000
+
+
+def holder(lock, holding):
+    with lock:
+        holding.set()
+        time.sleep(HOLD)
+
+
+def waiter(lock):
+    lock.acquire()
+    lock.release()
+
+
+def slow_close(self):
+    # pylint: disable=unused-argument
+    time.sleep(HOLD)
+
+
+slow_close.__qualname__ = 'LoginSession.close'  # the name sent by ProxyHelper
+slow_logout = session_region(slow_close)  # takes the session lock instead of the global lock
+
+
+def lock_cost(lock):
+    start = time.perf_counter()
+    for _ in range(ACQUISITIONS):
+        with lock:
+            pass
+    return (time.perf_counter() - start) / ACQUISITIONS
+
+
+class TestLockProfile:
+    def test_histogram(self):
+        histogram = Histogram()
+        for seconds in (0.0000005, 0.0003, 0.0003, 0.002, 1.5):
+            histogram.add(seconds)
+        assert histogram.count == 5 and histogram.max == 1.5
+        assert histogram.percentile(50) == 512 / 1e6  # 300us is in the bucket up to 512us
+        assert histogram.percentile(100) == 1.5
+        assert [count for _, count in histogram.to_dict()['buckets']] == [1, 2, 1, 1]
+
+    def test_wait_and_hold(self):
+        lock = KodiLock(LockProfile())
+        holding = threading.Event()
+        thread = threading.Thread(target=holder, args=(lock, holding))
+        thread.start()
+        holding.wait()
+        waiter(lock)
+        thread.join()
+        lock.acquire(site='LoginSession.close')
+        lock.release()
+
+        sites = {site['site'].split(' ')[0]: site for site in lock.profile.statistics()['sites']}
+        assert set(sites) == {'holder', 'waiter', 'LoginSession.close'}
+        # Lower bounds only: the holder sleeps HOLD with the lock, the waiter asks for it while it is held
+        assert sites['holder']['hold']['totalMs'] >= HOLD * 1000 / 2
+        assert sites['waiter']['wait']['totalMs'] > 0 and sites['waiter']['wait']['count'] == 1
+        assert list(sites)[0] == 'waiter'  # longest wait first
+        assert sites['holder']['site'].startswith('holder (test_lockprofile.py:')
+
+    def test_sampling(self):
+        lock = KodiLock(LockProfile(sampleEvery=10))
+        for _ in range(100):
+            with lock:
+                pass
+        statistics = lock.profile.statistics()
+        assert statistics['acquisitions'] == 100
+        assert statistics['sites'][0]['wait']['count'] == 10
+
+        plain = lock_cost(KodiLock())
+        sampled = lock_cost(KodiLock(LockProfile(sampleEvery=100)))
+        every = lock_cost(KodiLock(LockProfile()))
+        print('\nKodiLock with: {0:.0f}ns, profiled 1 in 100 {1:.0f}ns, every acquisition {2:.0f}ns'.format(
+            plain * 1e9, sampled * 1e9, every * 1e9))
+
+
+class TestLockProfileViaProxy:
+    def test_debug_locks(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)  # the profile is written to the (empty) profile folder at stop
+        monkeypatch.setattr(LoginSession, 'close', slow_close)
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        url = 'http://127.0.0.1:{0}/debug/locks'.format(addon.getSetting('proxy-port'))
+        try:
+            assert requests.get(url, timeout=5).status_code == 404
+            proxy.lock = KodiLock(LockProfile())
+            calls = [threading.Thread(target=ProxyHelper(addon).dynamic_call, args=(LoginSession.close,))
+                     for _ in range(3)]
+            for call in calls:
+                call.start()
+            for call in calls:
+                call.join()
+            assert ProxyHelper(addon).dynamic_call(LoginSession.get_extra_headers) == {}  # not locked
+
+            statistics = requests.get(url, timeout=5).json()
+            assert statistics['acquisitions'] == 3
+            site = statistics['sites'][0]
+            assert site['site'] == 'LoginSession.close'
+            # Counts, the waits depend on when the calls arrive
+            assert site['hold']['count'] == 3 and site['wait']['count'] == 3
+            assert site['hold']['totalMs'] >= 3 * HOLD * 1000 / 2
+        finally:
+            stop_proxy(proxy, thread)
+        with open(tmp_path / G.LOCK_PROFILE_FILE, encoding='utf-8') as file:
+            assert json.load(file)['sites'][0]['site'] == 'LoginSession.close'
+
+    def test_session_lock(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(LoginSession, 'close', slow_logout)
+        addon = proxy_addon()
+        proxy = ProxyServer(addon, ('127.0.0.1', int(addon.getSettingNumber('proxy-port'))), KodiLock(LockProfile()))
+        thread = threading.Thread(target=proxy.serve_forever)
+        thread.start()
+        url = 'http://127.0.0.1:{0}/debug/locks'.format(addon.getSetting('proxy-port'))
+        try:
+            calls = [threading.Thread(target=ProxyHelper(addon).dynamic_call, args=(LoginSession.close,))
+                     for _ in range(3)]
+            for call in calls:
+                call.start()
+            for call in calls:
+                call.join()
+
+            statistics = requests.get(url, timeout=5).json()
+            assert statistics['acquisitions'] == 3  # the session lock only, the global lock is not taken
+            site = statistics['sites'][0]
+            assert site['site'] == 'LoginSession.close'
+            assert site['hold']['count'] == 3 and site['wait']['count'] == 3
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,78 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import quote
+
+import pytest
+
+from resources.lib.manifestcache import CachedManifest, ManifestCache
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+from tests_pytest.test_timeshift import live_manifest
+
+pytestmark = pytest.mark.standin
+
+
+class ManifestResponse:
+    def __init__(self, content, headers=None):
+        self.status_code = 200
+        self.content = content
+        self.headers = headers or {}
+        self.url = 'https://live.example.com/live/bench/manifest.mpd'
+
+
+class TestManifestCache:
+    def test_time_to_live(self):
+        manifest = live_manifest(0)
+        assert ManifestCache.time_to_live({}, manifest) == 2
+        assert ManifestCache.time_to_live({'Cache-Control': 'max-age=1'}, manifest) == 1
+        assert ManifestCache.time_to_live({'Cache-Control': 'no-cache'}, manifest) == 0
+        assert ManifestCache.time_to_live({}, b'<MPD type="static"/>') == 0
+
+    def test_single_flight(self):
+        cache = ManifestCache()
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            time.sleep(0.2)
+            return CachedManifest(200, b'<MPD/>', 0.5)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('/manifest', fetch)))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(fetches) == 1
+        assert len(results) == 10
+        cache.get('/manifest', fetch)
+        time.sleep(0.5)
+        cache.get('/manifest', fetch)
+        statistics = cache.statistics()
+        assert statistics['fetches'] == 2
+        assert statistics['hits'] == 1
+        assert statistics['coalesced'] == 9
+        assert statistics['hitRatio'] == 10 / 12
+
+    def test_fetch_outside_global_lock(self):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        proxy.session.get_manifest = lambda url: ManifestResponse(live_manifest(0))
+        path = '/manifest?path={0}&hostname={1}'.format(quote('/live/bench/manifest.mpd'), 'live.example.com')
+        try:
+            with proxy.lock:  # an RPC or license call in progress
+                for _ in range(3):
+                    connection = HTTPConnection(addon.getSetting('proxy-ip'), addon.getSettingInt('proxy-port'),
+                                                timeout=5)
+                    connection.request('GET', path, headers={'x-streaming-token': 'benchtoken'})
+                    response = connection.getresponse()
+                    assert response.status == 200
+                    assert response.read() == live_manifest(0)
+                    connection.close()
+            statistics = proxy.streamsession.get_statistics()['benchtoken']['manifest']
+            assert statistics['fetches'] == 1
+            assert statistics['hits'] == 2
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,92 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import time
+import tracemalloc
+from xml.dom import minidom
+
+import pytest
+
+from resources.lib.mpd import ManifestScanner, baseurl_from_manifest, segment_templates_from_manifest
+
+pytestmark = pytest.mark.standin
+
+
+def minidom_baseurl(manifest):
+    """
+    The implementation of ProxyServer.baseurl_from_manifest before the streaming scanner
+    """
+    document = minidom.parseString(manifest)
+    for parent in document.getElementsByTagName('MPD'):
+        periods = parent.getElementsByTagName('Period')
+        for period in periods:
+            baseURL = period.getElementsByTagName('BaseURL')
+            if baseURL.length == 0:
+                return None
+            return baseURL[0].childNodes[0].data
+    return None
+
+
+def synthetic_mpd(periods=4, adaptationSets=4, segments=3000, baseUrl='../../'):
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n'
+             '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="dynamic" minimumUpdatePeriod="PT2S">\n']
+    for p in range(periods):
+        parts.append('<Period id="{0}" start="PT{1}S">\n'.format(p, p * segments * 2))
+        if baseUrl is not None:
+            parts.append('<BaseURL>{0}</BaseURL>\n'.format(baseUrl))
+        for a in range(adaptationSets):
+            parts.append('<AdaptationSet id="{0}" mimeType="video/mp4">\n'
+                         '<SegmentTemplate timescale="1000" media="$RepresentationID$-$Time$.m4s">'
+                         '<SegmentTimeline>\n'.format(a))
+            segmentTime = p * segments * 2000
+            for _ in range(segments):
+                parts.append('<S t="{0}" d="2000"/>\n'.format(segmentTime))
+                segmentTime += 2000
+            parts.append('</SegmentTimeline></SegmentTemplate>\n'
+                         '<Representation id="rep{0}" bandwidth="1000000"/>\n'
+                         '</AdaptationSet>\n'.format(a))
+        parts.append('</Period>\n')
+    parts.append('</MPD>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def measure(function, manifest, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(manifest)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function(manifest)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+class TestManifestScanner:
+    def test_baseurl_same_as_minidom(self):
+        for manifest in (synthetic_mpd(2, 2, 10),
+                         synthetic_mpd(2, 2, 10, baseUrl=None),
+                         synthetic_mpd(2, 2, 10, baseUrl='https://cdn.example.com/live/'),
+                         b'<MPD xmlns="urn:mpeg:dash:schema:mpd:2011"><BaseURL>ignored/</BaseURL></MPD>'):
+            assert baseurl_from_manifest(manifest) == minidom_baseurl(manifest)
+
+    def test_templates(self):
+        scanner = ManifestScanner().scan(synthetic_mpd(2, 3, 10))
+        assert scanner.baseUrl == '../../'
+        assert len(scanner.templates) == 6
+        assert len(scanner.templates[0].timeline) == 10
+        assert len(segment_templates_from_manifest(synthetic_mpd(1, 1, 5))) == 1
+
+    def test_benchmark(self):
+        manifest = synthetic_mpd()
+        minidomTime, minidomPeak = measure(minidom_baseurl, manifest)
+        scannerTime, scannerPeak = measure(baseurl_from_manifest, manifest)
+        templatesTime, templatesPeak = measure(segment_templates_from_manifest, manifest)
+        print('\nmanifest {0} KB'.format(len(manifest) // 1024))
+        print('minidom BaseURL: {0:.2f}ms peak {1} KB'.format(minidomTime * 1000, minidomPeak // 1024))
+        print('scanner BaseURL: {0:.2f}ms peak {1} KB'.format(scannerTime * 1000, scannerPeak // 1024))
+        print('scanner BaseURL + templates: {0:.2f}ms peak {1} KB'.format(templatesTime * 1000,
+                                                                         templatesPeak // 1024))
+        # The peaks do not depend on the load of the machine, the times are only printed
+        assert scannerPeak < minidomPeak
+        assert templatesPeak < minidomPeak
@@ -0,0 +1,112 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from resources.lib.utils import WebException
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer
+from tests_pytest.test_recordingseasons import recordings_session, timed_refresh
+
+pytestmark = pytest.mark.standin
+
+RECORDINGS = 2500
+LATENCY = 0.02
+
+
+def recording(i):
+    return {'id': 'crid:~~2F~~2Fepg.example.com~~2F{0}'.format(i), 'type': 'single', 'source': 'single',
+            'title': 'Opname {0}'.format(i), 'channelId': 'NL_000001_019401'}
+
+
+class Pages:
+    """
+    Offset/limit endpoint of the stand-in server with thousands of recordings. Counts the pages and the max.
+    number of pages requested at the same time.
+    """
+    def __init__(self, count=RECORDINGS, withTotal=True):
+        self.items = [recording(i) for i in range(count)]
+        self.withTotal = withTotal
+        self.failAt = None
+        self.pages = 0
+        self.active = 0
+        self.maxActive = 0
+        self.lock = threading.Lock()
+
+    def route(self, handler):
+        query = parse_qs(urlparse(handler.path).query)
+        offset = int(query['offset'][0])
+        limit = int(query['limit'][0])
+        with self.lock:
+            self.pages += 1
+            self.active += 1
+            self.maxActive = max(self.maxActive, self.active)
+        time.sleep(LATENCY)
+        with self.lock:
+            self.active -= 1
+        if self.failAt is not None and offset >= self.failAt:
+            handler.send_body(b'{"error": "expired"}', 401, 'application/json')
+            return
+        body = {'data': self.items[offset:offset + limit]}
+        if self.withTotal:
+            body['total'] = len(self.items)
+        handler.send_body(json.dumps(body).encode('utf-8'), contentType='application/json')
+
+
+class TestPagination:
+    def test_all_pages(self, monkeypatch, tmp_path):
+        pages = Pages()
+        with StandInServer(pages.route) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            url = server.url + '/customers/household/recordings'
+            start = time.perf_counter()
+            result = session.get_all_pages(url, {'isAdult': False, 'language': 'nl'})
+            parallel = time.perf_counter() - start
+            assert result['total'] == RECORDINGS
+            assert result['data'] == pages.items  # in order
+            assert pages.pages == RECORDINGS // LoginSession.PAGE_SIZE
+            assert 1 < pages.maxActive <= LoginSession.PAGE_WORKERS
+
+            pages.maxActive = 0
+            start = time.perf_counter()
+            assert session.get_all_pages(url, {}, workers=1)['data'] == pages.items
+            sequential = time.perf_counter() - start
+            assert pages.maxActive == 1
+            print('\n{0} recordings in {1} pages, {2:.0f}ms latency: sequential {3:.0f}ms, {4} workers {5:.0f}ms'
+                  .format(RECORDINGS, RECORDINGS // LoginSession.PAGE_SIZE, LATENCY * 1000, sequential * 1000,
+                          LoginSession.PAGE_WORKERS, parallel * 1000))
+
+    def test_without_total(self, monkeypatch, tmp_path):
+        pages = Pages(count=250, withTotal=False)
+        with StandInServer(pages.route) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            result = session.get_all_pages(server.url + '/customers/household/bookings', {})
+            assert result['data'] == pages.items
+            assert pages.pages == 3
+            pages.items = pages.items[:200]
+            pages.pages = 0
+            assert len(session.get_all_pages(server.url + '/customers/household/bookings', {})['data']) == 200
+            assert pages.pages == 3  # the last page is empty
+
+    def test_refresh_recordings(self, monkeypatch, tmp_path):
+        pages = Pages()
+        with StandInServer(pages.route) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            recordings, _ = timed_refresh(session)
+            assert len(recordings['recorded']['data']) == RECORDINGS
+            assert len(recordings['planned']['data']) == RECORDINGS
+
+    def test_unauthorized(self, monkeypatch, tmp_path):
+        pages = Pages()
+        pages.failAt = 500
+        with StandInServer(pages.route) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            with pytest.raises(WebException) as exc:
+                session.get_all_pages(server.url + '/customers/household/recordings', {})
+            assert exc.value.status == 401
+            assert session.sessionInfo == {}
+            # The pages which were not requested yet are cancelled
+            assert pages.pages < RECORDINGS // LoginSession.PAGE_SIZE
@@ -0,0 +1,95 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import threading
+import time
+
+import pytest
+
+from resources.lib.mpd import segment_templates_from_manifest
+from resources.lib.prefetcher import PrefetchedSegment, SegmentPrefetcher
+from tests_pytest.standinserver import SEGMENT, StandInServer, fetch_segments, proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+MANIFEST = b'''<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static">
+  <Period id="1">
+    <AdaptationSet mimeType="video/mp4">
+      <SegmentTemplate media="$RepresentationID$/segment-$Number$.m4s" startNumber="0" timescale="1"
+                       duration="2"/>
+      <Representation id="video" bandwidth="5000000"/>
+    </AdaptationSet>
+    <AdaptationSet mimeType="audio/mp4">
+      <SegmentTemplate timescale="48000" media="audio=$Bandwidth$-$Time$.dash">
+        <SegmentTimeline>
+          <S t="1000" d="96000" r="2"/>
+          <S d="48000"/>
+        </SegmentTimeline>
+      </SegmentTemplate>
+      <Representation id="audio" bandwidth="128000"/>
+    </AdaptationSet>
+  </Period>
+</MPD>'''
+
+
+class TestPrefetcher:
+    def test_segment_templates(self):
+        templates = segment_templates_from_manifest(MANIFEST)
+        assert len(templates) == 2
+        video, audio = templates[0], templates[1]
+        assert video.next_segments('/prefix/video/segment-3.m4s', 2) == ['/prefix/video/segment-4.m4s',
+                                                                         '/prefix/video/segment-5.m4s']
+        assert audio.next_segments('/audio=128000-97000.dash', 5) == ['/audio=128000-193000.dash',
+                                                                     '/audio=128000-289000.dash']
+        assert audio.next_segments('/audio=128000-12.dash', 2) == []
+        assert video.next_segments('/manifest.mpd', 2) == []
+
+    def test_memory_limit_and_stop(self):
+        release = threading.Event()
+
+        def fetch(path):
+            if 'slow' in path:
+                release.wait(5)
+            return PrefetchedSegment(200, [('Content-Length', '100')], b'x' * 100)
+
+        prefetcher = SegmentPrefetcher(fetch, depth=3, memoryLimit=250, workers=1)
+        prefetcher.update_manifest(MANIFEST)
+        prefetcher.schedule_after('/video/segment-0.m4s')
+        assert prefetcher.get('/video/segment-3.m4s') is not None
+        assert prefetcher.get('/video/segment-1.m4s') is None  # dropped, memory limit reached
+        statistics = prefetcher.statistics()
+        assert statistics['prefetched'] == 3
+        assert statistics['dropped'] == 1
+        assert statistics['hits'] == 1
+        assert statistics['misses'] == 1
+        assert statistics['memoryUsed'] == 100
+
+        prefetcher.fetch = lambda path: fetch('slow' + path)
+        prefetcher.schedule_after('/video/segment-10.m4s')
+        prefetcher.stop()
+        release.set()
+        assert prefetcher.get('/video/segment-11.m4s') is None
+        assert prefetcher.statistics()['memoryUsed'] == 0
+
+    def test_prefetch_hides_latency(self):
+        addon = proxy_addon()
+
+        def route(handler):
+            time.sleep(0.05)
+            handler.send_body(SEGMENT)
+
+        with StandInServer(route) as origin:
+            proxy, thread = start_proxy(addon, origin.url + '/dash/bench/manifest.mpd')
+            stream = proxy.streamsession.find_stream('benchtoken')
+            stream.prefetcher = SegmentPrefetcher(fetch=lambda path: proxy.fetch_segment(stream, path), depth=3)
+            stream.prefetcher.update_manifest(MANIFEST)
+            try:
+                latencies = fetch_segments(addon, 20, '/video/segment-{0}.m4s')
+                statistics = proxy.streamsession.get_statistics()['benchtoken']['prefetcher']
+                print('prefetch: hits={0} misses={1} first={2:.1f}ms avg rest={3:.1f}ms'.format(
+                    statistics['hits'], statistics['misses'], latencies[0] * 1000,
+                    sum(latencies[1:]) / len(latencies[1:]) * 1000))
+                assert statistics['misses'] == 1
+                assert statistics['hits'] == 19
+            finally:
+                stream.stop(timeronly=True)
+                stop_proxy(proxy, thread)
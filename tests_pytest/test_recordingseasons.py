@@ -0,0 +1,98 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import time
+
+import pytest
+
+from resources.lib.globals import G
+from resources.lib.utils import WebException
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon
+
+pytestmark = pytest.mark.standin
+
+SHOWS = 40
+LATENCY = 0.05
+
+
+def season(showId, source='show'):
+    return {'id': showId, 'showId': showId, 'channelId': 'NL_000001_019401', 'type': 'season', 'source': source,
+            'title': 'Serie {0}'.format(showId)}
+
+
+class Recordings:
+    """
+    Bookings, recordings and episodes of the stand-in server. An episode list is answered with 401 for the shows
+    in expired.
+    """
+    def __init__(self):
+        self.planned = {'data': [season('planned-{0}'.format(i)) for i in range(SHOWS // 2)]}
+        self.recorded = {'data': [season('recorded-{0}'.format(i)) for i in range(SHOWS // 2)]}
+        self.expired = set()
+        self.episodeRequests = 0
+
+    def route(self, handler):
+        path, query = handler.path.split('?')
+        if path.endswith('/bookings'):
+            body = self.planned
+        elif path.endswith('/recordings'):
+            body = self.recorded
+        else:
+            showId = path.rsplit('/', 1)[1]
+            self.episodeRequests += 1
+            if showId in self.expired:
+                handler.send_body(b'{"error": "expired"}', 401, 'application/json')
+                return
+            body = {'data': [{'id': '{0}-episode-{1}'.format(showId, e), 'source': query.split('&')[0]}
+                             for e in range(3)],
+                    'images': [], 'genres': ['Drama'], 'seasons': [{'id': showId + '-1'}]}
+        handler.send_body(json.dumps(body).encode('utf-8'), contentType='application/json')
+
+
+def recordings_session(monkeypatch, tmp_path, upstream):
+    monkeypatch.setattr(G, 'RECORDINGS_URL', upstream.url + '/customers/{householdid}/')
+    monkeypatch.chdir(tmp_path)  # the session info is saved in the (empty) profile folder
+    session = LoginSession(proxy_addon())
+    session.sessionInfo = {'householdId': 'household'}
+    session.activeProfile = {'profileId': 'profile'}
+    return session
+
+
+def timed_refresh(session):
+    start = time.perf_counter()
+    recordings = session.refresh_recordings()
+    return recordings, time.perf_counter() - start
+
+
+class TestRecordingSeasons:
+    def test_parallel_refresh(self, monkeypatch, tmp_path):
+        upstream = Recordings()
+        with StandInServer(upstream.route, latency=LATENCY) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            monkeypatch.setattr(LoginSession, 'SEASON_WORKERS', 1)
+            sequential, sequentialTime = timed_refresh(session)
+            monkeypatch.undo()
+            session = recordings_session(monkeypatch, tmp_path, server)
+            parallel, parallelTime = timed_refresh(session)
+            print('\nRecordings with {0} shows, {1:.0f}ms latency: sequential {2:.0f}ms, {3} workers {4:.0f}ms'.format(
+                SHOWS, LATENCY * 1000, sequentialTime * 1000, LoginSession.SEASON_WORKERS, parallelTime * 1000))
+
+        # Same result in the same order
+        assert json.dumps(parallel) == json.dumps(sequential)
+        first = parallel['planned']['data'][0]
+        assert first['episodes']['data'][0]['id'] == 'planned-0-episode-0'
+        assert first['episodes']['data'][0]['source'] == 'source=booking'
+        assert parallel['recorded']['data'][-1]['seasons'] == [{'id': 'recorded-{0}-1'.format(SHOWS // 2 - 1)}]
+        assert parallelTime < SHOWS * LATENCY  # the lower bound of the episode requests one after the other
+
+    def test_unauthorized(self, monkeypatch, tmp_path):
+        upstream = Recordings()
+        upstream.expired = {season['id'] for season in upstream.planned['data'][:2]}
+        with StandInServer(upstream.route, latency=LATENCY) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            with pytest.raises(WebException) as exc:
+                session.refresh_recordings()
+            assert exc.value.status == 401
+            assert session.sessionInfo == {}
+            # The shows which were not requested yet are cancelled
+            assert upstream.episodeRequests < SHOWS // 2
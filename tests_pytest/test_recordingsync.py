@@ -0,0 +1,274 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from resources.lib import recordingsync
+from resources.lib.events import Event
+from resources.lib.globals import G
+from resources.lib.recording import RecordingList, SeasonRecording
+from resources.lib.recordingsync import RecordingsSnapshot, apply_delta
+from resources.lib.utils import ProxyHelper, WebException
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon, start_proxy, stop_proxy
+from tests_pytest.test_recordingseasons import recordings_session
+
+pytestmark = pytest.mark.standin
+
+SHOWS = 20
+SINGLES = 200
+EPISODES = 10
+LATENCY = 0.01
+
+
+def single(recordingId, state):
+    return {'id': recordingId, 'type': 'single', 'source': 'single', 'recordingState': state,
+            'title': 'Opname {0}'.format(recordingId), 'channelId': 'NL_000001_019401',
+            'startTime': '2024-01-17T11:00:00.000Z', 'endTime': '2024-01-17T11:16:00.000Z'}
+
+
+def show(showId):
+    return {'id': showId, 'showId': showId, 'type': 'season', 'source': 'show', 'channelId': 'NL_000001_019401',
+            'title': 'Serie {0}'.format(showId), 'poster': {'url': 'https://example.com/poster.jpg'},
+            'noOfEpisodes': EPISODES}
+
+
+class Household:
+    """
+    Recordings and bookings of the stand-in server, with the seasons of shows. Handles the deletion of a single
+    recording and the booking of an event. Counts the requests of the episodes per show.
+    """
+    def __init__(self):
+        self.lists = {'bookings': [show('planned-{0}'.format(i)) for i in range(SHOWS)] +
+                                  [single('booking-{0}'.format(i), 'planned') for i in range(SINGLES)],
+                      'recordings': [show('recorded-{0}'.format(i)) for i in range(SHOWS)] +
+                                    [single('recording-{0}'.format(i), 'recorded') for i in range(SINGLES)]}
+        self.episodes = {entry['id']: [single('{0}-episode-{1}'.format(entry['id'], e),
+                                              'planned' if entry['id'].startswith('planned') else 'recorded')
+                                       for e in range(EPISODES)]
+                         for entries in self.lists.values() for entry in entries if entry['type'] == 'season'}
+        self.episodeRequests = {}
+        self.failing = False  # the lists of recordings and bookings are not available
+        self.lock = threading.Lock()
+
+    def route(self, handler):
+        path = urlparse(handler.path).path
+        query = parse_qs(urlparse(handler.path).query)
+        time.sleep(LATENCY)
+        if handler.command == 'DELETE':
+            recordingId = path.rsplit('/', 1)[1]
+            with self.lock:
+                for name, entries in self.lists.items():
+                    self.lists[name] = [entry for entry in entries if entry['id'] != recordingId]
+                for showId, episodes in self.episodes.items():
+                    self.episodes[showId] = [episode for episode in episodes if episode['id'] != recordingId]
+            body = {}
+        elif handler.command == 'POST':
+            request = json.loads(handler.rfile.read(int(handler.headers['Content-Length'])))
+            with self.lock:
+                if path.endswith('/show'):
+                    showId = 'planned-{0}'.format(SHOWS)
+                    self.lists['bookings'].append(show(showId))
+                    self.episodes[showId] = [single('{0}-episode-{1}'.format(showId, e), 'planned')
+                                             for e in range(EPISODES)]
+                else:
+                    self.lists['bookings'].append(single(request['eventId'], 'planned'))
+            body = {}
+        elif '/episodes/shows/' in path:
+            showId = path.rsplit('/', 1)[1]
+            with self.lock:
+                self.episodeRequests[showId] = self.episodeRequests.get(showId, 0) + 1
+                episodes = list(self.episodes[showId])
+            body = {'total': len(episodes), 'data': episodes, 'images': []}
+        elif self.failing:
+            handler.send_body(b'{"error": "unavailable"}', 503, 'application/json')
+            return
+        else:
+            offset = int(query['offset'][0])
+            with self.lock:
+                entries = list(self.lists[path.rsplit('/', 1)[1]])
+            body = {'total': len(entries), 'size': 1.5, 'quota': {'quota': 100, 'occupied': 10},
+                    'data': entries[offset:offset + int(query['limit'][0])]}
+        handler.send_body(json.dumps(body).encode('utf-8'), contentType='application/json')
+
+    def requests(self):
+        with self.lock:
+            count = sum(self.episodeRequests.values())
+            self.episodeRequests = {}
+        return count
+
+
+def recordings(planned, recorded):
+    return {'planned': {'total': len(planned), 'data': planned}, 'recorded': {'total': len(recorded), 'data': recorded}}
+
+
+class TestSnapshot:
+    def test_delta(self):
+        snapshot = RecordingsSnapshot()
+        planned = [single('a', 'planned'), show('s'), show('s')]
+        recorded = [single('b', 'recorded')]
+        assert snapshot.update(recordings(planned, recorded))
+        full = snapshot.delta()
+        assert full['full'] and full['planned']['keys'] == ['a', 's', 's#2']
+        local = apply_delta(None, full)
+        assert local['planned']['data'] == planned and local['planned']['total'] == 3
+
+        # Nothing changed: same version, no entries
+        assert not snapshot.update(recordings(json.loads(json.dumps(planned)), recorded))
+        delta = snapshot.delta(local['version'])
+        assert delta['version'] == local['version'] and not delta['full']
+        assert not delta['planned']['changed'] and not delta['recorded']['changed']
+
+        # One entry changed, one removed, one added
+        planned[1]['noOfEpisodes'] = 11
+        assert snapshot.update(recordings(planned, [single('c', 'recorded')]))
+        delta = snapshot.delta(local['version'])
+        assert list(delta['planned']['changed']) == ['s'] and list(delta['recorded']['changed']) == ['c']
+        updated = apply_delta(local, delta)
+        assert updated['planned']['data'] == planned and updated['recorded']['data'] == [single('c', 'recorded')]
+        assert updated['version'] != local['version']
+
+        # The version of another snapshot, or a newer version: everything
+        assert RecordingsSnapshot().delta(local['version'])['full'] is True
+        assert snapshot.delta(snapshot.snapshotId + ':99')['full'] is True
+        # An unchanged entry missing locally
+        with pytest.raises(KeyError):
+            apply_delta(recordings([], []), snapshot.delta(updated['version'].split(':')[0] + ':1'))
+
+
+    def test_sync(self):
+        snapshot = RecordingsSnapshot()
+        first = recordings([], [single('a', 'recorded')])
+        second = recordings([], [single('b', 'recorded')])
+        other = threading.Thread(target=snapshot.sync, args=(second,))
+        update = snapshot.update
+
+        def update_and_sync_other(recs):
+            changed = update(recs)
+            if recs is first:
+                # Another sync between the update and the delta of the first waits for it
+                other.start()
+                other.join(0.2)
+            return changed
+
+        snapshot.update = update_and_sync_other
+        assert snapshot.sync(first)['recorded']['keys'] == ['a']
+        other.join()
+        assert snapshot.delta()['recorded']['keys'] == ['b']
+
+class TestDeltaSync:
+    def test_season_cache(self, monkeypatch, tmp_path):
+        household = Household()
+        with StandInServer(household.route) as server:
+            session = recordings_session(monkeypatch, tmp_path, server)
+            full = session.sync_recordings()
+            assert household.requests() == 2 * SHOWS
+            assert full['full'] and len(full['recorded']['changed']) == SHOWS + SINGLES
+
+            # Unchanged entries: the episodes are not requested, nothing is returned
+            delta = session.sync_recordings(version=full['version'])
+            assert household.requests() == 0
+            assert delta['version'] == full['version']
+            assert not delta['planned']['changed'] and not delta['recorded']['changed']
+
+            # An episode is deleted: only its show is requested again and returned
+            session.delete_recordings(event='recorded-3-episode-0')
+            household.lists['recordings'][3]['noOfEpisodes'] = EPISODES - 1
+            delta = session.sync_recordings(version=full['version'])
+            assert household.episodeRequests == {'recorded-3': 1} and household.requests() == 1
+            assert list(delta['recorded']['changed']) == ['recorded-3'] and not delta['planned']['changed']
+            assert len(delta['recorded']['changed']['recorded-3']['episodes']['data']) == EPISODES - 1
+
+            # After SEASON_MAX_AGE all shows are requested again
+            monkeypatch.setattr(LoginSession, 'SEASON_MAX_AGE', 0)
+            session.sync_recordings(version=delta['version'])
+            assert household.requests() == 2 * SHOWS
+
+    def test_recording_list(self, monkeypatch, tmp_path):
+        household = Household()
+        with StandInServer(household.route) as server:
+            monkeypatch.setattr(G, 'RECORDINGS_URL', server.url + '/customers/{householdid}/')
+            monkeypatch.chdir(tmp_path)  # the recordings are saved in the (empty) profile folder
+            addon = proxy_addon()
+            addon.setSettingBool('adult-allowed', False)
+            proxy, thread = start_proxy(addon, None)
+            proxy.session.sessionInfo = {'householdId': 'household'}
+            proxy.session.activeProfile = {'profileId': 'profile'}
+            try:
+                self.recording_list(addon, household)
+            finally:
+                stop_proxy(proxy, thread)
+
+    @staticmethod
+    def recording_list(addon, household):
+        # pylint: disable=too-many-statements
+        recs = RecordingList(addon)
+        assert recs.version is None
+        start = time.perf_counter()
+        recs.refresh()
+        full = time.perf_counter() - start
+        assert len(recs.recs) == 2 * (SHOWS + SINGLES) and recs.total == 2 * (SHOWS + SINGLES)
+        seasons = {rec.id: rec for rec in recs.recs if isinstance(rec, SeasonRecording)}
+        assert len(seasons['recorded-3'].episodes) == EPISODES
+
+        # Optimistic deletion: removed from the list and from the file at once
+        episode = seasons['recorded-3'].episodes[0]
+        start = time.perf_counter()
+        recs.delete_recording(episode)
+        deleted = time.perf_counter() - start
+        assert recs.find(episode.id) is None
+        household.lists['recordings'][3]['noOfEpisodes'] = EPISODES - 1
+        reloaded = RecordingList(addon)
+        assert reloaded.version == recs.version and reloaded.find(episode.id) is None
+
+        # Optimistic booking
+        event = Event({'id': 'crid:~~2F~~2Fepg.example.com~~2F42', 'title': 'Journaal',
+                       'startTime': 1705489200, 'endTime': 1705490100})
+        recs.record_event(event, 'NL_000001_019401')
+        assert recs.find(event.id).isPlanned
+        assert RecordingList(addon).find(event.id).startTime == '2024-01-17T11:00:00.000Z'
+
+        # The delta: only the changed show and the booking are parsed again
+        household.requests()
+        singleRec = recs.find('recording-7')
+        start = time.perf_counter()
+        recs.refresh()
+        delta = time.perf_counter() - start
+        assert household.requests() == 1
+        assert recs.find('recording-7') is singleRec
+        seasons = {rec.id: rec for rec in recs.recs if isinstance(rec, SeasonRecording)}
+        assert len(seasons['recorded-3'].episodes) == EPISODES - 1
+        assert recs.find(event.id).isPlanned
+        assert json.loads(json.dumps(recs.recordingDetails)) == recs.recordingDetails
+        assert [key for key in recordingsync.entry_keys(recs.recordingDetails['planned']['data'])
+                if key == event.id] == [event.id]
+
+        # A show booking is not added as a single recording, the season of the service is added by a refresh
+        showEvent = Event({'id': 'crid:~~2F~~2Fepg.example.com~~2F43', 'title': 'Serie',
+                           'startTime': 1705490100, 'endTime': 1705491900})
+        recs.record_show(showEvent, 'NL_000001_019401')
+        assert recs.find(showEvent.id) is None
+        seasons = {rec.id: rec for rec in recs.recs if isinstance(rec, SeasonRecording)}
+        assert len(seasons['planned-{0}'.format(SHOWS)].episodes) == EPISODES
+        assert recs.find('planned-{0}-episode-0'.format(SHOWS)).isPlanned
+        assert household.requests() == 1  # only the episodes of the new show
+
+        # A change is not lost when the refresh fails
+        ProxyHelper(addon).dynamic_call(LoginSession.record_event, eventId='crid:~~2F~~2Fepg.example.com~~2F44')
+        household.failing = True
+        with pytest.raises(WebException):
+            recs.refresh_if_changed()
+        household.failing = False
+        recs.refresh_if_changed()
+        assert recs.find('crid:~~2F~~2Fepg.example.com~~2F44').isPlanned
+
+        # A file which does not match the version is replaced by all recordings
+        recs.recordingDetails['recorded']['data'].pop()
+        recs.refresh()
+        assert len(recs.recs) == 2 * (SHOWS + SINGLES) + 3
+        print('\nRecordings of {0} shows and {1} singles: full refresh {2:.0f}ms, delta refresh {3:.0f}ms, '
+              'optimistic deletion {4:.0f}ms'.format(2 * SHOWS, 2 * SINGLES, full * 1000, delta * 1000,
+                                                     deleted * 1000))
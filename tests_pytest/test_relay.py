@@ -0,0 +1,157 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring
+import socket
+import threading
+import time
+from http.client import HTTPConnection
+
+import pytest
+
+from resources.lib.relay import SegmentRelay
+from tests_pytest.standinserver import StandInServer
+
+pytestmark = pytest.mark.standin
+
+SEGMENT = bytes(range(256)) * 4096  # 1 MiB
+
+
+def segment_route(handler):
+    if 'chunked' in handler.path:
+        handler.send_chunked([SEGMENT[i:i + 100000] for i in range(0, len(SEGMENT), 100000)])
+    else:
+        handler.send_body(SEGMENT)
+
+
+class RelayTarget:
+    """
+        Stand-in for the HTTPRequestHandler of the player. The data is received via a socketpair.
+    """
+    def __init__(self, keepData=False):
+        self.connection, self.peer = socket.socketpair()
+        self.wfile = self.connection.makefile('wb', buffering=0)
+        self.keepData = keepData
+        self.data = bytearray()
+        self.received = 0
+        self.thread = threading.Thread(target=self.__drain)
+        self.thread.start()
+
+    def __drain(self):
+        while True:
+            data = self.peer.recv(1024 * 1024)
+            if not data:
+                return
+            self.received += len(data)
+            if self.keepData:
+                self.data.extend(data)
+
+    def send_response(self, code):
+        self.wfile.write(b'HTTP/1.1 %d OK\r\n' % code)
+
+    def send_header(self, key, value):
+        self.wfile.write('{0}: {1}\r\n'.format(key, value).encode('latin-1'))
+
+    def end_headers(self):
+        self.wfile.write(b'\r\n')
+
+    def close(self):
+        self.wfile.close()
+        self.connection.close()
+        self.thread.join()
+        self.peer.close()
+
+    def body(self):
+        head, body = bytes(self.data).split(b'\r\n\r\n', 1)
+        if b'Transfer-Encoding: chunked' not in head:
+            return body
+        result = bytearray()
+        while True:
+            line, body = body.split(b'\r\n', 1)
+            length = int(line, 16)
+            if length == 0:
+                return bytes(result)
+            result.extend(body[:length])
+            body = body[length + 2:]
+
+
+def legacy_relay(response, request):
+    """
+    The relay of handle_default before the SegmentRelay, used as reference in the benchmark
+    """
+    request.send_response(response.status)
+    chunked = False
+    for header in response.headers:
+        if header.lower() == 'transfer-encoding':
+            if response.headers[header].lower() == 'chunked':
+                chunked = True
+        request.send_header(header, response.headers[header])
+    request.end_headers()
+    lenProcessed = 0
+    if chunked:
+        response.chunked = False
+        blockLen = response.readline()
+        length = int(blockLen, 16)
+        while length > 0:
+            lenProcessed += length
+            block = response.read(length)
+            blockToWrite = bytearray(blockLen)
+            blockToWrite.extend(block + b'\r\n')
+            request.wfile.write(blockToWrite)
+            response.readline()
+            blockLen = response.readline()
+            length = int(blockLen, 16)
+        response.readline()
+        blockToWrite = bytearray(blockLen)
+        blockToWrite.extend(b'\r\n')
+        request.wfile.write(blockToWrite)
+        response.close()
+    else:
+        expectedLen = int(response.headers['Content-Length'])
+        block = response.read(8192)
+        while lenProcessed < expectedLen:
+            lenProcessed += len(block)
+            request.wfile.write(block)
+            block = response.read(8192)
+    return lenProcessed
+
+
+def relay_segments(origin, relayFunction, path, count):
+    connection = HTTPConnection('127.0.0.1', origin.server_address[1], timeout=5)
+    target = RelayTarget()
+    cpuTime = 0.0
+    try:
+        for _ in range(count):
+            connection.request('GET', path)
+            response = connection.getresponse()
+            start = time.thread_time()
+            relayFunction(response, target)
+            cpuTime += time.thread_time() - start
+    finally:
+        connection.close()
+        target.close()
+    assert target.received >= count * len(SEGMENT)
+    return count * len(SEGMENT) / max(cpuTime, 1e-9)
+
+
+class TestRelay:
+    def test_relay_content(self):
+        with StandInServer(segment_route) as origin:
+            for path in ['/fixed.m4s', '/chunked.m4s']:
+                for rechunk in [False, True]:
+                    connection = HTTPConnection('127.0.0.1', origin.server_address[1], timeout=5)
+                    target = RelayTarget(keepData=True)
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    relayed = SegmentRelay(rechunk=rechunk).relay(response, target)
+                    assert response.isclosed()
+                    connection.close()
+                    target.close()
+                    assert relayed == len(SEGMENT)
+                    assert target.body() == SEGMENT
+
+    def test_relay_throughput(self):
+        relay = SegmentRelay()
+        with StandInServer(segment_route) as origin:
+            for path in ['/fixed.m4s', '/chunked.m4s']:
+                legacy = relay_segments(origin, legacy_relay, path, 40)
+                zeroCopy = relay_segments(origin, relay.relay, path, 40)
+                print('{0}: legacy {1:.1f} MB/s per core, SegmentRelay {2:.1f} MB/s per core'.format(
+                    path, legacy / 1e6, zeroCopy / 1e6))
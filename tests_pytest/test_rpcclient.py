@@ -0,0 +1,71 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import base64
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import pytest
+
+from resources.lib.utils import ProxyHelper, RpcClient
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import percentile, proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+CALLS = 200
+
+
+def unpooled_call(helper):
+    """
+    ProxyHelper.dynamic_call before the shared RpcClient: a new connection for every call
+    """
+    response = requests.get(url=helper.host + 'function/LoginSession.get_extra_headers',
+                            params={'args': base64.b64encode(pickle.dumps({}))},
+                            timeout=helper.dataTimeout)
+    assert response.status_code == 200
+    return pickle.loads(response.content)
+
+
+def latencies(call, count=CALLS):
+    result = []
+    for _ in range(count):
+        start = time.perf_counter()
+        assert call() == {}
+        result.append(time.perf_counter() - start)
+    return result
+
+
+class TestRpcClient:
+    def test_shared_instance(self):
+        addon = proxy_addon()
+        helper = ProxyHelper(addon)
+        assert ProxyHelper(addon).client is helper.client is RpcClient.instance()
+        assert pickle.loads(pickle.dumps(helper)).client is helper.client
+
+    def test_round_trip_latency(self):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        try:
+            unpooled = latencies(lambda: unpooled_call(helper))
+            unpooledConnections = proxy.statistics()['connections']
+            pooled = latencies(lambda: helper.dynamic_call(LoginSession.get_extra_headers))
+            pooledConnections = proxy.statistics()['connections'] - unpooledConnections
+            for name, values, connections in (('requests.get', unpooled, unpooledConnections),
+                                              ('RpcClient', pooled, pooledConnections)):
+                print('\n{0}: {1} calls, connections={2} p50={3:.2f}ms p90={4:.2f}ms p99={5:.2f}ms'.format(
+                    name, CALLS, connections, percentile(values, 50) * 1000, percentile(values, 90) * 1000,
+                    percentile(values, 99) * 1000), end='')
+            assert unpooledConnections == CALLS
+            # The connection counts show the reuse, the latencies are only printed
+            assert pooledConnections <= 1  # the connection may already be open from another test
+
+            # Calls from several threads share the pool
+            with ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda _: helper.dynamic_call(LoginSession.get_extra_headers), range(40)))
+            assert results == [{}] * 40
+            assert proxy.statistics()['connections'] - unpooledConnections <= RpcClient.POOL_SIZE
+        finally:
+            stop_proxy(proxy, thread)
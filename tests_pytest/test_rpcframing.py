@@ -0,0 +1,130 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import base64
+import json
+import pickle
+import time
+
+import pytest
+
+from resources.lib import rpcframing
+from resources.lib.avstream import StreamSession
+from resources.lib.utils import ProxyHelper
+from resources.lib.webcalls import LoginSession, Web
+from tests_pytest.standinserver import percentile, proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+ROUNDS = 20
+
+
+def events(count):
+    return {'entries': [{'channelId': 'NL_000{0}_019{0}'.format(i % 100),
+                         'events': [{'id': 'crid:~~2F~~2Fgn.tv~~2F{0}~~2F{1}'.format(i, e),
+                                     'title': 'Programma {0}'.format(e),
+                                     'startTime': 1700000000 + e * 1800,
+                                     'endTime': 1700001800 + e * 1800,
+                                     'mergedId': 'merged-{0}-{1}'.format(i, e)} for e in range(48)]}
+                        for i in range(count)]}
+
+
+class EventsResponse:
+    # pylint: disable=too-few-public-methods
+    CONTENT = json.dumps(events(200)).encode('utf-8')
+
+    def __init__(self):
+        self.status_code = 200
+        self.content = self.CONTENT
+        self.headers = {}
+
+
+def legacy_call(helper, method, **kwargs):
+    """
+    ProxyHelper.dynamic_call before the framing: base64 pickled arguments in the query string
+    """
+    response = helper.client.get(url=helper.host + 'function/' + method.__qualname__,
+                                 params={'args': base64.b64encode(pickle.dumps(kwargs))},
+                                 timeout=helper.dataTimeout)
+    if response.status_code != 200:
+        return response.status_code
+    return pickle.loads(response.content) if response.content else None
+
+
+def framed_call(helper, method, compress, **kwargs):
+    headers = dict(helper.RPC_HEADERS)
+    if compress:
+        headers[rpcframing.COMPRESSION_HEADER] = rpcframing.COMPRESSION
+    response = helper.client.post(url=helper.host + 'function/' + method.__qualname__,
+                                  data=rpcframing.encode_frame(kwargs, compress=compress),
+                                  headers=headers, timeout=helper.dataTimeout)
+    assert response.status_code == 200
+    return rpcframing.decode_frame(response.content), len(response.content)
+
+
+def benchmark(helper, name, method, **kwargs):
+    """
+    Measure the call with each protocol, returns the sizes of the uncompressed and compressed frames
+    """
+    expected = helper.dynamic_call(method, **kwargs)
+    assert legacy_call(helper, method, **kwargs) == expected
+    plainSize = framed_call(helper, method, False, **kwargs)[1]
+    compressedSize = framed_call(helper, method, True, **kwargs)[1]
+    for label, call, resultSize in (
+            ('GET base64 query', lambda: legacy_call(helper, method, **kwargs), len(pickle.dumps(expected))),
+            ('POST frame', lambda: framed_call(helper, method, False, **kwargs), plainSize),
+            ('POST frame zlib', lambda: framed_call(helper, method, True, **kwargs), compressedSize)):
+        p50, p99 = measure(call)
+        print('{0:<44} {1:>8}KB {2:>7.2f}ms {3:>7.2f}ms'.format(name + ' ' + label, resultSize // 1024,
+                                                              p50 * 1000, p99 * 1000))
+    return plainSize, compressedSize
+
+
+def measure(call):
+    values = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        call()
+        values.append(time.perf_counter() - start)
+    return percentile(values, 50), percentile(values, 99)
+
+
+class TestRpcFraming:
+    def test_frames(self):
+        value = events(100)
+        small = rpcframing.encode_frame({'eventId': 'crid'}, compress=True)
+        large = rpcframing.encode_frame(value, compress=True)
+        assert rpcframing.decode_frame(small) == {'eventId': 'crid'}
+        assert rpcframing.decode_frame(large) == value
+        assert len(large) < len(rpcframing.encode_frame(value)) // 2
+        with pytest.raises(rpcframing.FrameError):
+            rpcframing.decode_frame(large[:-1])
+        with pytest.raises(rpcframing.FrameError):
+            rpcframing.decode_frame(b'\x02' + small[1:])
+
+    def test_post_rpc(self, monkeypatch):
+        monkeypatch.setattr(Web, 'do_get', lambda self, url, **kwargs: EventsResponse())
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        try:
+            assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            helper.compressResults = True
+            assert helper.dynamic_call(LoginSession.get_events, startTime='20240101000000') == events(200)
+            helper.compressResults = False
+            assert helper.dynamic_call(StreamSession.find_stream, streamid='unknown') is None
+            response = helper.client.post(url=helper.host + 'function/LoginSession.get_extra_headers',
+                                          data=rpcframing.encode_frame({}),
+                                          headers={rpcframing.VERSION_HEADER: '99'})
+            assert response.status_code == 400
+
+            # Arguments larger than the maximum length of the request line
+            streamId = 'x' * 100000
+            assert legacy_call(helper, StreamSession.find_stream, streamid=streamId) == 414
+            assert helper.dynamic_call(StreamSession.find_stream, streamid=streamId) is None
+
+            print('\n{0:<44} {1:>10} {2:>9} {3:>9}'.format('', 'result', 'p50', 'p99'))
+            benchmark(helper, 'get_extra_headers', LoginSession.get_extra_headers)
+            plainSize, compressedSize = benchmark(helper, 'get_events', LoginSession.get_events,
+                                                  startTime='20240101000000')
+            assert compressedSize < plainSize // 4
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,105 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import os
+import threading
+
+import pytest
+import xbmc
+
+from resources.lib import filestore
+from resources.lib.avstream import AVStreamType
+from resources.lib.prefetcher import PrefetchedSegment
+from resources.lib.segmentcache import SegmentCache
+from tests_pytest.standinserver import SEGMENT, StandInServer, fetch_segments, proxy_addon, segment_route, \
+    start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+
+class TestSegmentCache:
+    def test_lru_eviction(self, tmp_path):
+        cache = SegmentCache(str(tmp_path), maxBytes=3000)
+        for i in range(3):
+            cache.put('/dash/vod/segment-{0}.m4s'.format(i), PrefetchedSegment(200, [], b'x' * 900))
+        assert cache.get('/dash/vod/segment-0.m4s').body == b'x' * 900  # 0 is now most recently used
+        cache.put('/dash/vod/segment-3.m4s', PrefetchedSegment(200, [], b'x' * 900))
+        cache.put('/dash/vod/segment-4.m4s', PrefetchedSegment(404, [], b'not found'))
+        assert '/dash/vod/segment-1.m4s' not in cache
+        assert '/dash/vod/segment-0.m4s' in cache
+        assert '/dash/vod/segment-4.m4s' not in cache
+        assert cache.statistics()['evicted'] == 1
+        assert cache.statistics()['totalBytes'] <= 3000
+
+        reloaded = SegmentCache(str(tmp_path), maxBytes=3000)
+        assert reloaded.statistics()['files'] == 3
+        segment = reloaded.get('/dash/vod/segment-3.m4s')
+        assert segment.status == 200
+        assert segment.body == b'x' * 900
+
+    def test_concurrent_writers(self, tmp_path):
+        cache = SegmentCache(str(tmp_path), maxBytes=10 * len(SEGMENT))
+        barrier = threading.Barrier(8)
+        failures = []
+
+        def write(i):
+            barrier.wait()
+            for _ in range(20):
+                try:
+                    cache.put('/dash/vod/segment-0.m4s', PrefetchedSegment(200, [], bytes([i]) * len(SEGMENT)))
+                except OSError as exc:
+                    failures.append(exc)
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not failures and cache.statistics()['stored'] == 8 * 20  # no writer lost its temporary file
+        body = cache.get('/dash/vod/segment-0.m4s').body
+        assert len(body) == len(SEGMENT) and body == body[:1] * len(SEGMENT)  # from one writer
+        assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+        assert cache.statistics()['files'] == 1 and cache.statistics()['totalBytes'] < 2 * len(SEGMENT)
+
+    def test_file_gone_while_read(self, monkeypatch, tmp_path):
+        cache = SegmentCache(str(tmp_path), maxBytes=10 * len(SEGMENT))
+        key = '/dash/vod/segment-0.m4s'
+        cache.put(key, PrefetchedSegment(200, [], b'old'))
+        levels = []
+
+        def store_again_and_open(path, *_):
+            # Another thread replaces the file after the lookup, the file read is removed by an eviction
+            monkeypatch.delattr(filestore, 'open')
+            cache.put(key, PrefetchedSegment(200, [], b'new'))
+            raise FileNotFoundError(path)
+
+        monkeypatch.setattr(filestore, 'open', store_again_and_open, raising=False)
+        monkeypatch.setattr(xbmc, 'log', lambda msg, level=xbmc.LOGDEBUG: levels.append(level))
+        assert cache.get(key) is None
+        assert levels == [xbmc.LOGDEBUG]  # a miss, not an error
+        assert cache.get(key).body == b'new'  # the entry stored again is kept
+
+        # A file which cannot be read is removed
+        with open(os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0]), 'wb') as file:
+            file.write(b'not json')
+        assert cache.get(key) is None
+        assert key not in cache and cache.statistics()['totalBytes'] == 0 and not os.listdir(str(tmp_path))
+
+    def test_vod_served_from_cache(self, tmp_path):
+        addon = proxy_addon()
+        with StandInServer(segment_route) as origin:
+            proxy, thread = start_proxy(addon, origin.url + '/dash,vxttoken=abc/bench/manifest.mpd')
+            proxy.segmentCache = SegmentCache(str(tmp_path), 10 * len(SEGMENT))
+            stream = proxy.streamsession.find_stream('benchtoken')
+            try:
+                stream.streamType = AVStreamType.VOD
+                fetch_segments(addon, 5)
+                fetch_segments(addon, 5)
+                assert origin.requests == 5
+                assert proxy.segmentCache.statistics()['hits'] == 5
+
+                stream.streamType = AVStreamType.CHANNEL
+                origin.reset_counters()
+                fetch_segments(addon, 5)
+                assert origin.requests == 5
+                assert proxy.segmentCache.statistics()['hits'] == 5
+            finally:
+                stop_proxy(proxy, thread)
@@ -0,0 +1,118 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from resources.lib.utils import ProxyHelper, SharedLock
+from resources.lib.webcalls import LoginSession, Web
+from tests_pytest.standinserver import proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+LATENCY = 0.3
+PARALLEL = 8
+
+
+class EventsResponse:
+    def __init__(self):
+        self.status_code = 200
+        self.content = json.dumps({'entries': []}).encode('utf-8')
+        self.headers = {}
+
+
+def slow_get(self, url, **kwargs):
+    # pylint: disable=unused-argument
+    time.sleep(LATENCY)
+    return EventsResponse()
+
+
+class Upstream:
+    """
+    Counts the requests which are in progress at the same time. With a barrier a request waits until the
+    parties of the barrier are in progress, it fails when they are not within 5 seconds.
+    """
+    def __init__(self, parties: int):
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.maxActive = 0
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        # pylint: disable=unused-argument
+        with self.lock:
+            self.active += 1
+            self.maxActive = max(self.maxActive, self.active)
+            self.requests += 1
+        try:
+            if self.barrier is not None:
+                self.barrier.wait()
+        finally:
+            with self.lock:
+                self.active -= 1
+        return EventsResponse()
+
+
+class TestSessionLocking:
+    def test_shared_lock(self):
+        lock = SharedLock()
+        lock.acquire_shared()
+        lock.acquire_shared()  # reentrant
+        with pytest.raises(RuntimeError):
+            lock.acquire_exclusive()
+        entered = threading.Event()
+
+        def writer():
+            lock.acquire_exclusive()
+            lock.acquire_shared()  # a writer may also take it shared
+            entered.set()
+            lock.release_shared()
+            lock.release_exclusive()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert not entered.wait(0.2)
+        lock.release_shared()
+        assert not entered.wait(0.2)
+        lock.release_shared()
+        assert entered.wait(1)
+        thread.join()
+
+    def test_parallel_catalog_calls(self, monkeypatch):
+        upstream = Upstream(PARALLEL)
+        monkeypatch.setattr(Web, 'do_get', upstream.get)
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        try:
+            with ThreadPoolExecutor(PARALLEL) as executor:
+                # Each call waits at the barrier until all calls are in progress: they pass only in parallel
+                results = list(executor.map(
+                    lambda _: helper.dynamic_call(LoginSession.get_events, startTime='20240101000000'),
+                    range(PARALLEL)))
+                assert results == [{'entries': []}] * PARALLEL
+                assert upstream.maxActive == PARALLEL
+
+                # session calls are still exclusive: a catalog call waits for the lock
+                upstream.barrier = None
+                lock = proxy.session.sessionLock
+                waiting = threading.Event()
+                acquire_shared = lock.acquire_shared
+
+                def signal_and_acquire_shared():
+                    waiting.set()
+                    acquire_shared()
+
+                monkeypatch.setattr(lock, 'acquire_shared', signal_and_acquire_shared)
+                lock.acquire_exclusive()
+                future = executor.submit(helper.dynamic_call, LoginSession.get_events, startTime='20240101000000')
+                assert waiting.wait(5)
+                assert upstream.requests == PARALLEL and not future.done()
+                lock.release_exclusive()
+                assert future.result(timeout=5) == {'entries': []}
+                assert upstream.requests == PARALLEL + 1
+        finally:
+            stop_proxy(proxy, thread)
@@ -0,0 +1,83 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import time
+
+import pytest
+
+from resources.lib.avstream import AvStream, AvStreamRegistry
+from resources.lib.streaminginfo import StreamingInfo
+
+pytestmark = pytest.mark.standin
+
+
+class TokenSession:
+    """
+    Stand-in for LoginSession, records the deleted tokens
+    """
+    def __init__(self):
+        self.deleted = []
+
+    def delete_token(self, streamingId):
+        self.deleted.append(streamingId)
+
+    def update_token(self, streamingToken):
+        return streamingToken + '-refreshed'
+
+
+def define(session, token):
+    info = StreamingInfo({'deviceRegistrationRequired': False, 'drmContentId': token})
+    info.token = token
+    return AvStream(session, info)
+
+
+class TestStreamRegistry:
+    def test_find_by_id_and_latest_token(self):
+        session = TokenSession()
+        registry = AvStreamRegistry()
+        stream = define(session, 'token-1')
+        registry.add_stream(stream)
+        assert registry.find_stream('token-1') is stream
+        # pylint: disable=protected-access
+        stream._AvStream__update_token()
+        assert stream.latestToken == 'token-1-refreshed'
+        assert registry.find_stream('token-1-refreshed') is stream
+        assert registry.find_stream('token-1') is stream  # the id remains valid
+        registry.stop_stream(stream)
+        assert registry.find_stream('token-1') is None
+        assert registry.find_stream('token-1-refreshed') is None
+        assert session.deleted == ['token-1-refreshed']
+
+    def test_reap_idle_streams(self):
+        session = TokenSession()
+        registry = AvStreamRegistry(idleTimeout=0.05)
+        defined = define(session, 'defined')
+        playing = define(session, 'playing')
+        stopped = define(session, 'stopped')
+        for stream in (defined, playing, stopped):
+            registry.add_stream(stream)
+        playing.state = AvStream.AVStreamStatus.PLAYING
+        stopped.stop(timeronly=True)
+        assert registry.statistics() == {'active': 1, 'defined': 1, 'stopped': 1, 'reaped': 0, 'tokens': 3}
+        time.sleep(0.1)
+        assert registry.reap() == 0  # less than REAP_INTERVAL after the last reap
+        assert registry.reap(force=True) == 2
+        assert [stream.id for stream in registry] == ['playing']
+        assert session.deleted == ['defined']  # the token of a stream which was never started is deleted
+        assert registry.statistics() == {'active': 1, 'defined': 0, 'stopped': 0, 'reaped': 2, 'tokens': 1}
+
+    def test_lookup(self):
+        session = TokenSession()
+        registry = AvStreamRegistry()
+        streams = [define(session, 'token-{0}'.format(i)) for i in range(1000)]
+        for stream in streams:
+            registry.add_stream(stream)
+
+        start = time.perf_counter()
+        for stream in streams:
+            assert next(s for s in streams if s.id == stream.id) is stream
+        scanTime = time.perf_counter() - start
+        start = time.perf_counter()
+        for stream in streams:
+            assert registry.find_stream(stream.id) is stream
+        registryTime = time.perf_counter() - start
+        print('\n1000 lookups in 1000 streams: scan {0:.2f}ms registry {1:.2f}ms'.format(scanTime * 1000,
+                                                                                      registryTime * 1000))
@@ -0,0 +1,250 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import datetime
+import json
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+from resources.lib import jsonstream, rpcframing
+from resources.lib.channel import Channel
+from resources.lib.channelguide import ChannelGuide
+from resources.lib.globals import G
+from resources.lib.listitemhelper import ListitemHelper
+from resources.lib.utils import ProxyHelper, WebException
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon, start_proxy, stop_proxy
+from tests_pytest.test_filememo import channel_info
+from tests_pytest.test_unixrpc import start_rpc_server, stop_rpc_server
+
+pytestmark = pytest.mark.standin
+
+CHANNELS = 200
+EVENTS = 30
+CHUNK = 64 * 1024
+CHUNK_LATENCY = 0.005
+START = '20240101060000'
+
+
+def epg_document(channels=CHANNELS):
+    return json.dumps({'entries': [
+        {'channelId': 'NL_{0:06d}_019{0}'.format(i),
+         'events': [{'id': 'crid:~~2F~~2Fepg.example.com~~2F{0}-{1}'.format(i, e),
+                     'title': 'Programma {0} – aflevering {1}'.format(i, e),
+                     'startTime': 1704088800 + e * 720, 'endTime': 1704088800 + (e + 1) * 720,
+                     'mergedId': 'merged-{0}-{1}'.format(i, e), 'minimumAge': 0, 'isPlaceHolder': False,
+                     'hasReplayTV': True, 'hasStartOver': True, 'hasReplayTVOTT': True}
+                    for e in range(EVENTS)]} for i in range(channels)]}).encode('utf-8')
+
+
+def chunked(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+def epg_route(document, truncate=False):
+    def route(handler):
+        content = memoryview(document)[:len(document) // 2 if truncate else len(document)]
+
+        def slowly():
+            for i in range(0, len(content), CHUNK):
+                time.sleep(CHUNK_LATENCY)  # the host sends the document while it is generated
+                yield content[i:i + CHUNK]
+
+        handler.send_chunked(slowly(), contentType='application/json')
+    return route
+
+
+def start_epg(monkeypatch, upstream):
+    monkeypatch.setattr(G, 'EVENTS_URL', upstream.url + '/epg/')
+    addon = proxy_addon()
+    proxy, thread = start_proxy(addon, None)
+    return addon, proxy, thread
+
+
+def measure(call):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = call()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, elapsed, peak
+
+
+class TestJsonStream:
+    @pytest.mark.parametrize('size', [1, 7, 1000, 10 ** 6])
+    def test_iter_array(self, size):
+        document = epg_document(20)
+        assert list(jsonstream.iter_array(chunked(document, size), 'entries')) == json.loads(document)['entries']
+
+    def test_values(self):
+        document = b'{"count": 3, "entries" : [ 12, -1.5e3 ,"a]b", [1, {"entries": []}], null, true ]}'
+        assert list(jsonstream.iter_array(chunked(document, 1), 'entries')) == [12, -1500.0, 'a]b',
+                                                                              [1, {'entries': []}], None, True]
+        assert not list(jsonstream.iter_array([b'{"entries": []}'], 'entries'))
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            list(jsonstream.iter_array([b'{"items": [1, 2]}'], 'entries'))
+        with pytest.raises(ValueError):
+            list(jsonstream.iter_array(chunked(epg_document(5)[:-20], 100), 'entries'))
+
+
+class TestFrameStream:
+    def test_iter_frames(self):
+        values = [{'channelId': str(i), 'events': list(range(i))} for i in range(100)]
+        body = b''.join(rpcframing.encode_frame(value, compress=True, threshold=100) for value in values)
+        body += rpcframing.encode_end_frame()
+        for size in (1, 13, len(body)):
+            assert list(rpcframing.iter_frames(chunked(body, size))) == values
+
+    def test_errors(self):
+        body = rpcframing.encode_frame('first') + rpcframing.encode_error_frame(404, b'gone')
+        received = []
+        with pytest.raises(rpcframing.StreamError) as exc:
+            for value in rpcframing.iter_frames([body + rpcframing.encode_end_frame()]):
+                received.append(value)
+        assert received == ['first'] and exc.value.status == 404 and exc.value.content == b'gone'
+        with pytest.raises(rpcframing.FrameError):
+            list(rpcframing.iter_frames([rpcframing.encode_frame('no end')]))
+
+
+class TestStreamRpc:
+    def test_stream_events(self, monkeypatch, tmp_path):
+        document = epg_document()
+        with StandInServer(epg_route(document)) as upstream:
+            addon, proxy, thread = start_epg(monkeypatch, upstream)
+            server, serverThread = start_rpc_server(proxy, str(tmp_path / 'rpc.sock'))
+            try:
+                self.stream_events(ProxyHelper(addon), server, json.loads(document)['entries'])
+            finally:
+                stop_rpc_server(server, serverThread)
+                stop_proxy(proxy, thread)
+
+    @staticmethod
+    def stream_events(helper, server, expected):
+        _, full, fullPeak = measure(lambda: helper.dynamic_call(LoginSession.get_events, startTime=START))
+
+        def first_entry():
+            stream = helper.dynamic_stream(LoginSession.stream_events, startTime=START)
+            entry = next(stream)
+            stream.close()
+            return entry
+
+        first, firstTime, _ = measure(first_entry)
+        assert first == expected[0]
+
+        def count():
+            return sum(1 for _ in helper.dynamic_stream(LoginSession.stream_events, startTime=START))
+
+        assert measure(count)[0] == CHANNELS
+        _, streamed, streamedPeak = measure(count)
+        print('\nEPG of {0} channels: full call {1:.0f}ms, peak {2} KiB; stream first entry {3:.0f}ms, '
+              'all {4:.0f}ms, peak {5} KiB'.format(CHANNELS, full * 1000, fullPeak // 1024, firstTime * 1000,
+                                                  streamed * 1000, streamedPeak // 1024))
+        # The host needs at least CHUNK_LATENCY per chunk for the whole document, the first entry is in the first
+        assert firstTime < len(epg_document()) // CHUNK * CHUNK_LATENCY
+        assert streamedPeak < fullPeak / 4
+
+        # Over the unix socket the connection is reused, callers of dynamic_call receive a list
+        helper.socketPath = server.server_address
+        assert list(helper.dynamic_stream(LoginSession.stream_events, startTime=START)) == expected
+        assert list(helper.dynamic_stream(LoginSession.stream_events, startTime=START)) == expected
+        assert server.statistics()['connections'] == 1
+        assert helper.dynamic_call(LoginSession.stream_events, startTime=START) == expected
+
+    def test_failures(self, monkeypatch):
+        with StandInServer(epg_route(epg_document(), truncate=True)) as upstream:
+            addon, proxy, thread = start_epg(monkeypatch, upstream)
+            helper = ProxyHelper(addon)
+            try:
+                received = []
+                with pytest.raises(WebException) as exc:
+                    for entry in helper.dynamic_stream(LoginSession.stream_events, startTime=START):
+                        received.append(entry)
+                assert exc.value.status == 500
+                assert 0 < len(received) < CHANNELS
+
+                upstream.route = lambda handler: handler.send_body(b'{"error": "unknown"}', 404, 'application/json')
+                with pytest.raises(WebException) as exc:
+                    next(helper.dynamic_stream(LoginSession.stream_events, startTime=START))
+                assert exc.value.status == 404
+                assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            finally:
+                stop_proxy(proxy, thread)
+
+    def test_session_lock(self, monkeypatch):
+        with StandInServer(epg_route(epg_document())) as upstream:
+            monkeypatch.setattr(G, 'EVENTS_URL', upstream.url + '/epg/')
+            session = LoginSession(proxy_addon())
+            entries = session.stream_events(startTime=START)
+            assert next(entries)['channelId'] == 'NL_000000_0190'
+            # The lock is not held while the caller has a value: a session call (e.g. a login) runs in between
+            session.sessionLock.acquire_exclusive()
+            # and the next value waits until the session call is done
+            received = threading.Event()
+            thread = threading.Thread(target=lambda: next(entries) and received.set())
+            thread.start()
+            assert not received.wait(0.2)
+            session.sessionLock.release_exclusive()
+            assert received.wait(5)
+            thread.join()
+            assert len(list(entries)) == CHANNELS - 2
+
+            # The lock is released when the iterator is closed before the end
+            entries = session.stream_events(startTime=START)
+            next(entries)
+            entries.close()
+            session.sessionLock.acquire_exclusive()
+            session.sessionLock.release_exclusive()
+
+    def test_channel_guide(self, monkeypatch):
+        with StandInServer(epg_route(epg_document())) as upstream:
+            addon, proxy, thread = start_epg(monkeypatch, upstream)
+            try:
+                channels = [Channel(info) for info in channel_info(CHANNELS)]
+                guide = ChannelGuide(addon, channels)
+                guide.load_stored_events()
+                startDate = datetime.datetime(2024, 1, 1, 6, tzinfo=datetime.timezone.utc)
+                _, _, storedPeak = measure(lambda: guide.obtain_events_in_window(startDate, startDate))
+                events = guide.get_events(channels[3].id)
+                assert events.head is not None and events.head.data.title == 'Programma 3 – aflevering 0'
+                assert len(guide.eventsJson['segments'][0]['events']['entries']) == CHANNELS
+
+                # Without epg.json only the events of the channels are kept, not the received entries
+                channels = [Channel(info) for info in channel_info(CHANNELS)]
+                guide = ChannelGuide(addon, channels)
+                _, _, peak = measure(lambda: guide.obtain_events_in_window(startDate, startDate))
+                assert guide.get_events(channels[3].id).head.data.title == 'Programma 3 – aflevering 0'
+                assert guide.eventsJson == {}
+                print('\nChannel guide of {0} channels: peak {1} KiB, {2} KiB when stored'.format(
+                    CHANNELS, peak // 1024, storedPeak // 1024))
+                assert peak < storedPeak
+            finally:
+                stop_proxy(proxy, thread)
+
+    def test_refresh_epg(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)  # the customer information is read from the (empty) profile folder
+        with open(G.CUSTOMER_INFO, 'w', encoding='utf-8') as file:
+            json.dump({'profiles': [{'profileId': 'profile'}]}, file)
+        with StandInServer(epg_route(epg_document())) as upstream:
+            addon, proxy, thread = start_epg(monkeypatch, upstream)
+            try:
+                helper = ListitemHelper(addon)
+                helper.channelList = SimpleNamespace(channels=[Channel(info) for info in channel_info(CHANNELS)])
+                # The first poll reports everything, the second the EPG the service obtained for the first
+                helper.refreshepg()
+                helper.refreshepg()
+                requests = upstream.requests
+                helper.refreshepg()
+                assert upstream.requests == requests
+
+                # Without a change the current window is obtained again after EPG_MAX_AGE
+                monkeypatch.setattr(ListitemHelper, 'EPG_MAX_AGE', 0)
+                time.sleep(0.01)
+                helper.refreshepg()
+                assert upstream.requests == requests + 1
+            finally:
+                stop_proxy(proxy, thread)
@@ -0,0 +1,164 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from resources.lib.avstream import AvStream, AvStreamRegistry
+from resources.lib.globals import G
+from resources.lib.timerwheel import TimerWheel
+from resources.lib.utils import Timer
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon
+from tests_pytest.test_streamregistry import define
+
+pytestmark = pytest.mark.standin
+
+STREAMS = 100
+
+
+class RefreshSession:
+    """
+    Stand-in for LoginSession, records the time of every token refresh
+    """
+    def __init__(self):
+        self.refreshed = []
+        self.lock = threading.Lock()
+
+    def update_token(self, streamingToken):
+        with self.lock:
+            self.refreshed.append((streamingToken.split('/')[0], time.monotonic()))
+        return streamingToken.split('/')[0] + '/' + str(len(self.refreshed))
+
+    def delete_token(self, streamingId):
+        pass
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestTimerWheel:
+    def test_schedule_and_cancel(self):
+        wheel = TimerWheel(tick=0.01, slots=16)
+        fired = []
+        wheel.schedule('b', 0.1, lambda: fired.append('b'))
+        wheel.schedule('a', 0.05, lambda: fired.append('a'))
+        wheel.schedule('c', 0.05, lambda: fired.append('c'))
+        wheel.schedule('far', 0.3, lambda: fired.append('far'))  # more than one revolution ahead
+        assert wheel.cancel('c') and not wheel.cancel('c')
+        wheel.schedule('b', 0.2, lambda: fired.append('b2'))  # replaces b
+        assert wait_for(lambda: len(fired) == 3)
+        assert fired == ['a', 'b2', 'far']
+        # No timers left: the thread ends, the next schedule starts it again
+        assert wait_for(lambda: wheel.statistics()['threads'] == 0)
+        wheel.schedule('d', 0, lambda: fired.append('d'))
+        assert wait_for(lambda: fired[-1] == 'd')
+        statistics = wheel.statistics()
+        assert statistics['threadsStarted'] == 2 and statistics['fired'] == 4 and statistics['scheduled'] == 6
+        assert statistics['wakeups'] < 20  # not every tick
+
+    def test_callback_failure_and_close(self):
+        wheel = TimerWheel(tick=0.01)
+        fired = []
+        wheel.schedule('fails', 0, lambda: 1 / 0)
+        wheel.schedule('next', 0.02, lambda: fired.append('next'))
+        assert wait_for(lambda: fired == ['next'])
+        wheel.schedule('never', 10, lambda: fired.append('never'))
+        wheel.close()
+        assert wheel.statistics()['threads'] == 0 and wheel.statistics()['timers'] == 0
+        wheel.schedule('closed', 0, lambda: fired.append('closed'))
+        assert wheel.statistics()['timers'] == 0
+
+
+class TestTokenRefresh:
+    def test_shared_scheduler(self, monkeypatch):
+        monkeypatch.setattr(AvStream, 'REFRESH_INTERVAL', 0.5)
+        session = RefreshSession()
+        registry = AvStreamRegistry(scheduler=TimerWheel(tick=0.01))
+        threadsBefore = threading.active_count()
+        streams = [define(session, 'token-{0}'.format(i)) for i in range(STREAMS)]
+        for stream in streams:
+            registry.add_stream(stream)
+            stream.start()
+        assert threading.active_count() - threadsBefore == 1
+        assert wait_for(lambda: len({token for token, _ in session.refreshed}) == STREAMS)
+        # The refreshes are spread by the jitter, in (interval * (1 - REFRESH_JITTER), interval]
+        times = sorted(refreshTime for _, refreshTime in session.refreshed[:STREAMS])
+        assert times[-1] - times[0] > 0.02
+        assert registry.find_stream(streams[0].latestToken) is streams[0]
+
+        # The interval of the server is used
+        streams[1].streamInfo.refreshInterval = 0.1
+        streams[1].start()
+        for stream in streams[2:]:
+            registry.stop_stream(stream)
+        count = len(session.refreshed)
+        time.sleep(0.45)
+        refreshed = [token for token, _ in session.refreshed[count:]]
+        assert refreshed.count('token-1') >= 2 and refreshed.count('token-0') <= 1
+        assert set(refreshed) <= {'token-0', 'token-1'}
+
+        statistics = registry.scheduler.statistics()
+        for stream in streams[:2]:
+            registry.stop_stream(stream)
+        assert wait_for(lambda: registry.scheduler.statistics()['threads'] == 0)
+        assert threading.active_count() == threadsBefore
+        print('\n{0} streams: 1 refresh thread instead of {0}, {1} wakeups for {2} refreshes'.format(
+            STREAMS, statistics['wakeups'], statistics['fired']))
+
+    def test_timer_wakes_up_on_stop(self):
+        fired = []
+        timer = Timer(60, lambda: fired.append(True))
+        timer.start()
+        start = time.perf_counter()
+        timer.stop()
+        assert time.perf_counter() - start < 0.5 and not fired
+        timer = Timer(0.05, lambda: fired.append(True))
+        timer.start()
+        assert wait_for(lambda: len(fired) >= 2)
+        timer.stop()
+
+
+class Tokens:
+    """
+    Session service of the stand-in server: streaming tokens with a refresh interval, records the tracking ids
+    """
+    def __init__(self):
+        self.trackingIds = []
+
+    def route(self, handler):
+        if handler.path.startswith('/license/token'):
+            self.trackingIds.append(handler.headers['x-tracking-id'])
+            handler.send_body(b'', 200, headers={'x-streaming-token': 'token-2'})
+            return
+        handler.send_body(json.dumps({'deviceRegistrationRequired': False, 'drmContentId': 'drm'}).encode('utf-8'),
+                          contentType='application/json',
+                          headers={'x-streaming-token': 'token-1', 'x-streaming-token-refresh-interval': '240'})
+
+
+class TestStreamingToken:
+    def test_refresh_interval_and_tracking_id(self, monkeypatch, tmp_path):
+        tokens = Tokens()
+        with StandInServer(tokens.route) as server:
+            monkeypatch.setattr(G, 'STREAMING_URL', server.url + '/session/{householdid}')
+            monkeypatch.setattr(G, 'LICENSE_URL', server.url + '/license')
+            monkeypatch.chdir(tmp_path)  # the customer information is read from the (empty) profile folder
+            with open(G.CUSTOMER_INFO, 'w', encoding='utf-8') as file:
+                json.dump({'hashedCustomerId': 'customer'}, file)
+            session = LoginSession(proxy_addon())
+            session.sessionInfo = {'householdId': 'household'}
+            session.activeProfile = {'profileId': 'profile'}
+            streamInfo = session.obtain_tv_streaming_token('NL_000001_019401', 'Orion-DASH')
+            assert streamInfo.token == 'token-1' and streamInfo.refreshInterval == 240
+
+            # The tracking id is read from disk once
+            assert session.update_token('token-1') == 'token-2'
+            os.remove(G.CUSTOMER_INFO)
+            assert session.update_token('token-2') == 'token-2'
+            assert tokens.trackingIds == ['customer', 'customer']
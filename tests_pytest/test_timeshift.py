@@ -0,0 +1,165 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import os
+import time
+import types
+import xml.etree.ElementTree as ET
+from http.client import HTTPConnection
+from urllib.parse import quote
+
+import pytest
+
+from resources.lib import proxyserver
+from resources.lib.avstream import AVStreamType
+from resources.lib.mpd import extend_timelines
+from resources.lib.prefetcher import PrefetchedSegment
+from resources.lib.timeshift import TimeShiftBuffer
+from tests_pytest.standinserver import SEGMENT, StandInServer, fetch_segments, proxy_addon, segment_route, \
+    start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+
+def live_manifest(firstTime, count=3):
+    return '''<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" xmlns:cenc="urn:mpeg:cenc:2013" type="dynamic"
+     timeShiftBufferDepth="PT6S" minimumUpdatePeriod="PT2S">
+  <Period id="1" start="PT0S">
+    <AdaptationSet mimeType="video/mp4">
+      <ContentProtection cenc:default_KID="00000000-0000-0000-0000-000000000000"/>
+      <SegmentTemplate timescale="1000" media="$RepresentationID$-$Time$.m4s" startNumber="{1}">
+        <SegmentTimeline>
+          <S t="{0}" d="2000" r="{2}"/>
+        </SegmentTimeline>
+      </SegmentTemplate>
+      <Representation id="video" bandwidth="5000000"/>
+    </AdaptationSet>
+  </Period>
+</MPD>'''.format(firstTime, firstTime // 2000, count - 1).encode('utf-8')
+
+
+def segment(size, fill=b'x'):
+    return PrefetchedSegment(200, [('Content-Type', 'video/mp4')], fill * size)
+
+
+class TestTimeShiftBuffer:
+    def test_ring_buffer(self, tmp_path):
+        filename = str(tmp_path / 'ring.buf')
+        buffer = TimeShiftBuffer(filename, windowSeconds=60, maxBytes=1000)
+        for i in range(4):
+            buffer.put('/video-{0}.m4s'.format(i), segment(300, bytes([65 + i])))
+        assert buffer.get('/video-0.m4s') is None  # overwritten by segment 3 after the wrap
+        assert buffer.get('/video-1.m4s').body == b'B' * 300
+        assert buffer.get('/video-3.m4s').body == b'D' * 300
+        assert buffer.statistics()['segments'] == 3
+
+        buffer.windowSeconds = 0
+        time.sleep(0.01)
+        buffer.put('/video-4.m4s', segment(100))
+        assert buffer.statistics()['segments'] == 1
+        buffer.close()
+        assert not os.path.exists(filename)
+
+    def test_manifest_rewrite(self, tmp_path):
+        buffer = TimeShiftBuffer(str(tmp_path / 'ring.buf'), windowSeconds=600, maxBytes=10000)
+        assert buffer.update_manifest(live_manifest(0)) == live_manifest(0)
+        for t in (0, 2000, 4000):
+            buffer.put('/live/video-{0}.m4s'.format(t), segment(10))
+        time.sleep(0.01)
+
+        # The CDN window moved 2 segments further, the first 2 segments are served from the buffer
+        rewritten = buffer.update_manifest(live_manifest(4000))
+        root = ET.fromstring(rewritten)
+        template = root.find('.//{*}SegmentTemplate')
+        entries = [(s.get('t'), s.get('d'), s.get('r')) for s in template.findall('.//{*}S')]
+        assert entries == [('0', '2000', None), ('2000', '2000', None), ('4000', '2000', '2')]
+        assert template.get('startNumber') == '2'  # only adjusted for $Number$ templates
+        assert b'xmlns:cenc="urn:mpeg:cenc:2013"' in rewritten
+        assert buffer.get('/live/video-0.m4s').body == b'x' * 10
+        buffer.close()
+
+    def test_manifest_prefixes(self, monkeypatch):
+        def register_namespace(prefix, uri):
+            raise AssertionError('global namespace registered: {0} {1}'.format(prefix, uri))
+
+        monkeypatch.setattr(ET, 'register_namespace', register_namespace)
+        manifest = live_manifest(4000).replace(
+            b'xmlns:cenc="urn:mpeg:cenc:2013"', b'xmlns:ns1="urn:mpeg:cenc:2013" xmlns:dolby="urn:dolby"').replace(
+            b'cenc:default_KID', b'ns1:default_KID').replace(
+            b'<Representation id="video"', b'<Representation xml:lang="nl" dolby:level="3" id="video"')
+        rewritten = extend_timelines(manifest, {('$RepresentationID$-$Time$.m4s', 'video'): {2000: 2000}}, 600)
+        assert b'xmlns:ns1="urn:mpeg:cenc:2013"' in rewritten
+        assert b'xmlns="urn:mpeg:dash:schema:mpd:2011"' in rewritten and b'xmlns:dolby="urn:dolby"' in rewritten
+        assert b'<ns1:' not in rewritten and b'ns1:default_KID=' in rewritten
+        assert b'xml:lang="nl"' in rewritten and b'dolby:level="3"' in rewritten
+        root = ET.fromstring(rewritten)
+        assert root.tag == '{urn:mpeg:dash:schema:mpd:2011}MPD' and root.get('timeShiftBufferDepth') == 'PT600S'
+        assert [s.get('t') for s in root.iter('{urn:mpeg:dash:schema:mpd:2011}S')] == ['2000', '4000']
+        assert root.find('.//{*}ContentProtection').get('{urn:mpeg:cenc:2013}default_KID') is not None
+
+
+def live_proxy(addon, origin):
+    addon.setSettingNumber('prefetch-segments', 0)
+    addon.setSettingNumber('timeshift-window', 5)
+    addon.setSettingNumber('timeshift-size', 4)
+    proxy, thread = start_proxy(addon, origin.url)
+    proxy.profileDir = ''
+    proxy.streamsession.find_stream('benchtoken').streamType = AVStreamType.CHANNEL
+    manifest = types.SimpleNamespace(status_code=200, content=live_manifest(0), headers={},
+                                     url=origin.url + '/live/bench/manifest.mpd')
+    proxy.session.get_manifest = lambda url: manifest
+    return proxy, thread
+
+
+def request_manifest(addon):
+    connection = HTTPConnection(addon.getSetting('proxy-ip'), addon.getSettingInt('proxy-port'), timeout=5)
+    path = '/manifest?path={0}&hostname={1}'.format(quote('/live/bench/manifest.mpd'), 'live.example.com')
+    connection.request('GET', path, headers={'x-streaming-token': 'benchtoken'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+
+class TestTimeShiftViaProxy:
+    def test_stored_while_relayed(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)  # the buffer is created in the (empty) profile folder
+        addon = proxy_addon()
+        with StandInServer(segment_route) as origin:
+            proxy, thread = live_proxy(addon, origin)
+            try:
+                assert request_manifest(addon) == 200
+                timeshift = proxy.streamsession.find_stream('benchtoken').timeshift
+                fetch_segments(addon, 3, '/live/bench/video-{0}.m4s')
+                fetch_segments(addon, 3, '/live/bench/chunked-{0}.m4s')
+                assert origin.requests == 6
+                # The segment is stored after the last byte was relayed to the player
+                deadline = time.monotonic() + 5
+                while timeshift.statistics()['segments'] < 6 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert timeshift.statistics()['segments'] == 6
+                assert timeshift.statistics()['bytes'] == 6 * len(SEGMENT)
+                fetch_segments(addon, 3, '/live/bench/video-{0}.m4s')
+                assert origin.requests == 6
+                assert timeshift.statistics()['hits'] == 3
+            finally:
+                stop_proxy(proxy, thread)
+
+    def test_buffer_not_created(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+
+        def no_space(*_args, **_kwargs):
+            raise OSError(28, 'No space left on device')
+
+        monkeypatch.setattr(proxyserver, 'TimeShiftBuffer', no_space)
+        addon = proxy_addon()
+        with StandInServer(segment_route) as origin:
+            proxy, thread = live_proxy(addon, origin)
+            try:
+                # Live TV continues without time-shift, it is not tried again for every manifest
+                assert request_manifest(addon) == 200
+                assert proxy.streamsession.find_stream('benchtoken').timeshift is None
+                assert proxy.timeshiftWindow == 0
+                assert request_manifest(addon) == 200
+                fetch_segments(addon, 2, '/live/bench/video-{0}.m4s')
+            finally:
+                stop_proxy(proxy, thread)
@@ -0,0 +1,118 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name, too-few-public-methods
+import json
+import threading
+import time
+
+import requests
+
+import pytest
+
+from resources.lib.globals import G
+from resources.lib.tracing import TRACER, Tracer
+from resources.lib.utils import ProxyHelper
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import StandInServer, proxy_addon, start_proxy, stop_proxy
+
+pytestmark = pytest.mark.standin
+
+SPANS = 100000
+
+
+def events_route(handler):
+    time.sleep(0.02)
+    handler.send_body(b'{"entries": []}', contentType='application/json')
+
+
+def span_cost(tracer):
+    start = time.perf_counter()
+    for _ in range(SPANS):
+        with tracer.span('upstream GET', 'https://example.com/'):
+            pass
+    return (time.perf_counter() - start) / SPANS
+
+
+class TestTracer:
+    def test_spans(self):
+        tracer = Tracer(maxTraces=2)
+        assert tracer.begin('disabled') is None
+        tracer.configure(True)
+        trace = tracer.begin('LoginSession.get_events', 'abc')
+        with tracer.span('upstream GET', 'https://example.com/epg/20240101?lang=nl'):
+            time.sleep(0.01)
+
+        def batch():
+            with tracer.attach(trace), tracer.span('LoginSession.get_channels'):
+                pass
+
+        thread = threading.Thread(target=batch)
+        thread.start()
+        thread.join()
+        with tracer.span('encode'):
+            pass
+        tracer.finish(trace)
+        with tracer.span('after the trace'):
+            pass
+
+        recent = tracer.recent()
+        assert [t['id'] for t in recent] == ['abc']
+        spans = recent[0]['spans']
+        assert [span['name'] for span in spans] == ['upstream GET', 'LoginSession.get_channels', 'encode']
+        assert spans[0]['path'] == '/epg/20240101' and spans[0]['duration'] >= 10
+        assert spans[1]['thread'] != spans[0]['thread']
+        for name in ('second', 'third'):
+            tracer.finish(tracer.begin(name))
+        assert [t['name'] for t in tracer.recent()] == ['third', 'second']
+
+        events = tracer.chrome_trace()['traceEvents']
+        assert {event['ph'] for event in events} == {'X'}
+        assert [event['name'] for event in events] == ['second', 'third']
+
+    def test_overhead(self):
+        tracer = Tracer()
+        disabled = span_cost(tracer)
+        tracer.configure(True)
+        untraced = span_cost(tracer)
+        tracer.finish(tracer.begin('bench'))
+        print('\nspan disabled {0:.0f}ns, enabled without trace {1:.0f}ns'.format(disabled * 1e9, untraced * 1e9))
+        assert disabled < 1e-4  # a clear bound: a tenth of a dynamic_call, which takes about 1ms
+
+
+class TestTracesViaProxy:
+    def test_debug_traces(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)  # the traces are written to the (empty) profile folder at stop
+        with StandInServer(events_route) as upstream:
+            monkeypatch.setattr(G, 'EVENTS_URL', upstream.url + '/epg/')
+            addon = proxy_addon()
+            addon.setSettingBool('rpc-tracing', True)
+            proxy, thread = start_proxy(addon, None)
+            try:
+                helper = ProxyHelper(addon)
+                assert helper.dynamic_call(LoginSession.get_events, startTime='20240101060000') == {'entries': []}
+                helper.dynamic_batch([(LoginSession.get_extra_headers, {}), (LoginSession.get_channels, {})])
+                url = 'http://127.0.0.1:{0}/debug/traces'.format(addon.getSetting('proxy-port'))
+                traces = requests.get(url, timeout=5).json()
+                assert [trace['name'] for trace in traces] == ['batch', 'LoginSession.get_events']
+                spans = {span['name']: span for span in traces[1]['spans']}
+                assert {'receive', 'decode', 'call', 'session lock wait', 'upstream GET', 'encode',
+                        'send'} <= set(spans)
+                assert spans['upstream GET']['path'] == '/epg/20240101060000'
+                assert spans['upstream GET']['duration'] >= 20
+                assert traces[1]['duration'] >= spans['call']['duration'] >= spans['upstream GET']['duration']
+                assert {'queue', 'LoginSession.get_extra_headers', 'LoginSession.get_channels'} <= {
+                    span['name'] for span in traces[0]['spans']}
+                chrome = requests.get(url, params={'format': 'chrome'}, timeout=5).json()
+                assert len(chrome['traceEvents']) == 2 + len(traces[0]['spans']) + len(traces[1]['spans'])
+            finally:
+                stop_proxy(proxy, thread)
+                TRACER.configure(False)
+        with open(tmp_path / G.TRACE_FILE, encoding='utf-8') as file:
+            assert len(json.load(file)['traceEvents']) == len(chrome['traceEvents'])
+
+        # Not available when tracing is disabled
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        try:
+            url = 'http://127.0.0.1:{0}/debug/traces'.format(addon.getSetting('proxy-port'))
+            assert requests.get(url, timeout=5).status_code == 404
+        finally:
+            stop_proxy(proxy, thread)
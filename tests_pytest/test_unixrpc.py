@@ -0,0 +1,142 @@
+# pylint: disable=missing-module-docstring, missing-class-docstring, missing-function-docstring, invalid-name
+import threading
+import time
+from http.client import HTTPConnection
+
+import pytest
+
+from resources.lib import rpcframing
+from resources.lib.proxyserver import RpcServer
+from resources.lib.utils import ProxyHelper, RpcClient, UnixHTTPConnection
+from resources.lib.webcalls import LoginSession
+from tests_pytest.standinserver import SEGMENT, StandInServer, percentile, proxy_addon, segment_route, start_proxy, \
+    stop_proxy
+
+pytestmark = pytest.mark.standin
+
+CALLS = 300
+PLAYERS = 4
+
+
+def segment_load(addon, stop: threading.Event, counter: list):
+    """
+    A player fetching segments through the http-proxy as fast as possible
+    """
+    connection = HTTPConnection(addon.getSetting('proxy-ip'), addon.getSettingInt('proxy-port'), timeout=5)
+    i = 0
+    while not stop.is_set():
+        connection.request('GET', '/live/bench/video-{0}.m4s'.format(i), headers={'x-streaming-token': 'benchtoken'})
+        response = connection.getresponse()
+        assert response.read() == SEGMENT
+        counter.append(1)
+        i += 1
+    connection.close()
+
+
+def latencies(helper):
+    result = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+        result.append(time.perf_counter() - start)
+    return result
+
+
+def start_rpc_server(proxy, socketPath):
+    server = RpcServer(socketPath, proxy)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    return server, thread
+
+
+def stop_rpc_server(server, thread):
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+class TestUnixRpc:
+    def test_only_functions(self, tmp_path):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        socketPath = str(tmp_path / 'rpc.sock')
+        server, serverThread = start_rpc_server(proxy, socketPath)
+        helper = ProxyHelper(addon)
+        helper.socketPath = socketPath
+        try:
+            assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            assert helper.dynamic_batch([(LoginSession.get_extra_headers, {})]) == [{}]
+            assert server.statistics() == {'connections': 1, 'requests': 2}
+            assert proxy.statistics()['requests'] == 0
+
+            connection = UnixHTTPConnection(socketPath, timeout=5)
+            for method, path in (('GET', '/manifest?path=/live/manifest.mpd'), ('POST', '/license'),
+                                 ('HEAD', '/function/LoginSession.get_extra_headers')):
+                connection.request(method, path, body=b'challenge' if method == 'POST' else None)
+                response = connection.getresponse()
+                response.read()
+                assert response.status == 404, path
+            connection.close()
+        finally:
+            stop_rpc_server(server, serverThread)
+            stop_proxy(proxy, thread)
+
+    def test_fallback_to_tcp(self, tmp_path):
+        addon = proxy_addon()
+        proxy, thread = start_proxy(addon, None)
+        helper = ProxyHelper(addon)
+        helper.socketPath = str(tmp_path / 'rpc.sock')  # the service does not listen on it
+        server = None
+        try:
+            assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            assert helper.unixFailedAt > 0
+            assert proxy.statistics()['requests'] == 1
+
+            # A restarted service closes the idle connections, the call is sent again on a new connection
+            server, serverThread = start_rpc_server(proxy, helper.socketPath)
+            helper.unixFailedAt = 0.0
+            assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            stop_rpc_server(server, serverThread)
+            server, serverThread = start_rpc_server(proxy, helper.socketPath)
+            assert helper.dynamic_call(LoginSession.get_extra_headers) == {}
+            assert server.statistics() == {'connections': 1, 'requests': 1}
+            assert proxy.statistics()['requests'] == 1
+        finally:
+            if server is not None:
+                stop_rpc_server(server, serverThread)
+            RpcClient.instance().close()
+            stop_proxy(proxy, thread)
+
+    def test_latency_under_segment_load(self, tmp_path):
+        # pylint: disable=too-many-locals
+        addon = proxy_addon()
+        addon.setSettingNumber('prefetch-segments', 0)
+        with StandInServer(segment_route) as origin:
+            proxy, thread = start_proxy(addon, origin.url)
+            socketPath = str(tmp_path / 'rpc.sock')
+            server, serverThread = start_rpc_server(proxy, socketPath)
+            tcpHelper = ProxyHelper(addon)
+            unixHelper = ProxyHelper(addon)
+            unixHelper.socketPath = socketPath
+            stop = threading.Event()
+            segments = []
+            players = [threading.Thread(target=segment_load, args=(addon, stop, segments)) for _ in range(PLAYERS)]
+            try:
+                for player in players:
+                    player.start()
+                time.sleep(0.2)
+                print('\n{0} players fetching segments, {1} calls of {2} bytes'.format(
+                    PLAYERS, CALLS, len(rpcframing.encode_frame({}))))
+                for name, helper in (('tcp', tcpHelper), ('unix', unixHelper)):
+                    start = len(segments)
+                    values = latencies(helper)
+                    print('{0:<5} p50={1:.3f}ms p99={2:.3f}ms segments={3}'.format(
+                        name, percentile(values, 50) * 1000, percentile(values, 99) * 1000, len(segments) - start))
+                assert server.statistics()['requests'] == CALLS
+                assert len(segments) > 0
+            finally:
+                stop.set()
+                for player in players:
+                    player.join()
+                stop_rpc_server(server, serverThread)
+                stop_proxy(proxy, thread)